@@ -0,0 +1,182 @@
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+from collections import OrderedDict
+from contextlib import contextmanager
+from .models import SalesDataset
+import threading
+import hashlib
+import json
+import time
+import uuid
+import os
+
+ANALYSIS_CACHE_ALIAS = os.getenv("ANALYSIS_CACHE_ALIAS", "shared")
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+# A computation holding the lock longer than this is presumed dead
+ANALYSIS_LOCK_TTL = 120
+ANALYSIS_WAIT_SECONDS = 60
+ANALYSIS_POLL_SECONDS = 0.05
+# Decoded results kept in-process so hot keys skip unpickling
+LOCAL_ENTRIES = 16
+# Part of every key: bump when the layout of cached results changes (they
+# hold pickled models), so old entries are never read back
+ANALYSIS_FORMAT = 3
+# Returned by AnalysisCache._shared when the shared cache raised
+CACHE_ERROR = object()
+
+
+# === 1. Content keys ===
+def file_fingerprint(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def series_version(series):
+    row = SalesDataset.objects.filter(series=series).values("version").first()
+    return row["version"] if row else 0
+
+
+def all_series_version():
+    agg = SalesDataset.objects.aggregate(n=Count("id"), versions=Sum("version"), updated=Max("updated_at"))
+    return [agg["n"], agg["versions"], str(agg["updated"])]
+
+
+def analysis_key(kind, descriptor):
+    # Same input data (and parameters) -> same key, in every worker process
+    raw = json.dumps([ANALYSIS_FORMAT, kind, descriptor], sort_keys=True, default=str)
+    return f"analysis:{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+# === 2. Single-flight cache ===
+class AnalysisCache:
+    def __init__(self, alias=ANALYSIS_CACHE_ALIAS, ttl=ANALYSIS_CACHE_TTL):
+        self.alias = alias
+        self.ttl = ttl
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+        # key -> [lock, threads holding or waiting on it]
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.computations = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _get_local(self, key):
+        with self._local_lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                return self._local[key]
+        return None
+
+    def _put_local(self, key, value):
+        with self._local_lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > LOCAL_ENTRIES:
+                self._local.popitem(last=False)
+
+    @contextmanager
+    def _key_lock(self, key):
+        # Refcounted, so it is dropped only when the last holder or waiter
+        # leaves: popping it earlier would let a newcomer lock a fresh one
+        with self._local_lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._local_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _count(self, name):
+        with self._local_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _shared(self, method, *args, default=None):
+        # The shared cache only saves work: when it errors (a locked table, a
+        # dropped connection) the request carries on as on a miss instead of failing
+        try:
+            return getattr(self.cache, method)(*args)
+        except Exception as e:
+            print(f"⚠️ Analysis cache {method} failed: {e!r}")
+            return default
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is None:
+            value = self._shared("get", key)
+            if value is not None:
+                self._put_local(key, value)
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        # Threads of this process queue on a local lock; processes coordinate
+        # through an atomic cache.add() on a lock key.
+        with self._key_lock(key):
+            value = self.get(key)
+            if value is not None:
+                self._count("hits")
+                return value
+
+            self._count("misses")
+            lock_key = f"{key}:lock"
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + ANALYSIS_WAIT_SECONDS
+            while True:
+                won = self._shared("add", lock_key, token, ANALYSIS_LOCK_TTL, default=CACHE_ERROR)
+                if won is CACHE_ERROR:
+                    # No shared cache to coordinate through (table missing, database
+                    # down): compute here, still once per process thanks to the key lock
+                    value = compute()
+                    self._count("computations")
+                    self._put_local(key, value)
+                    return value
+                if won:
+                    try:
+                        value = self._shared("get", key)  # finished while we raced for the lock
+                        if value is None:
+                            value = compute()
+                            self._count("computations")
+                            self._shared("set", key, value, self.ttl)
+                        # Before the lock goes: this process's next thread reads it here
+                        self._put_local(key, value)
+                    finally:
+                        if self._shared("get", lock_key) == token:
+                            self._shared("delete", lock_key)
+                    return value
+
+                # Someone else is computing it: wait for their result
+                value = self._shared("get", key)
+                if value is not None:
+                    self._put_local(key, value)
+                    return value
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for another worker's analysis")
+                time.sleep(ANALYSIS_POLL_SECONDS)
+
+    def stats(self):
+        with self._local_lock:
+            return {
+                "alias": self.alias,
+                "hits": self.hits,
+                "misses": self.misses,
+                "computations": self.computations,
+                "local_entries": len(self._local),
+                "key_locks": len(self._key_locks),
+            }
+
+
+analysis_cache = AnalysisCache()
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+import os
+
+
+def should_start_render_pool():
+    from chatapp.apps import is_serving
+    return os.getenv("RENDER_PRELOAD", "1") == "1" and is_serving()
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        if should_start_render_pool():
+            # Warm the plot workers in the background so startup is not delayed
+            from .render_pool import render_pool
+            import threading
+            threading.Thread(target=render_pool.start, name="render-pool-start", daemon=True).start()
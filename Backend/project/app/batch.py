@@ -0,0 +1,181 @@
+import numpy as np
+from .trend import rounded_list
+
+# Same thresholds / multipliers as utils.suggest_price
+SLOPE_UP = 0.1
+SLOPE_DOWN = -0.1
+FORECAST_DAYS = 7
+
+
+def group_codes(skus):
+    # SKU labels -> (sorted unique labels, int code per row)
+    import pandas as pd
+
+    codes, labels = pd.factorize(np.asarray(skus), sort=True)
+    return labels, codes
+
+
+# === 1. Closed-form regressions for every SKU at once ===
+def batch_trends(skus, days, units, forecast_days=FORECAST_DAYS, confidence=None):
+    # Long-format input: one row per (sku, day). Every per-SKU sum is a
+    # bincount over the group codes, so there is no Python loop per SKU.
+    labels, codes = group_codes(skus)
+    x = np.asarray(days, dtype=np.float64)
+    y = np.asarray(units, dtype=np.float64)
+    k = len(labels)
+
+    n = np.bincount(codes, minlength=k).astype(np.float64)
+    sx = np.bincount(codes, weights=x, minlength=k)
+    sy = np.bincount(codes, weights=y, minlength=k)
+    mean_x = sx / n
+    mean_y = sy / n
+
+    # Centre per group before multiplying to keep the sums well conditioned
+    dx = x - mean_x[codes]
+    dy = y - mean_y[codes]
+    ssx = np.bincount(codes, weights=dx * dx, minlength=k)
+    ssy = np.bincount(codes, weights=dy * dy, minlength=k)
+    spxy = np.bincount(codes, weights=dx * dy, minlength=k)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(ssx > 0, spxy / ssx, 0.0)
+        sse = np.maximum(ssy - slope * spxy, 0.0)
+        r2 = np.where(ssy > 0, 1.0 - sse / ssy, 1.0)
+    intercept = mean_y - slope * mean_x
+
+    # Forecast the days following each SKU's own last observation
+    last_day = np.full(k, -np.inf)
+    np.maximum.at(last_day, codes, x)
+    ahead = last_day[:, None] + np.arange(1, forecast_days + 1)[None, :]
+    forecast = intercept[:, None] + slope[:, None] * ahead
+
+    result = {
+        "skus": labels,
+        "n": n.astype(np.int64),
+        "slope": slope,
+        "intercept": intercept,
+        "r2": r2,
+        "last_day": last_day,
+        "forecast": forecast,
+    }
+    if confidence is not None:
+        result["lower"], result["upper"] = batch_intervals(forecast, ahead, n, mean_x, ssx, sse, confidence)
+    return result
+
+
+def batch_intervals(forecast, ahead, n, mean_x, ssx, sse, confidence):
+    # Same closed form as RunningRegression.prediction_interval, per SKU.
+    # The (skus, horizon) work is done in place on one buffer.
+    from scipy.stats import t
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dof = n - 2
+        valid = (dof > 0) & (ssx > 0)
+        scale = np.where(valid, t.ppf(0.5 + confidence / 2, np.maximum(dof, 1)) * np.sqrt(sse / dof), np.nan)
+
+        half = ahead - mean_x[:, None]
+        half *= half
+        half /= ssx[:, None]
+        half += (1.0 + 1.0 / n)[:, None]
+        np.sqrt(half, out=half)
+        half *= scale[:, None]
+    return forecast - half, forecast + half
+
+
+# === 2. Vectorized suggest_price ===
+def batch_suggest_price(base_price, slope):
+    base_price = np.broadcast_to(np.asarray(base_price, dtype=np.float64), np.shape(slope))
+    factor = np.where(slope > SLOPE_UP, 1.05, np.where(slope < SLOPE_DOWN, 0.95, 1.0))
+    return np.round(base_price * factor, 2)
+
+
+def frame_to_arrays(df, origin=None):
+    # DataFrame(sku|series, date, units_sold) -> (skus, day offsets, units, origin date)
+    import pandas as pd
+
+    sku_col = "sku" if "sku" in df.columns else "series"
+    dates = pd.to_datetime(df["date"])
+    origin = pd.Timestamp(origin) if origin is not None else dates.min()
+    days = (dates - origin).dt.days.to_numpy()
+    return df[sku_col].to_numpy(), days, df["units_sold"].to_numpy(dtype=np.float64), origin
+
+
+def analyze_batch(df, base_price=100.0, forecast_days=FORECAST_DAYS, confidence=None):
+    skus, days, units, origin = frame_to_arrays(df)
+    result = batch_trends(skus, days, units, forecast_days, confidence)
+    result["suggested_price"] = batch_suggest_price(base_price, result["slope"])
+    result["origin"] = origin
+    return result
+
+
+def batch_to_columns(result):
+    # Columnar JSON: one list per field instead of one dict per SKU
+    origin = np.datetime64(result["origin"].date(), "D")
+    forecast_start = origin + (result["last_day"].astype(np.int64) + 1)
+    columns = {
+        "sku": [str(sku) for sku in result["skus"]],
+        "n": result["n"].tolist(),
+        "slope": result["slope"].tolist(),
+        "intercept": result["intercept"].tolist(),
+        "r2": result["r2"].tolist(),
+        "suggested_price": result["suggested_price"].tolist(),
+        "forecast_start": np.datetime_as_string(forecast_start).tolist(),
+        "forecast": np.round(result["forecast"], 2).tolist(),
+    }
+    if "lower" in result:
+        columns["forecast_lower"] = [rounded_list(row) for row in result["lower"]]
+        columns["forecast_upper"] = [rounded_list(row) for row in result["upper"]]
+    return columns
+
+
+# === 3. Benchmark against the per-series sklearn path ===
+def synthetic_sales(n_skus, days_per_sku, seed=0):
+    rng = np.random.default_rng(seed)
+    skus = np.repeat(np.array([f"SKU{i:05d}" for i in range(n_skus)]), days_per_sku)
+    days = np.tile(np.arange(days_per_sku), n_skus)
+    trend = rng.normal(0, 0.3, size=n_skus)
+    base = rng.uniform(20, 200, size=n_skus)
+    units = np.repeat(base, days_per_sku) + np.repeat(trend, days_per_sku) * days + rng.normal(0, 5, size=len(days))
+    return skus, days, units
+
+
+def per_series_sklearn(skus, days, units):
+    from sklearn.linear_model import LinearRegression
+    import pandas as pd
+
+    df = pd.DataFrame({"sku": skus, "days": days, "units": units})
+    out = {}
+    for sku, group in df.groupby("sku", sort=True):
+        X = group["days"].values.reshape(-1, 1)
+        model = LinearRegression().fit(X, group["units"].values)
+        out[sku] = (model.coef_[0], model.intercept_, model.score(X, group["units"].values))
+    return out
+
+
+def benchmark(n_skus=1000, days_per_sku=365, repeat=3):
+    import time
+
+    skus, days, units = synthetic_sales(n_skus, days_per_sku)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = batch_trends(skus, days, units)
+        timings.append(time.perf_counter() - started)
+    batch_seconds = min(timings)
+
+    started = time.perf_counter()
+    reference = per_series_sklearn(skus, days, units)
+    sklearn_seconds = time.perf_counter() - started
+
+    ref_slope = np.array([reference[sku][0] for sku in result["skus"]])
+    ref_r2 = np.array([reference[sku][2] for sku in result["skus"]])
+    return {
+        "skus": n_skus,
+        "rows": len(units),
+        "batch_seconds": batch_seconds,
+        "sklearn_seconds": sklearn_seconds,
+        "speedup": sklearn_seconds / batch_seconds if batch_seconds else None,
+        "max_slope_error": float(np.max(np.abs(ref_slope - result["slope"]))),
+        "max_r2_error": float(np.max(np.abs(ref_r2 - result["r2"]))),
+    }
@@ -0,0 +1,139 @@
+import numpy as np
+import base64
+from .trend import rounded_list
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax", "none")
+MAX_POINTS = 5000
+
+
+def bucket_edges(n, n_buckets):
+    # n points (first and last excluded) split into n_buckets near-equal slices
+    return np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+
+
+def padded_buckets(values, edges):
+    # Ragged buckets -> rectangular (n_buckets, width) array so per-bucket
+    # reductions are one call along axis 1. Short rows repeat their first
+    # point, which never changes a min, max or argmax.
+    sizes = np.diff(edges)
+    width = int(sizes.max())
+    offsets = np.arange(width)[None, :]
+    idx = edges[:-1, None] + np.where(offsets < sizes[:, None], offsets, 0)
+    return values[idx], idx
+
+
+def bucket_means(values, edges):
+    return np.add.reduceat(values[:edges[-1]], edges[:-1]) / np.diff(edges)
+
+
+# === 1. Largest-Triangle-Three-Buckets ===
+def lttb(x, y, n_out):
+    # Indices of the n_out points that best keep the visual shape of (x, y).
+    # The chosen point of each bucket depends on the previous bucket's choice,
+    # so buckets are walked in order, but each bucket is scored in one call.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = bucket_edges(n, n_out - 2)
+    bx, idx = padded_buckets(x, edges)
+    by, _ = padded_buckets(y, edges)
+
+    # Average of the following bucket (the last bucket looks at the final point)
+    next_x = np.append(bucket_means(x, edges)[1:], x[-1])
+    next_y = np.append(bucket_means(y, edges)[1:], y[-1])
+
+    # Triangle area against anchor a and next average c is |(a-c) x (p-a)|,
+    # linear in p, so each bucket costs one fused expression and an argmax
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    ax, ay = x[0], y[0]
+    for b in range(n_out - 2):
+        alpha = ax - next_x[b]
+        beta = next_y[b] - ay
+        best = np.abs(alpha * by[b] + beta * bx[b] - (alpha * ay + beta * ax)).argmax()
+        selected[b + 1] = idx[b, best]
+        ax, ay = bx[b, best], by[b, best]
+    return selected
+
+
+# === 2. Min-max ===
+def minmax(x, y, n_out):
+    # Keep the lowest and highest point of every bucket (fully vectorized).
+    # Spikes are never dropped, which LTTB does not guarantee.
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    edges = bucket_edges(n, (n_out - 2) // 2)
+    by, idx = padded_buckets(y, edges)
+    rows = np.arange(len(by))
+    lo = idx[rows, by.argmin(axis=1)]
+    hi = idx[rows, by.argmax(axis=1)]
+    return np.unique(np.concatenate(([0], lo, hi, [n - 1])))
+
+
+def downsample(x, y, n_out, method="lttb"):
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return minmax(x, y, n_out)
+    if method == "none":
+        return np.arange(len(x))
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+# === 3. Columnar payloads ===
+def typed_array(values, dtype):
+    # Base64 of a little-endian typed array, e.g. new Float32Array(buffer) in JS
+    data = np.asarray(values, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()
+    return {"dtype": dtype, "data": base64.b64encode(data).decode("ascii")}
+
+
+def series_columns(analysis, points=1000, method="lttb", encoding="json"):
+    # Actual, fitted and forecast series as parallel columns. Dates are sent as
+    # day offsets from "origin", which is far smaller than ISO strings.
+    df = analysis["df"]
+    origin = df["date"].min()
+    days = df["days"].to_numpy(dtype=np.int64)
+    units = df["units_sold"].to_numpy(dtype=np.float64)
+    fitted = np.asarray(analysis["fitted_line"], dtype=np.float64)
+
+    keep = downsample(days, units, min(int(points), MAX_POINTS), method)
+    model = analysis["model"]
+    forecast_days = days[-1] + np.arange(1, len(analysis["predicted_future"]) + 1)
+
+    columns = {
+        "actual": {"day": days[keep], "units_sold": units[keep]},
+        # A straight line only needs its two ends
+        "fitted": {"day": days[[0, -1]], "units_sold": fitted[[0, -1]]},
+        "forecast": {
+            "day": forecast_days,
+            "units_sold": analysis["predicted_future"],
+            "lower": analysis["lower"],
+            "upper": analysis["upper"],
+        },
+    }
+
+    for name, col in columns.items():
+        if encoding == "binary":
+            columns[name] = {k: typed_array(v, "int32" if k == "day" else "float32") for k, v in col.items()}
+        else:
+            columns[name] = {k: np.asarray(v).tolist() if k == "day" else rounded_list(v) for k, v in col.items()}
+
+    return {
+        "origin": origin.date().isoformat(),
+        "points": int(len(days)),
+        "returned": int(len(keep)),
+        "method": method,
+        "confidence": analysis["confidence"],
+        "slope": float(model.slope),
+        "intercept": float(model.intercept),
+        "r2": float(model.r2),
+        **columns,
+    }
@@ -0,0 +1,184 @@
+from django.db import connection, transaction
+from datetime import date
+from itertools import islice
+from django.db.models import F
+from django.utils import timezone
+from .models import SalesDataset, SalesObservation
+import json
+import csv
+import io
+
+INGEST_BATCH_SIZE = 5000
+DEFAULT_SERIES = "default"
+
+
+class UnknownSeries(LookupError):
+    pass
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+# === 1. Streaming parsers: yield (series, date, units_sold) ===
+class ReadableStream(io.RawIOBase):
+    # Adapts anything with read(n) (e.g. a Django request body) to the io API
+    def __init__(self, source):
+        self.source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def as_text(fileobj):
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    if not hasattr(fileobj, "readable"):
+        fileobj = io.BufferedReader(ReadableStream(fileobj))
+    return io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+
+
+def parse_row(row, default_series):
+    series = row.get("series") or row.get("sku") or default_series
+    return str(series), date.fromisoformat(str(row["date"])[:10]), float(row["units_sold"])
+
+
+def iter_csv_rows(fileobj, default_series=DEFAULT_SERIES):
+    for row in csv.DictReader(as_text(fileobj)):
+        yield parse_row(row, default_series)
+
+
+def iter_json_rows(fileobj, default_series=DEFAULT_SERIES):
+    # JSON Lines are streamed one object per line; a plain JSON array has to be
+    # parsed in one go, so prefer NDJSON for large uploads.
+    text = as_text(fileobj)
+    first = text.read(1)
+    while first and first.isspace():
+        first = text.read(1)
+
+    if first == "[":
+        for row in json.loads(first + text.read()):
+            yield parse_row(row, default_series)
+        return
+
+    line = first + text.readline()
+    while line:
+        if line.strip():
+            yield parse_row(json.loads(line), default_series)
+        line = text.readline()
+
+
+def iter_rows(fileobj, fmt, default_series=DEFAULT_SERIES):
+    if fmt == "csv":
+        return iter_csv_rows(fileobj, default_series)
+    if fmt in ("json", "ndjson", "jsonl"):
+        return iter_json_rows(fileobj, default_series)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+# === 2. Batched upsert ===
+def upsert_sql():
+    # INSERT ... ON CONFLICT DO UPDATE, understood by both SQLite and PostgreSQL
+    meta = SalesObservation._meta
+    q = connection.ops.quote_name
+    return (
+        f"INSERT INTO {q(meta.db_table)} ({q('series')}, {q('date')}, {q('units_sold')}) "
+        f"VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({q('series')}, {q('date')}) DO UPDATE SET {q('units_sold')} = excluded.{q('units_sold')}"
+    )
+
+
+def upsert_batch(latest):
+    if connection.vendor in ("sqlite", "postgresql"):
+        # executemany skips building a model instance per row, which is most of
+        # the cost of bulk_create on large imports
+        adapt = connection.ops.adapt_datefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(upsert_sql(), [(s, adapt(d), u) for (s, d), u in latest.items()])
+    else:
+        SalesObservation.objects.bulk_create(
+            [SalesObservation(series=s, date=d, units_sold=u) for (s, d), u in latest.items()],
+            update_conflicts=True,
+            unique_fields=["series", "date"],
+            update_fields=["units_sold"],
+        )
+
+
+def bump_versions(series):
+    # Same transaction as the data, so a version never points at half a batch
+    SalesDataset.objects.bulk_create([SalesDataset(series=s) for s in series], ignore_conflicts=True)
+    SalesDataset.objects.filter(series__in=series).update(version=F("version") + 1, updated_at=timezone.now())
+
+
+def numbered(rows):
+    # Re-raises a parse error with the number of the data row it stopped at
+    rows = iter(rows)
+    number = 0
+    while True:
+        number += 1
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidRow(f"Row {number}: {e!r}; nothing was imported") from e
+        yield row
+
+
+def ingest_rows(rows, batch_size=INGEST_BATCH_SIZE):
+    # Upsert in fixed-size batches: memory is bounded by batch_size, not file
+    # size. One transaction for the whole upload, so a bad row anywhere leaves
+    # the data, the versions and so the cached analyses untouched.
+    rows = numbered(rows)
+    total = 0
+    series = set()
+    with transaction.atomic():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            # Last value wins if a batch repeats a (series, date)
+            latest = {(s, d): u for s, d, u in batch}
+            upsert_batch(latest)
+            bump_versions({s for s, _ in latest})
+            total += len(batch)
+            series.update(s for s, _, _ in batch)
+    return {"rows": total, "series": sorted(series)}
+
+
+# === 3. Range reads ===
+def load_series_frame(series=DEFAULT_SERIES, start=None, end=None):
+    # Only the requested date range is read, via the (series, date) index
+    import pandas as pd
+
+    qs = SalesObservation.objects.filter(series=series)
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    df = pd.DataFrame.from_records(
+        qs.order_by("date").values_list("date", "units_sold"),
+        columns=["date", "units_sold"],
+    )
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def load_all_frame(start=None, end=None):
+    # Long format (series, date, units_sold) for every series, for batch analysis
+    import pandas as pd
+
+    qs = SalesObservation.objects.all()
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    return pd.DataFrame.from_records(
+        qs.order_by().values_list("series", "date", "units_sold"),
+        columns=["series", "date", "units_sold"],
+    )
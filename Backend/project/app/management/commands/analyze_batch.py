@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from app.batch import analyze_batch, batch_to_columns, benchmark
+from app.ingest import load_all_frame
+import pandas as pd
+import json
+
+
+class Command(BaseCommand):
+    help = "Trend + price suggestion + forecast for every SKU in one vectorized pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--csv", help="Long-format CSV (sku|series, date, units_sold); default: the database")
+        parser.add_argument("--base-price", type=float, default=100.0)
+        parser.add_argument("--horizon", type=int, default=7, help="Days to forecast")
+        parser.add_argument("--confidence", type=float, help="Add prediction intervals at this level, e.g. 0.95")
+        parser.add_argument("--out", help="Write the columnar JSON result here")
+        parser.add_argument("--benchmark", action="store_true",
+                            help="Compare against per-series sklearn on synthetic data")
+        parser.add_argument("--skus", type=int, default=1000)
+        parser.add_argument("--days", type=int, default=365)
+
+    def handle(self, *args, **options):
+        if options["benchmark"]:
+            report = benchmark(options["skus"], options["days"])
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        df = pd.read_csv(options["csv"]) if options["csv"] else load_all_frame()
+        if df.empty:
+            self.stderr.write("No sales data to analyze")
+            return
+
+        columns = batch_to_columns(analyze_batch(df, options["base_price"], options["horizon"], options["confidence"]))
+        if options["out"]:
+            with open(options["out"], "w", encoding="utf-8") as f:
+                json.dump(columns, f)
+        self.stdout.write(self.style.SUCCESS(f"Analyzed {len(columns['sku'])} SKUs"))
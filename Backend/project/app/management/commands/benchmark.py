@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.suite import (
+    CASE_BUDGET_SECONDS, REGRESSION_THRESHOLD, SCALES, compare, load_results, run_suite, save_results,
+)
+import os
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "benchmarks", "results")
+
+
+class Command(BaseCommand):
+    help = "Run the offline benchmark suite (analytics, plotting, chatbot) and optionally compare to a baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="quick",
+                            help="quick: up to 1e6 rows / 1k SKUs; full: up to 1e7 rows / 10k SKUs")
+        parser.add_argument("--only", action="append", help="Run cases whose name contains this (repeatable)")
+        parser.add_argument("--out", default=os.path.join(RESULTS_DIR, "latest.json"))
+        parser.add_argument("--baseline", help="Results JSON to compare against")
+        parser.add_argument("--compare-only", metavar="RESULTS",
+                            help="Compare an existing results file to --baseline without running")
+        parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                            help="Fractional slowdown of the median that counts as a regression")
+        parser.add_argument("--budget", type=float, default=CASE_BUDGET_SECONDS, help="Seconds per case")
+        parser.add_argument("--llm-latency", type=float, default=0.0,
+                            help="Simulated Groq latency in seconds (0 measures our own overhead)")
+
+    def handle(self, *args, **options):
+        if options["compare_only"]:
+            if not options["baseline"]:
+                raise CommandError("--compare-only needs --baseline")
+            results = load_results(options["compare_only"])
+        else:
+            results = run_suite(options["scale"], options["only"], options["llm_latency"], options["budget"],
+                                log=self.stdout.write)
+            save_results(results, options["out"])
+            self.stdout.write(self.style.SUCCESS(f"📊 Saved {len(results['results'])} results to {os.path.abspath(options['out'])}"))
+
+        if not options["baseline"]:
+            return
+
+        rows = compare(results, load_results(options["baseline"]), options["threshold"])
+        for row in rows:
+            line = f"{row['name']:<50} {row['baseline'] * 1000:10.3f} ms -> {row['current'] * 1000:10.3f} ms  x{row['ratio']:.2f}"
+            self.stdout.write(self.style.ERROR(line + "  REGRESSION") if row["regressed"] else line)
+
+        regressions = [row["name"] for row in rows if row["regressed"]]
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
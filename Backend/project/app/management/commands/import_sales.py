@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.ingest import DEFAULT_SERIES, INGEST_BATCH_SIZE, ingest_rows, iter_rows
+import os
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV / JSON / NDJSON sales file into the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--series", default=DEFAULT_SERIES,
+                            help="Series for rows without a series/sku column")
+        parser.add_argument("--format", choices=["csv", "json", "ndjson"])
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt == "jsonl":
+            fmt = "ndjson"
+        if fmt not in ("csv", "json", "ndjson"):
+            raise CommandError("Could not tell the file format, pass --format")
+
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            result = ingest_rows(iter_rows(f, fmt, options["series"]), batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['rows']} rows into {len(result['series'])} series"
+        ))
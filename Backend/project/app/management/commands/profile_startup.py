@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+import subprocess
+import json
+import sys
+import os
+
+# Runs in a fresh interpreter so nothing this process already imported skews it
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+phases = {}
+started = time.perf_counter()
+import django
+django.setup()
+phases["django.setup"] = time.perf_counter() - started
+mark = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases["urlconf"] = time.perf_counter() - mark
+if os.environ.get("PROFILE_WARMUP") == "1":
+    from project.warmup import warm_up
+    for step, seconds in warm_up().items():
+        phases["warmup." + step] = seconds
+phases["total"] = time.perf_counter() - started
+print("PHASES " + json.dumps(phases))
+"""
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package" lines
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        modules.append((name, int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report where worker startup time goes: Django setup, URLconf import and optional warm-up, by package."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--warmup", action="store_true", help="Also time project.warmup.warm_up()")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--json", action="store_true", help="Machine-readable output")
+
+    def handle(self, *args, **options):
+        env = {
+            **os.environ,
+            # Measure imports, not the background threads started by AppConfig.ready()
+            "CHATBOT_PRELOAD": "0", "OUTBOX_WORKER": "0", "RENDER_PRELOAD": "0",
+            "PROFILE_WARMUP": "1" if options["warmup"] else "0",
+            "PYTHONWARNINGS": "ignore",
+        }
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        phases_line = next((line for line in result.stdout.splitlines() if line.startswith("PHASES ")), None)
+        if result.returncode != 0 or phases_line is None:
+            raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+
+        phases = json.loads(phases_line[len("PHASES "):])
+        modules = parse_importtime(result.stderr)
+
+        # Self time summed per top-level package
+        packages = {}
+        for name, self_us, _ in modules:
+            top = name.split(".")[0]
+            packages[top] = packages.get(top, 0) + self_us
+        top_packages = sorted(packages.items(), key=lambda item: -item[1])[:options["top"]]
+        top_modules = sorted(modules, key=lambda m: -m[2])[:options["top"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps({
+                "phases": phases,
+                "packages": [{"package": p, "self_seconds": us / 1e6} for p, us in top_packages],
+                "modules": [{"module": n, "self_seconds": s / 1e6, "cumulative_seconds": c / 1e6} for n, s, c in top_modules],
+            }, indent=2))
+            return
+
+        self.stdout.write("⏱️ Phases")
+        for phase, seconds in phases.items():
+            self.stdout.write(f"  {phase:<24} {seconds:8.3f}s")
+        self.stdout.write(f"\n📦 Import self-time by package (top {options['top']})")
+        for package, us in top_packages:
+            self.stdout.write(f"  {package:<24} {us / 1e6:8.3f}s")
+        self.stdout.write(f"\n🐢 Slowest imports, cumulative (top {options['top']})")
+        for name, _, cumulative_us in top_modules:
+            self.stdout.write(f"  {name:<48} {cumulative_us / 1e6:8.3f}s")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from app.snapshot import append_rows, build_snapshot, open_snapshot, snapshot_dir
+from app.views import CSV_PATH
+import time
+import csv
+
+
+class Command(BaseCommand):
+    help = "Build (or refresh) the memory-mapped columnar snapshot of a sales CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--csv", default=CSV_PATH, help="date,units_sold CSV; default: SALES_CSV_PATH")
+        parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the snapshot is current")
+        parser.add_argument("--append", help="Append the rows of this date,units_sold CSV to the source and snapshot")
+
+    def handle(self, *args, **options):
+        path = options["csv"]
+        if options["rebuild"]:
+            build_snapshot(path)
+        if options["append"]:
+            with open(options["append"], newline="", encoding="utf-8") as f:
+                rows = [(row["date"], float(row["units_sold"])) for row in csv.DictReader(f)]
+            append_rows(path, rows)
+            self.stdout.write(f"Appended {len(rows)} rows")
+
+        started = time.perf_counter()
+        snapshot = open_snapshot(path)
+        elapsed = time.perf_counter() - started
+        last = str(snapshot.dates[-1]) if len(snapshot) else "-"
+        self.stdout.write(self.style.SUCCESS(
+            f"{snapshot_dir(path)}: {len(snapshot)} rows, {snapshot.origin} .. {last}, opened in {elapsed * 1000:.1f} ms"
+        ))
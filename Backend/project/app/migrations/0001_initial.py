@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(default='default', max_length=100)),
+                ('date', models.DateField()),
+                ('units_sold', models.FloatField()),
+            ],
+            options={
+                'ordering': ['series', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('series', 'date'), name='unique_series_date')],
+            },
+        ),
+    ]
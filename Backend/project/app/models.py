@@ -1,3 +1,30 @@
 from django.db import models
 
-# Create your models here.
+
+class SalesObservation(models.Model):
+    # One day of sales for one series (product / branch / SKU)
+    series = models.CharField(max_length=100, default="default")
+    date = models.DateField()
+    units_sold = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the (series, date) index every range query uses
+            models.UniqueConstraint(fields=["series", "date"], name="unique_series_date"),
+        ]
+        ordering = ["series", "date"]
+
+    def __str__(self):
+        return f"{self.series} {self.date}: {self.units_sold}"
+
+
+class SalesDataset(models.Model):
+    # Version counter per series, bumped by every ingest that touches it.
+    # Analysis results are cached under (series, version), so a bump is all it
+    # takes to invalidate them in every worker process.
+    series = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.series} v{self.version}"
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import os
+
+# Rendered images are small; cap the cache by total bytes rather than entries
+PLOT_CACHE_BYTES = int(os.getenv("PLOT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+
+def plot_etag(key):
+    # The key already pins the data version, plot type, size, dpi and format,
+    # so the ETag is known without rendering anything.
+    raw = "|".join(str(part) for part in key)
+    return '"%s"' % hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class PlotCache:
+    # LRU of rendered images keyed by (analysis key, plot type, size, dpi, format)
+    def __init__(self, max_bytes=PLOT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = render()
+
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+plot_cache = PlotCache()
@@ -0,0 +1,147 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from project.metrics import replay
+import threading
+import os
+
+# 0 renders in the request thread (still safe: the OO API keeps no global figure state)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Renders waiting or running at once; beyond this requests are turned away
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", str(4 * max(RENDER_WORKERS, 1))))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "15"))
+# How long a request may wait for a free queue slot before giving up
+RENDER_QUEUE_WAIT = float(os.getenv("RENDER_QUEUE_WAIT", "2"))
+
+
+class RenderBusy(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+# === 1. Worker process ===
+def warm_worker():
+    # Pay matplotlib's import and font-cache cost once per worker, not per request
+    from .utils import render_predicted_week
+    import numpy as np
+    import pandas as pd
+
+    render_predicted_week(list(pd.date_range("2024-01-01", periods=7)), np.arange(7.0), dpi=50)
+
+
+def call(func, args, kwargs):
+    # Stages timed in here (plot.encode, ...) go back to the parent with the
+    # result: the worker's own metrics registry never reaches /metrics
+    from project.metrics import capture_stages
+
+    with capture_stages() as stages:
+        data = func(*args, **kwargs)
+    return data, stages
+
+
+def kill_pool(pool):
+    # A hung render would block a normal shutdown, so kill the workers
+    if pool is not None:
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# === 2. Pool ===
+class RenderPool:
+    def __init__(self, workers=RENDER_WORKERS, queue_size=RENDER_QUEUE_SIZE, timeout=RENDER_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self.queue_size = queue_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self):
+        with self._lock:
+            if self._pool is None and self.workers > 0:
+                # spawn: workers never inherit the server's threads, locks or DB connections
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_worker,
+                )
+                # Start every worker now rather than on the first requests
+                for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+                    future.result()
+                print(f"🎨 Render pool started with {self.workers} workers")
+            return self._pool
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        kill_pool(pool)
+
+    def restart(self, broken):
+        # Several requests may notice the same broken pool; only the one that
+        # swaps it out kills it, so nobody kills the replacement another started
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = None
+            self.restarts += 1
+        kill_pool(broken)
+        self.start()
+
+    def render(self, func, *args, **kwargs):
+        # func must be a module-level function so it can be sent to a worker
+        if not self._slots.acquire(timeout=RENDER_QUEUE_WAIT):
+            self.rejected += 1
+            raise RenderBusy("Too many plots rendering, try again shortly")
+        try:
+            pool = self.start()
+            if pool is None:
+                data = func(*args, **kwargs)
+            else:
+                data = self._render_in(pool, func, args, kwargs)
+            self.rendered += 1
+            return data
+        finally:
+            self._slots.release()
+
+    def _render_in(self, pool, func, args, kwargs):
+        # A pool restarted under us (another request's timeout) breaks the
+        # renders in flight on it: each gets one retry on the replacement
+        for attempt in range(2):
+            try:
+                future = pool.submit(call, func, args, kwargs)
+                data, stages = future.result(timeout=self.timeout)
+                replay(stages)
+                return data
+            except FutureTimeout:
+                self.timeouts += 1
+                print(f"⏱️ Plot render exceeded {self.timeout}s, restarting render pool")
+                # The stuck worker cannot be cancelled, only replaced
+                self.restart(pool)
+                raise RenderTimeout(f"Plot rendering took longer than {self.timeout}s")
+            except BrokenProcessPool:
+                self.restart(pool)
+                pool = self.start()
+        self.rejected += 1
+        raise RenderBusy("Render workers were restarted, try again shortly")
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "started": self._pool is not None,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+        }
+
+
+render_pool = RenderPool()
@@ -0,0 +1,74 @@
+import numpy as np
+
+MAX_PRICES = 100000
+# The per-day price x day surface is opt-in and capped: 100k prices x 365 days
+# would be ~36M floats in one JSON response
+MAX_SURFACE_CELLS = 100_000
+
+
+def price_grid(options):
+    # Explicit "prices": [...] or a min_price / max_price / step range
+    if "prices" in options:
+        prices = np.asarray(options["prices"], dtype=np.float64).ravel()
+    else:
+        low = float(options["min_price"])
+        high = float(options["max_price"])
+        step = float(options.get("step") or (high - low) / 99 or 1.0)
+        if step <= 0:
+            raise ValueError("step must be positive")
+        # Compute the grid as low + i*step so float drift never adds or drops a point
+        count = int(np.floor((high - low) / step + 1e-9)) + 1
+        if count > MAX_PRICES:
+            raise ValueError(f"Price grid too large ({count} prices, max {MAX_PRICES})")
+        prices = low + step * np.arange(count)
+
+    if prices.size == 0:
+        raise ValueError("Empty price grid")
+    if prices.size > MAX_PRICES:
+        raise ValueError(f"Price grid too large ({prices.size} prices, max {MAX_PRICES})")
+    if np.any(prices <= 0) or not np.all(np.isfinite(prices)):
+        raise ValueError("Prices must be positive numbers")
+    return prices
+
+
+def price_scenarios(prices, predicted_units, reference_price, elasticity=0.0, surface=True):
+    # Constant-elasticity demand: units(p, day) = forecast(day) * (p / reference) ** elasticity.
+    # elasticity 0 keeps the forecast as-is (what revenue_view assumes);
+    # -1.5 means a 1% price rise loses about 1.5% of units.
+    prices = np.asarray(prices, dtype=np.float64)
+    forecast = np.maximum(np.asarray(predicted_units, dtype=np.float64), 0.0)  # no negative sales
+    if surface and prices.size * forecast.size > MAX_SURFACE_CELLS:
+        raise ValueError(f"Revenue surface too large ({prices.size} prices x {forecast.size} days, "
+                         f"max {MAX_SURFACE_CELLS} cells): request fewer prices or no surface")
+
+    # Demand scales every day alike, so the totals need only the forecast's sum
+    demand = (prices / reference_price) ** elasticity
+    total_units = demand * forecast.sum()
+    total_revenue = total_units * prices
+    result = {
+        "prices": prices,
+        "total_units": total_units,
+        "total_revenue": total_revenue,
+        "best_index": int(np.argmax(total_revenue)),
+    }
+    if surface:
+        # (prices, 1) x (1, days) -> (prices, days) in one broadcast
+        units = demand[:, None] * forecast[None, :]
+        result.update(units=units, revenue=units * prices[:, None])
+    return result
+
+
+def scenarios_to_json(result):
+    best = result["best_index"]
+    payload = {
+        "best_price": round(float(result["prices"][best]), 2),
+        "best_revenue": round(float(result["total_revenue"][best]), 2),
+        "best_units": round(float(result["total_units"][best]), 2),
+        "prices": np.round(result["prices"], 2).tolist(),
+        "total_units": np.round(result["total_units"], 2).tolist(),
+        "total_revenue": np.round(result["total_revenue"], 2).tolist(),
+    }
+    if "revenue" in result:
+        # Row per price, column per forecast day
+        payload["revenue_surface"] = np.round(result["revenue"], 2).tolist()
+    return payload
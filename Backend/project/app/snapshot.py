@@ -0,0 +1,233 @@
+import numpy as np
+import threading
+import hashlib
+import json
+import uuid
+import os
+
+# Binary columnar copy of a date,units_sold CSV: int32 day offsets from an
+# origin date + float32 units, sorted by day, opened with np.memmap so a load
+# is a metadata read instead of a text parse.
+SNAPSHOT_ENABLED = os.getenv("SALES_SNAPSHOT", "1") == "1"
+SNAPSHOT_DIR = os.getenv("SALES_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+SNAPSHOT_FORMAT = 1
+# Rows parsed per chunk while building, bounds peak memory of the text parse
+BUILD_CHUNK_ROWS = 1_000_000
+
+DAYS_DTYPE = np.dtype("<i4")
+UNITS_DTYPE = np.dtype("<f4")
+
+_lock = threading.Lock()
+# {csv path: Snapshot}, reused while the meta file is unchanged
+_open = {}
+
+
+# === 1. Layout ===
+def snapshot_dir(csv_path):
+    path = os.path.abspath(csv_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR, f"{name}-{hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]}")
+
+
+def source_fingerprint(csv_path):
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def column_paths(directory, generation):
+    return os.path.join(directory, f"days-{generation}.i32"), os.path.join(directory, f"units-{generation}.f32")
+
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(directory, meta):
+    # Readers only ever see a complete meta.json, and meta["rows"] never
+    # exceeds what is already on disk (columns are written first)
+    path = os.path.join(directory, "meta.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+
+# === 2. Reading ===
+class Snapshot:
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.rows = meta["rows"]
+        self.origin = np.datetime64(meta["origin"], "D")
+        days_path, units_path = column_paths(directory, meta["generation"])
+        if self.rows:
+            self.days = np.memmap(days_path, dtype=DAYS_DTYPE, mode="r", shape=(self.rows,))
+            self.units = np.memmap(units_path, dtype=UNITS_DTYPE, mode="r", shape=(self.rows,))
+        else:
+            self.days = np.empty(0, dtype=DAYS_DTYPE)
+            self.units = np.empty(0, dtype=UNITS_DTYPE)
+        self._date_column = None
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def dates(self):
+        return self.origin + self.days.astype("timedelta64[D]")
+
+    def date_column(self):
+        # Built once per snapshot (a new generation is a new Snapshot) and
+        # read-only, so every frame() shares it
+        if self._date_column is None:
+            dates = self.dates.astype("datetime64[s]")
+            dates.flags.writeable = False
+            self._date_column = dates
+        return self._date_column
+
+    def frame(self):
+        # date / units_sold / days, as analyze_sales expects; the numeric
+        # columns wrap the mapped pages instead of copying them
+        import pandas as pd
+
+        return pd.DataFrame({
+            "date": self.date_column(),
+            "units_sold": self.units,
+            "days": self.days,
+        }, copy=False)
+
+
+def open_snapshot(csv_path):
+    # Rebuilds first when the CSV changed since the snapshot was taken (or it
+    # was never built, or an append left it out of order)
+    directory = snapshot_dir(csv_path)
+    with _lock:
+        meta = read_meta(directory)
+        if not is_current(meta, csv_path):
+            meta = build_snapshot(csv_path)
+
+        snapshot = _open.get(directory)
+        if snapshot is None or snapshot.meta != meta:
+            snapshot = _open[directory] = Snapshot(directory, meta)
+        return snapshot
+
+
+def is_current(meta, csv_path):
+    return (
+        meta is not None
+        and meta.get("format") == SNAPSHOT_FORMAT
+        and meta.get("sorted")
+        and meta.get("source") == source_fingerprint(csv_path)
+    )
+
+
+# === 3. Writing ===
+def parse_csv(csv_path):
+    # -> (epoch days int64, units float32) in file order
+    import pandas as pd
+
+    days, units = [], []
+    for chunk in pd.read_csv(csv_path, usecols=["date", "units_sold"], chunksize=BUILD_CHUNK_ROWS):
+        dates = pd.to_datetime(chunk["date"]).values.astype("datetime64[D]")
+        days.append(dates.astype(np.int64))
+        units.append(chunk["units_sold"].to_numpy(dtype=UNITS_DTYPE))
+    if not days:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=UNITS_DTYPE)
+    return np.concatenate(days), np.concatenate(units)
+
+
+def build_snapshot(csv_path):
+    source = source_fingerprint(csv_path)
+    epoch_days, units = parse_csv(csv_path)
+
+    if len(epoch_days) and np.any(np.diff(epoch_days) < 0):
+        order = np.argsort(epoch_days, kind="stable")  # same row order as sort_values
+        epoch_days, units = epoch_days[order], units[order]
+    origin = int(epoch_days[0]) if len(epoch_days) else 0
+    offsets = epoch_days - origin
+    if len(offsets) and offsets[-1] > np.iinfo(DAYS_DTYPE).max:
+        raise ValueError("Sales history spans too many days for a snapshot")
+
+    directory = snapshot_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    previous = read_meta(directory)
+
+    # A new generation of column files, published by swapping meta.json, so
+    # readers that mapped the previous one keep valid pages until they let go
+    generation = uuid.uuid4().hex[:12]
+    days_path, units_path = column_paths(directory, generation)
+    offsets.astype(DAYS_DTYPE).tofile(days_path)
+    units.astype(UNITS_DTYPE).tofile(units_path)
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "generation": generation,
+        "origin": str(np.datetime64(origin, "D")),
+        "rows": int(len(offsets)),
+        "last_day": int(offsets[-1]) if len(offsets) else 0,
+        "sorted": True,
+        "source": source,
+    }
+    write_meta(directory, meta)
+
+    if previous and previous.get("generation") not in (None, generation):
+        for path in column_paths(directory, previous["generation"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    print(f"🗜️ Built sales snapshot of {os.path.basename(csv_path)}: {meta['rows']} rows")
+    return meta
+
+
+def append_rows(csv_path, rows):
+    # rows: iterable of (date, units_sold). Appends to the CSV (still the
+    # source of truth) and to the snapshot columns in place, then records the
+    # CSV's new fingerprint so the append does not trigger a rebuild.
+    import pandas as pd
+
+    rows = list(rows)
+    if not rows:
+        return open_snapshot(csv_path)
+    dates = pd.to_datetime([date for date, _ in rows]).values.astype("datetime64[D]")
+    units = np.array([value for _, value in rows], dtype=UNITS_DTYPE)
+
+    snapshot = open_snapshot(csv_path)
+    with _lock:
+        meta = dict(snapshot.meta)
+        with open(csv_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+            else:
+                needs_newline = False
+            text = "".join(f"{date},{format_units(value)}\n" for date, value in zip(dates.astype(str), units))
+            f.write((("\n" if needs_newline else "") + text).encode("utf-8"))
+
+        offsets = (dates - snapshot.origin).astype(np.int64)
+        days_path, units_path = column_paths(snapshot.directory, meta["generation"])
+        with open(days_path, "ab") as f:
+            offsets.astype(DAYS_DTYPE).tofile(f)
+        with open(units_path, "ab") as f:
+            units.tofile(f)
+
+        # Rows older than the current tail make the next open re-sort
+        in_order = bool(offsets[0] >= meta["last_day"] and np.all(np.diff(offsets) >= 0))
+        meta.update(
+            rows=meta["rows"] + len(offsets),
+            last_day=max(meta["last_day"], int(offsets.max())),
+            sorted=meta["sorted"] and in_order and meta["rows"] > 0,
+            source=source_fingerprint(csv_path),
+        )
+        write_meta(snapshot.directory, meta)
+    return open_snapshot(csv_path)
+
+
+def format_units(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
@@ -1,3 +1,617 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.db import connections
+from sklearn.linear_model import LinearRegression
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import numpy as np
+import threading
+import tempfile
+import shutil
+import base64
+import json
+import io
+import time
+import os
 
-# Create your tests here.
+from .trend import RunningRegression
+from .batch import batch_suggest_price, batch_trends, synthetic_sales
+from .utils import analyze_sales, suggest_price
+from .analysis_cache import AnalysisCache, analysis_cache, analysis_key
+from .downsample import lttb, minmax, typed_array
+from .render_pool import RenderBusy, RenderPool, RenderTimeout
+from .utils import render_predicted_week
+from .scenarios import price_grid, price_scenarios
+from .ingest import InvalidRow, ingest_rows, iter_rows, load_series_frame
+from .analysis_cache import series_version
+from . import snapshot
+from .views import analysis_plan
+import pandas as pd
+
+SALES_CSV = os.path.join(os.path.dirname(__file__), "sales_data.csv")
+
+
+def sklearn_fit(x, y):
+    model = LinearRegression().fit(np.asarray(x).reshape(-1, 1), y)
+    return model.coef_[0], model.intercept_, model.score(np.asarray(x).reshape(-1, 1), y)
+
+
+class RunningRegressionTests(SimpleTestCase):
+    def test_matches_sklearn(self):
+        rng = np.random.default_rng(0)
+        x = np.arange(3650)
+        y = 40 + 0.3 * x + rng.normal(0, 25, size=len(x))
+
+        reg = RunningRegression.fit(x, y)
+        slope, intercept, r2 = sklearn_fit(x, y)
+
+        self.assertAlmostEqual(reg.slope, slope, places=9)
+        self.assertAlmostEqual(reg.intercept, intercept, places=6)
+        self.assertAlmostEqual(reg.r2, r2, places=9)
+        np.testing.assert_allclose(reg.predict([3650, 3700]), intercept + slope * np.array([3650, 3700]))
+
+    def test_appends_match_full_refit(self):
+        rng = np.random.default_rng(1)
+        x = np.arange(500) + 20000  # e.g. day ordinals
+        y = rng.poisson(80, size=len(x)).astype(float)
+
+        reg = RunningRegression.fit(x[:400], y[:400])
+        for xi, yi in zip(x[400:], y[400:]):
+            reg.add(xi, yi)
+        slope, intercept, r2 = sklearn_fit(x, y)
+
+        self.assertAlmostEqual(reg.slope, slope, places=9)
+        self.assertAlmostEqual(reg.intercept, intercept, places=5)
+        self.assertAlmostEqual(reg.r2, r2, places=9)
+
+    def test_constant_series(self):
+        reg = RunningRegression.fit([0, 1, 2], [5, 5, 5])
+        self.assertEqual(reg.slope, 0.0)
+        self.assertEqual(reg.intercept, 5.0)
+        self.assertEqual(reg.r2, 1.0)
+
+    def test_long_offset_history_keeps_precision(self):
+        # Large x and y offsets: raw power sums lose most digits to cancellation
+        rng = np.random.default_rng(2)
+        x = np.arange(200_000, dtype=np.float64) + 1e9
+        y = 1e6 + 0.001 * (x - 1e9) + rng.normal(0, 1, size=len(x))
+
+        reg = RunningRegression.fit(x[:1000], y[:1000])
+        reg.extend(x[1000:150_000], y[1000:150_000])
+        for xi, yi in zip(x[150_000:150_100], y[150_000:150_100]):
+            reg.add(xi, yi)
+        reg.extend(x[150_100:], y[150_100:])
+
+        xc, yc = x - x.mean(), y - y.mean()
+        slope = (xc @ yc) / (xc @ xc)
+        self.assertAlmostEqual(reg.slope / slope, 1.0, places=9)
+        self.assertAlmostEqual(reg.r2, 1 - ((yc - slope * xc) @ (yc - slope * xc)) / (yc @ yc), places=9)
+
+
+class AnalyzeSalesTests(SimpleTestCase):
+    def test_analyze_sales_matches_sklearn(self):
+        results = analyze_sales(SALES_CSV)
+        df = results["df"]
+        slope, intercept, r2 = sklearn_fit(df["days"].values, df["units_sold"].values)
+
+        self.assertAlmostEqual(results["slope"], slope, places=9)
+        self.assertAlmostEqual(results["intercept"], intercept, places=9)
+        self.assertAlmostEqual(results["r2"], r2, places=9)
+        self.assertEqual(len(results["predicted_future"]), 7)
+
+
+class BatchTrendTests(SimpleTestCase):
+    def test_matches_per_series_fit(self):
+        skus, days, units = synthetic_sales(n_skus=50, days_per_sku=90)
+        result = batch_trends(skus, days, units)
+
+        for i, sku in enumerate(result["skus"]):
+            mask = skus == sku
+            reg = RunningRegression.fit(days[mask], units[mask])
+            self.assertAlmostEqual(result["slope"][i], reg.slope, places=9)
+            self.assertAlmostEqual(result["intercept"][i], reg.intercept, places=6)
+            self.assertAlmostEqual(result["r2"][i], reg.r2, places=9)
+            np.testing.assert_allclose(result["forecast"][i], reg.predict(np.arange(90, 97)))
+
+    def test_suggest_price_matches_scalar_version(self):
+        slopes = np.array([-1.0, -0.1, 0.0, 0.1, 0.5])
+        expected = [suggest_price(99.99, s) for s in slopes]
+        self.assertEqual(batch_suggest_price(99.99, slopes).tolist(), expected)
+
+
+class AnalysisCacheTests(SimpleTestCase):
+    def test_concurrent_requests_compute_once(self):
+        cache = AnalysisCache(alias="default")
+        key = analysis_key("test", {"csv": "x", "nonce": time.time()})
+        calls = []
+        lock = threading.Lock()
+
+        def compute():
+            with lock:
+                calls.append(1)
+            time.sleep(0.2)
+            return {"slope": 1.5}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: cache.get_or_compute(key, compute), range(8)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == {"slope": 1.5} for r in results))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"] + stats["misses"], stats["computations"], stats["key_locks"]), (8, 1, 0))
+
+    def test_key_changes_with_data_version(self):
+        self.assertEqual(analysis_key("sales", {"series": "a", "version": 1}),
+                         analysis_key("sales", {"version": 1, "series": "a"}))
+        self.assertNotEqual(analysis_key("sales", {"series": "a", "version": 1}),
+                            analysis_key("sales", {"series": "a", "version": 2}))
+
+
+class BrokenCache:
+    # Every call fails, like a DatabaseCache before `migrate` created its table
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RuntimeError("no such table: bookkeeping_cache")
+        return fail
+
+
+class BrokenAnalysisCacheTests(SimpleTestCase):
+    def test_computes_locally_when_the_shared_cache_fails(self):
+        cache = AnalysisCache(alias="broken")
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"slope": 1.5}
+
+        with patch("app.analysis_cache.caches", {"broken": BrokenCache()}), \
+                patch("app.analysis_cache.ANALYSIS_WAIT_SECONDS", 0.5):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(lambda _: cache.get_or_compute("k", compute), range(4)))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(results, [{"slope": 1.5}] * 4)
+        self.assertEqual(len(calls), 1)  # still once per process
+
+
+class SharedAnalysisCacheTests(TransactionTestCase):
+    # The DatabaseCache alias, as deployed: every thread gets its own connection
+    def test_concurrent_requests_compute_once(self):
+        cache = AnalysisCache(alias="shared")
+        keys = [analysis_key("test", {"shared": i}) for i in range(3)]
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"slope": 1.5}
+
+        def request(key):
+            try:
+                return cache.get_or_compute(key, compute)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            results = list(pool.map(request, keys * 4))
+
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(r == {"slope": 1.5} for r in results))
+        self.assertEqual(cache.stats()["key_locks"], 0)
+        # Another process (a fresh in-process layer) reads the stored result.
+        # Stored outside the contention above: the in-memory test database
+        # raises "table is locked" there, which the cache treats as a miss
+        key = analysis_key("test", {"shared": "stored"})
+        cache.get_or_compute(key, compute)
+        self.assertEqual(AnalysisCache(alias="shared").get(key), {"slope": 1.5})
+        self.assertEqual(len(calls), 4)
+
+
+class DownsampleTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.x = np.arange(3650, dtype=np.float64)
+        self.y = 100 + 20 * np.sin(self.x / 30) + rng.normal(0, 5, len(self.x))
+
+    def test_lttb_budget_and_endpoints(self):
+        keep = lttb(self.x, self.y, 500)
+        self.assertEqual(len(keep), 500)
+        self.assertEqual((keep[0], keep[-1]), (0, len(self.x) - 1))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_minmax_keeps_spikes(self):
+        y = self.y.copy()
+        y[1234] = 1000
+        y[2345] = -1000
+        keep = minmax(self.x, y, 200)
+        self.assertLessEqual(len(keep), 200)
+        self.assertIn(1234, keep)
+        self.assertIn(2345, keep)
+
+    def test_small_series_untouched(self):
+        self.assertEqual(lttb(self.x[:50], self.y[:50], 500).tolist(), list(range(50)))
+
+    def test_typed_array_round_trip(self):
+        encoded = typed_array([1.5, 2.25], "float32")
+        decoded = np.frombuffer(base64.b64decode(encoded["data"]), dtype="<f4")
+        self.assertEqual(decoded.tolist(), [1.5, 2.25])
+
+
+class RenderPoolTests(SimpleTestCase):
+    def test_concurrent_renders_do_not_bleed(self):
+        dates = list(pd.date_range("2024-01-01", periods=7))
+        series = [np.arange(7.0) * (i + 1) for i in range(6)]
+        expected = [render_predicted_week(dates, y, dpi=50) for y in series]
+
+        from project.metrics import registry
+        registry.reset()
+        pool = RenderPool(workers=2, queue_size=8, timeout=30)
+        try:
+            with ThreadPoolExecutor(6) as threads:
+                results = list(threads.map(lambda y: pool.render(render_predicted_week, dates, y, dpi=50), series))
+        finally:
+            pool.stop()
+        self.assertEqual(results, expected)
+        # Encoding is timed in the workers but lands in this process's registry
+        self.assertIn('bookkeeping_stage_seconds_count{stage="plot.encode"} 6', registry.render())
+
+    def test_inline_renders_from_threads(self):
+        dates = list(pd.date_range("2024-01-01", periods=7))
+        series = [np.arange(7.0) * (i + 1) for i in range(4)]
+        expected = [render_predicted_week(dates, y, dpi=50) for y in series]
+        pool = RenderPool(workers=0)
+        with ThreadPoolExecutor(4) as threads:
+            results = list(threads.map(lambda y: pool.render(render_predicted_week, dates, y, dpi=50), series * 3))
+        self.assertEqual(results, expected * 3)
+
+    def test_timeout_and_busy(self):
+        pool = RenderPool(workers=1, queue_size=1, timeout=0.5)
+        try:
+            with ThreadPoolExecutor(2) as threads:
+                slow = threads.submit(pool.render, time.sleep, 3)
+                time.sleep(0.1)
+                with self.assertRaises(RenderBusy):
+                    pool.render(time.sleep, 0)
+                with self.assertRaises(RenderTimeout):
+                    slow.result()
+            self.assertEqual(pool.stats()["restarts"], 1)
+            self.assertIsNone(pool.render(time.sleep, 0))
+        finally:
+            pool.stop()
+
+    def test_restart_retries_renders_in_flight_once(self):
+        pool = RenderPool(workers=1, queue_size=4, timeout=30)
+        try:
+            broken = pool.start()
+            with ThreadPoolExecutor(3) as threads:
+                in_flight = threads.submit(pool.render, time.sleep, 1)
+                time.sleep(0.3)
+                # Both notice the same broken pool: it is replaced exactly once
+                list(threads.map(pool.restart, [broken, broken]))
+                self.assertIsNone(in_flight.result())  # retried on the new pool
+            self.assertEqual(pool.stats()["restarts"], 1)
+            self.assertIsNot(pool.start(), broken)
+
+            # A render that keeps killing its worker: one retry, then a 503-style RenderBusy
+            with self.assertRaises(RenderBusy):
+                pool.render(os._exit, 1)
+            self.assertEqual(pool.stats()["restarts"], 3)
+            self.assertIsNone(pool.render(time.sleep, 0))
+        finally:
+            pool.stop()
+
+
+class IngestTests(TestCase):
+    def test_upsert_and_versions(self):
+        rows = [("shop-a", pd.Timestamp("2024-01-01").date() + pd.Timedelta(days=i), float(i)) for i in range(5)]
+        self.assertEqual(ingest_rows(rows, batch_size=2), {"rows": 5, "series": ["shop-a"]})
+        self.assertEqual(series_version("shop-a"), 3)  # one bump per batch
+
+        # Same dates again: updated in place, last value in a batch wins
+        again = [(s, d, u + 100) for s, d, u in rows[:2]] + [("shop-a", rows[1][1], 7.0)]
+        ingest_rows(again)
+        self.assertEqual(series_version("shop-a"), 4)
+        df = load_series_frame("shop-a")
+        self.assertEqual(df["units_sold"].tolist(), [100.0, 7.0, 2.0, 3.0, 4.0])
+        self.assertEqual(series_version("shop-b"), 0)
+
+    def test_bad_row_imports_nothing(self):
+        good = "".join(f"2024-01-{d:02d},{d}\n" for d in range(1, 8))
+        response = self.client.post("/api/ingest/?series=shop-bad&format=csv",
+                                    f"date,units_sold\n{good}2024-01-08,lots\n",
+                                    content_type="text/csv")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Row 8", response.json()["error"])
+        self.assertTrue(load_series_frame("shop-bad").empty)
+        self.assertEqual(series_version("shop-bad"), 0)
+
+        with self.assertRaises(InvalidRow):
+            ingest_rows(iter_rows(io.StringIO(f"date,units_sold\n{good}2024-13-01,1\n"), "csv", "shop-bad"), batch_size=2)
+        self.assertTrue(load_series_frame("shop-bad").empty)
+
+    def test_load_series_frame_range(self):
+        ingest_rows(iter_rows(io.StringIO("date,units_sold\n2024-01-03,3\n2024-01-01,1\n2024-01-02,2\n"), "csv", "shop-a"))
+        df = load_series_frame("shop-a", "2024-01-02", "2024-01-03")
+        self.assertEqual(df["date"].dt.day.tolist(), [2, 3])
+        self.assertTrue(load_series_frame("shop-b").empty)
+
+    def test_ingest_view_and_analysis(self):
+        lines = [json.dumps({"series": "shop-a", "date": f"2024-01-{d:02d}", "units_sold": 10 + 2 * d}) for d in range(1, 29)]
+        response = self.client.post("/api/ingest/", "\n".join(lines), content_type="application/x-ndjson")
+        self.assertEqual(response.json(), {"rows": 28, "series": ["shop-a"]})
+
+        response = self.client.post("/api/ingest/?series=shop-b", io.BytesIO(b""), content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 400)  # no format
+
+        analysis = self.client.post("/api/analyze/", {"series": "shop-a"}, content_type="application/json")
+        self.assertAlmostEqual(analysis.json()["slope"], 2.0, places=6)
+        # A series never ingested is not silently answered from the bundled CSV
+        missing = self.client.post("/api/analyze/", {"series": "shop-typo"}, content_type="application/json")
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(self.client.get("/api/series/", {"series": "shop-typo"}).status_code, 404)
+
+
+class AnalysisViewTests(TestCase):
+    def test_bad_forecast_options_are_rejected_before_the_analysis(self):
+        with patch("app.views.analysis_cache.get_or_compute") as get_or_compute:
+            for body in ({"horizon": 0}, {"horizon": "soon"}, {"confidence": 1.5}):
+                response = self.client.post("/api/analyze/", body, content_type="application/json")
+                self.assertEqual(response.status_code, 400, body)
+            response = self.client.get("/api/plot/forecast/", {"horizon": 400})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.client.get("/api/plot/trend/", {"dpi": "high"}).status_code, 400)
+            self.assertEqual(self.client.get("/api/series/", {"method": "spline"}).status_code, 400)
+        get_or_compute.assert_not_called()
+
+
+    def test_cached_analysis_holds_no_frame(self):
+        ingest_rows([("shop-summary", pd.Timestamp("2024-01-01").date() + pd.Timedelta(days=i), float(i % 5)) for i in range(30)])
+        key, run = analysis_plan({"series": "shop-summary"})
+        analysis = run()
+        self.assertNotIn("df", analysis)
+        cached = analysis_cache.get(key.split(":h")[0])
+        self.assertEqual(set(cached), {"slope", "intercept", "r2", "model", "last_date", "last_day"})
+
+        framed = run(with_frame=True)
+        self.assertEqual(len(framed["df"]), 30)
+        self.assertEqual(len(framed["fitted_line"]), 30)
+        self.assertEqual(framed["future_dates"][0], framed["df"]["date"].iloc[-1] + pd.Timedelta(days=1))
+        self.assertEqual(self.client.get("/api/series/", {"series": "shop-summary"}).json()["points"], 30)
+
+
+class ConditionalRequestTests(TestCase):
+    def test_unchanged_data_is_a_304_without_analysing(self):
+        # Own series name: analysis results outlive each test's rolled-back rows
+        ingest_rows([("shop-etag", pd.Timestamp("2024-01-01").date() + pd.Timedelta(days=i), float(i % 7)) for i in range(60)])
+        for path in ("/api/series/", "/api/plot/forecast/image/"):
+            params = {"series": "shop-etag", "dpi": 50}
+            first = self.client.get(path, params)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn("no-cache", first["Cache-Control"])
+
+            with patch("app.views.analysis_cache.get_or_compute") as get_or_compute:
+                again = self.client.get(path, params, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again["ETag"], first["ETag"])
+            get_or_compute.assert_not_called()
+
+            # Other parameters or new data -> another ETag, full response
+            other = self.client.get(path, {**params, "horizon": 30}, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(other.status_code, 200)
+            self.assertNotEqual(other["ETag"], first["ETag"])
+
+        etag = self.client.get("/api/series/", {"series": "shop-etag"})["ETag"]
+        ingest_rows([("shop-etag", pd.Timestamp("2024-03-01").date(), 9.0)])
+        changed = self.client.get("/api/series/", {"series": "shop-etag"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+
+class PriceScenarioTests(SimpleTestCase):
+    def test_matches_cell_by_cell_loop(self):
+        forecast = np.array([10.0, 12.0, -3.0, 15.0])
+        prices = price_grid({"min_price": 80, "max_price": 120, "step": 5})
+        result = price_scenarios(prices, forecast, 100, elasticity=-1.2)
+        for i, p in enumerate(prices):
+            for d, f in enumerate(forecast):
+                expected = max(f, 0) * (p / 100) ** -1.2 * p
+                self.assertAlmostEqual(result["revenue"][i, d], expected)
+        self.assertEqual(result["revenue"].shape, (9, 4))
+
+    def test_best_price_follows_elasticity(self):
+        forecast = np.full(7, 20.0)
+        prices = price_grid({"min_price": 50, "max_price": 150, "step": 1})
+        self.assertEqual(len(prices), 101)
+        # Inelastic demand: the highest price wins; elastic demand: the lowest
+        self.assertEqual(prices[price_scenarios(prices, forecast, 100, 0)["best_index"]], 150)
+        self.assertEqual(prices[price_scenarios(prices, forecast, 100, -2)["best_index"]], 50)
+
+    def test_totals_without_surface(self):
+        forecast = np.array([10.0, 12.0, -3.0, 15.0])
+        prices = price_grid({"min_price": 80, "max_price": 120, "step": 5})
+        full = price_scenarios(prices, forecast, 100, elasticity=-1.2)
+        totals = price_scenarios(prices, forecast, 100, elasticity=-1.2, surface=False)
+        self.assertNotIn("revenue", totals)
+        np.testing.assert_allclose(totals["total_revenue"], full["revenue"].sum(axis=1))
+        with self.assertRaises(ValueError):
+            price_scenarios(np.arange(1.0, 1001.0), np.ones(365), 100)
+
+
+class PriceScenarioViewTests(TestCase):
+    def scenarios(self, **body):
+        body = {"min_price": 80, "max_price": 120, "step": 5, **body}
+        return self.client.post("/api/revenue/scenarios/", body, content_type="application/json")
+
+    def test_surface_is_opt_in(self):
+        self.assertNotIn("revenue_surface", self.scenarios().json())
+        self.assertNotIn("revenue_surface", self.scenarios(surface="false").json())
+        self.assertEqual(len(self.scenarios(surface=True).json()["revenue_surface"]), 9)
+        self.assertEqual(self.scenarios(surface="maybe").status_code, 400)
+        self.assertEqual(self.scenarios(step=0.001, surface=True).status_code, 400)  # 40k prices x 7 days
+
+    def test_base_price_defaults_only_when_missing(self):
+        self.assertEqual(self.scenarios().json()["base_price"], 100)  # median of 80..120
+        self.assertEqual(self.scenarios(base_price=90).json()["base_price"], 90)
+        for bad in (0, -5):
+            self.assertEqual(self.scenarios(base_price=bad).status_code, 400)
+
+
+class PredictionIntervalTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.x = np.arange(60, dtype=np.float64)
+        self.y = 30 + 0.4 * self.x + rng.normal(0, 3, len(self.x))
+
+    def reference_interval(self, x_new, confidence):
+        from scipy.stats import t
+        coef = np.polyfit(self.x, self.y, 1)
+        resid = self.y - np.polyval(coef, self.x)
+        s = np.sqrt(resid @ resid / (len(self.x) - 2))
+        se = s * np.sqrt(1 + 1 / len(self.x) + (x_new - self.x.mean()) ** 2 / ((self.x - self.x.mean()) ** 2).sum())
+        half = t.ppf(0.5 + confidence / 2, len(self.x) - 2) * se
+        return np.polyval(coef, x_new) - half, np.polyval(coef, x_new) + half
+
+    def test_matches_residual_formula(self):
+        future = np.arange(60, 425, dtype=np.float64)
+        lower, upper = RunningRegression.fit(self.x, self.y).prediction_interval(future, 0.9)
+        ref_lower, ref_upper = self.reference_interval(future, 0.9)
+        np.testing.assert_allclose(lower, ref_lower, rtol=1e-9)
+        np.testing.assert_allclose(upper, ref_upper, rtol=1e-9)
+
+    def test_batch_intervals_match_single_series(self):
+        skus, days, units = synthetic_sales(5, 90, seed=2)
+        result = batch_trends(skus, days, units, forecast_days=30, confidence=0.95)
+        for i in range(5):
+            mask = skus == result["skus"][i]
+            reg = RunningRegression.fit(days[mask], units[mask])
+            lower, upper = reg.prediction_interval(result["last_day"][i] + np.arange(1, 31), 0.95)
+            np.testing.assert_allclose(result["lower"][i], lower, rtol=1e-9)
+            np.testing.assert_allclose(result["upper"][i], upper, rtol=1e-9)
+
+    def test_horizon_and_dates(self):
+        analysis = analyze_sales(SALES_CSV, horizon=90, confidence=0.8)
+        self.assertEqual(len(analysis["future_dates"]), 90)
+        self.assertEqual(analysis["future_dates"][0], analysis["df"]["date"].max() + pd.Timedelta(days=1))
+        self.assertTrue(np.all(analysis["lower"] < analysis["predicted_future"]))
+        # Intervals widen the further out they go
+        widths = analysis["upper"] - analysis["lower"]
+        self.assertTrue(np.all(np.diff(widths) > 0))
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.csv = os.path.join(self.workdir, "sales.csv")
+        shutil.copy(SALES_CSV, self.csv)
+        self.old_dir = snapshot.SNAPSHOT_DIR
+        snapshot.SNAPSHOT_DIR = os.path.join(self.workdir, "snapshots")
+        self.addCleanup(setattr, snapshot, "SNAPSHOT_DIR", self.old_dir)
+
+    def test_matches_csv_analysis(self):
+        snap = snapshot.open_snapshot(self.csv)
+        self.assertIsInstance(snap.days, np.memmap)
+        from_csv = analyze_sales(self.csv)
+        from_snapshot = analyze_sales(snap)
+
+        self.assertAlmostEqual(from_snapshot["slope"], from_csv["slope"], places=9)
+        self.assertAlmostEqual(from_snapshot["intercept"], from_csv["intercept"], places=6)
+        self.assertEqual(list(from_snapshot["future_dates"]), list(from_csv["future_dates"]))
+        self.assertEqual(from_snapshot["df"]["date"].iloc[-1], from_csv["df"]["date"].iloc[-1])
+        # The date column is converted once per snapshot, not per frame()
+        self.assertIs(snap.date_column(), snap.date_column())
+
+    def test_rebuilds_when_csv_changes(self):
+        first = snapshot.open_snapshot(self.csv)
+        self.assertIs(snapshot.open_snapshot(self.csv), first)
+
+        pd.DataFrame({"date": ["2024-12-30", "2024-12-31"], "units_sold": [3, 4]}).to_csv(self.csv, index=False)
+        second = snapshot.open_snapshot(self.csv)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(str(second.origin), "2024-12-30")
+        self.assertEqual(len(os.listdir(second.directory)), 3)  # old generation removed
+
+    def test_append(self):
+        rows = len(snapshot.open_snapshot(self.csv))
+        snap = snapshot.append_rows(self.csv, [("2026-01-01", 12), ("2026-01-02", 13.5)])
+        self.assertEqual(len(snap), rows + 2)
+        self.assertTrue(snap.meta["sorted"])
+        self.assertEqual(snap.units[-1], np.float32(13.5))
+        self.assertEqual(len(pd.read_csv(self.csv)), rows + 2)
+
+        # An older row lands in the CSV and re-sorts the snapshot on the next open
+        snap = snapshot.append_rows(self.csv, [("2024-06-01", 1)])
+        self.assertEqual(str(snap.origin), "2024-06-01")
+        self.assertEqual(snap.days[0], 0)
+        self.assertTrue(np.all(np.diff(snap.days) >= 0))
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    def test_flags_only_real_slowdowns(self):
+        from benchmarks.suite import compare
+
+        baseline = {"results": {"a": {"median": 0.010}, "b": {"median": 0.0001}, "c": {"median": 0.010}}}
+        current = {"results": {"a": {"median": 0.015}, "b": {"median": 0.0002}, "c": {"median": 0.009}, "new": {"median": 1}}}
+        rows = {row["name"]: row for row in compare(current, baseline, threshold=0.2)}
+        self.assertTrue(rows["a"]["regressed"])
+        self.assertFalse(rows["b"]["regressed"])  # 2x, but below the noise floor
+        self.assertFalse(rows["c"]["regressed"])
+        self.assertNotIn("new", rows)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        from project.metrics import registry
+        registry.reset()
+
+    def test_timed_feeds_histogram(self):
+        from project.metrics import registry, timed
+
+        @timed("unit.decorated")
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        with timed("unit.block"):
+            time.sleep(0.002)
+        text = registry.render()
+        self.assertIn('bookkeeping_stage_seconds_count{stage="unit.decorated"} 1', text)
+        self.assertIn('bookkeeping_stage_seconds_bucket{stage="unit.block",le="+Inf"} 1', text)
+        self.assertIn('bookkeeping_stage_seconds_bucket{stage="unit.block",le="0.001"} 0', text)
+
+    def test_server_timing_header_and_metrics_endpoint(self):
+        response = self.client.post("/api/analyze/")
+        self.assertEqual(response.status_code, 200)
+        header = response["Server-Timing"]
+        self.assertIn("analysis;dur=", header)
+        self.assertTrue(header.endswith(tuple("0123456789")))
+        self.assertIn("total;dur=", header)
+
+        with patch("project.metrics.METRICS_TOKEN", "s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            text = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").content.decode()
+        self.assertIn("# TYPE bookkeeping_http_request_seconds histogram", text)
+        self.assertIn('view="analyze"', text)
+
+    def test_metrics_closed_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with patch("project.metrics.METRICS_PUBLIC", True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_urlconf_does_not_import_heavy_dependencies(self):
+        import subprocess
+        import sys
+
+        probe = (
+            "import os, sys, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings'); "
+            "django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(','.join(m for m in ('pandas', 'matplotlib', 'scipy', 'sklearn', 'langchain', 'groq', 'twilio', 'faiss') if m in sys.modules))"
+        )
+        env = {**os.environ, "CHATBOT_PRELOAD": "0", "OUTBOX_WORKER": "0", "RENDER_PRELOAD": "0"}
+        result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "")
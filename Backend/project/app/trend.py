@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class RunningRegression:
+    # Simple linear regression y = intercept + slope * x kept as running
+    # centered statistics (n, mean x, mean y, Sxx, Syy, Sxy), updated the
+    # Welford way. Appending observations is O(1) and slope, intercept and R²
+    # are read straight off them - no refit needed. Unlike raw power sums
+    # (Σx² - (Σx)²/n) nothing cancels, so long histories keep full precision.
+    def __init__(self):
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.ssx = 0.0
+        self.ssy = 0.0
+        self.spxy = 0.0
+
+    @classmethod
+    def fit(cls, x, y):
+        # Full refit from arrays (the fallback when history is rewritten)
+        reg = cls()
+        reg.extend(x, y)
+        return reg
+
+    # === Updates ===
+    def add(self, x, y):
+        x, y = float(x), float(y)
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.ssx += dx * (x - self.mean_x)
+        self.ssy += dy * (y - self.mean_y)
+        self.spxy += dx * (y - self.mean_y)
+
+    def extend(self, x, y):
+        # The batch's own centered statistics, merged in (Chan et al.)
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if len(x) != len(y):
+            raise ValueError("x and y must have the same length")
+        if len(x) == 0:
+            return
+        n_b = len(x)
+        mean_xb, mean_yb = x.mean(), y.mean()
+        cx, cy = x - mean_xb, y - mean_yb
+
+        n = self.n + n_b
+        dx = mean_xb - self.mean_x
+        dy = mean_yb - self.mean_y
+        weight = self.n * n_b / n
+        self.ssx += cx @ cx + dx * dx * weight
+        self.ssy += cy @ cy + dy * dy * weight
+        self.spxy += cx @ cy + dx * dy * weight
+        self.mean_x += dx * n_b / n
+        self.mean_y += dy * n_b / n
+        self.n = n
+
+    # === Fit ===
+    @property
+    def slope(self):
+        ssx = self.ssx
+        return self.spxy / ssx if ssx > 0 else 0.0
+
+    @property
+    def intercept(self):
+        return self.mean_y - self.slope * self.mean_x if self.n else 0.0
+
+    @property
+    def sse(self):
+        # Residual sum of squares, from the sums alone
+        return max(self.ssy - self.slope * self.spxy, 0.0)
+
+    @property
+    def r2(self):
+        ssy = self.ssy
+        if ssy <= 0:
+            # Constant y: a flat line fits it perfectly (matches sklearn's score)
+            return 1.0
+        return 1.0 - self.sse / ssy
+
+    def predict(self, x):
+        return self.intercept + self.slope * np.asarray(x, dtype=np.float64)
+
+    def prediction_interval(self, x, confidence=0.95):
+        # Closed form from the sums, no refit and no residuals kept:
+        # y_hat ± t(n-2) * s * sqrt(1 + 1/n + (x - mean_x)² / Sxx), s² = SSE / (n-2)
+        from scipy.stats import t
+
+        x = np.asarray(x, dtype=np.float64)
+        predicted = self.predict(x)
+        if self.n < 3 or self.ssx <= 0:
+            undefined = np.full(x.shape, np.nan)
+            return undefined, undefined.copy()
+
+        s = np.sqrt(self.sse / (self.n - 2))
+        half = (x - self.mean_x) ** 2
+        half /= self.ssx
+        half += 1.0 + 1.0 / self.n
+        np.sqrt(half, out=half)
+        half *= t.ppf(0.5 + confidence / 2, self.n - 2) * s
+        return predicted - half, predicted + half
+
+    def to_dict(self):
+        return {"slope": self.slope, "intercept": self.intercept, "r2": self.r2, "n": self.n}
+
+
+def rounded_list(values, decimals=2):
+    # JSON-safe list: NaN/inf (e.g. an interval from too few points) become null
+    values = np.round(np.asarray(values, dtype=np.float64), decimals)
+    return [v if np.isfinite(v) else None for v in values.tolist()]
@@ -4,8 +4,15 @@ from . import views
 
 urlpatterns = [
     path("analyze/", views.analyze_view, name="analyze"),
+    path("analyze/batch/", views.analyze_batch_view, name="analyze_batch"),
+    path("ingest/", views.ingest_view, name="ingest"),
     path("price/", views.price_view, name="price"),
     path("revenue/", views.revenue_view, name="revenue"),
+    path("revenue/scenarios/", views.revenue_scenarios_view, name="revenue_scenarios"),
     path("plot/trend/", views.plot_trend_view, name="plot_trend"),
     path("plot/forecast/", views.plot_forecast_view, name="plot_forecast"),
+    path("plot/trend/image/", views.plot_trend_image_view, name="plot_trend_image"),
+    path("plot/forecast/image/", views.plot_forecast_image_view, name="plot_forecast_image"),
+    path("series/", views.series_view, name="series"),
+    path("cache/stats/", views.analysis_cache_stats_view, name="analysis_cache_stats"),
 ]
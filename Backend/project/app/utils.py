@@ -1,41 +1,79 @@
-import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 from datetime import timedelta
-import matplotlib.pyplot as plt
 import io
 import base64
+from .trend import RunningRegression
+from .snapshot import Snapshot
+from project.metrics import timed
 
-# === 1. Analyze Sales ===
-def analyze_sales(csv_path):
-    df = pd.read_csv(csv_path)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date")
-
-    first_date = df["date"].min()
-    df["days"] = (df["date"] - first_date).dt.days
+FORECAST_DAYS = 7
+MAX_FORECAST_DAYS = 365
+CONFIDENCE = 0.95
 
-    X = df["days"].values.reshape(-1, 1)
+# === 1. Analyze Sales ===
+def sales_frame(source):
+    # source: path to a date,units_sold CSV, a DataFrame with those columns,
+    # or a memory-mapped Snapshot (already parsed, sorted and day-indexed)
+    # -> date / units_sold / days, sorted by date
+    import pandas as pd
+
+    prepared = isinstance(source, Snapshot)
+    if isinstance(source, pd.DataFrame):
+        df = source.copy()
+    elif prepared:
+        with timed("snapshot.load"):
+            df = source.frame()
+    else:
+        with timed("csv.parse"):
+            df = pd.read_csv(source)
+    if df.empty:
+        raise ValueError("No sales data to analyze")
+
+    if not prepared:
+        df["date"] = pd.to_datetime(df["date"])
+        df = df.sort_values("date")
+        first_date = df["date"].min()
+        df["days"] = (df["date"] - first_date).dt.days
+    return df
+
+
+def analyze_sales(source, horizon=FORECAST_DAYS, confidence=CONFIDENCE):
+    df = sales_frame(source)
+    X = df["days"].values
     y = df["units_sold"].values
 
-    model = LinearRegression()
-    model.fit(X, y)
-
-    slope = model.coef_[0]
-    intercept = model.intercept_
+    # Closed-form fit from running sums (same result as sklearn's LinearRegression)
+    with timed("analyze.fit"):
+        model = RunningRegression.fit(X, y)
 
-    future_days = np.array(range(X[-1][0] + 1, X[-1][0] + 8)).reshape(-1, 1)
-    future_dates = [df["date"].max() + timedelta(days=i) for i in range(1, 8)]
-    predicted_future = model.predict(future_days)
+    slope = model.slope
+    intercept = model.intercept
 
     return {
         "slope": slope,
         "intercept": intercept,
-        "r2": model.score(X, y),
+        "r2": model.r2,
         "df": df,
         "fitted_line": model.predict(X),
-        "future_dates": future_dates,
-        "predicted_future": predicted_future,
+        "model": model,
+        **forecast_sales(model, df["date"].iloc[-1], X[-1], horizon, confidence),
+    }
+
+
+@timed("analyze.forecast")
+def forecast_sales(model, last_date, last_day, horizon=FORECAST_DAYS, confidence=CONFIDENCE):
+    # O(horizon) from an existing fit: any horizon/confidence without refitting
+    import pandas as pd
+
+    future_days = last_day + np.arange(1, horizon + 1)
+    lower, upper = model.prediction_interval(future_days, confidence)
+    return {
+        "future_dates": pd.date_range(last_date + timedelta(days=1), periods=horizon, freq="D"),
+        "predicted_future": model.predict(future_days),
+        "lower": lower,
+        "upper": upper,
+        "horizon": horizon,
+        "confidence": confidence,
     }
 
 # === 2. Suggest Price ===
@@ -48,61 +86,81 @@ def suggest_price(base_price, slope):
         return round(base_price, 2)  # stable → no change
 
 # === 3. Plot Historical + Forecast ===
-def plot_sales(df, fitted_line, future_dates, predicted_future):
-    plt.figure(figsize=(10, 5))  # New figure
+# Figures are built with the object-oriented API (Figure + Agg canvas) instead
+# of pyplot, so nothing touches pyplot's global "current figure": concurrent
+# renders in threads or pool workers cannot draw onto each other's images.
+# matplotlib is imported on first render, not when the URLconf loads.
+def render_sales(df, fitted_line, future_dates, predicted_future, lower=None, upper=None, figsize=(10, 5), dpi=150, fmt="png"):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)  # New figure
+    ax = fig.subplots()
 
     # Past: Actual sales
-    plt.plot(df["date"], df["units_sold"], label="Actual Sales", marker="o", color="blue")
+    ax.plot(df["date"], df["units_sold"], label="Actual Sales", marker="o", color="blue")
     
     # Past: Fitted trend line
-    plt.plot(df["date"], fitted_line, label="Trend Line", linestyle="--", color="orange")
+    ax.plot(df["date"], fitted_line, label="Trend Line", linestyle="--", color="orange")
     
     # Future: Predictions
-    plt.plot(future_dates, predicted_future, label="Forecast", linestyle="-.", marker="x", color="red")
+    ax.plot(future_dates, predicted_future, label="Forecast", linestyle="-.", marker="x", color="red")
+    if lower is not None:
+        ax.fill_between(future_dates, lower, upper, color="red", alpha=0.15, label="Prediction Interval")
 
-    plt.xlabel("Date")
-    plt.ylabel("Units Sold")
-    plt.title("Sales Trend & Forecast")
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Units Sold")
+    ax.set_title("Sales Trend & Forecast")
+    ax.legend()
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
 
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150, bbox_inches="tight")
-    buf.seek(0)
-    img_str = base64.b64encode(buf.read()).decode("utf-8")
+    return save_figure(fig, dpi, fmt)
 
-    # ✅ Cleanup
-    buf.close()
-    plt.close()  # Critical: close figure to avoid overlap
 
-    return img_str
+def plot_sales(df, fitted_line, future_dates, predicted_future):
+    # Base64 PNG for the JSON endpoints
+    return base64.b64encode(render_sales(df, fitted_line, future_dates, predicted_future)).decode("utf-8")
 
 # === 4. Plot Predicted Week Only ===
-def plot_predicted_week(future_dates, predicted_future):
-    plt.figure(figsize=(8, 4))  # Fresh figure
+def render_predicted_week(future_dates, predicted_future, lower=None, upper=None, figsize=(8, 4), dpi=150, fmt="png"):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)  # Fresh figure
+    ax = fig.subplots()
+
+    ax.plot(future_dates, predicted_future, color="green", marker="o" if len(predicted_future) <= 31 else None, linestyle="-", linewidth=2)
+    if lower is not None:
+        ax.fill_between(future_dates, lower, upper, color="green", alpha=0.15)
 
-    plt.plot(future_dates, predicted_future, color="green", marker="o", linestyle="-", linewidth=2)
+    # Annotate values above points (only while they stay readable)
+    if len(predicted_future) <= 14:
+        for i, val in enumerate(predicted_future):
+            ax.text(future_dates[i], val + max(predicted_future)*0.01, f"{val:.1f}",
+                    ha="center", va="bottom", fontsize=9, fontweight="bold")
+
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Predicted Units Sold")
+    ax.set_title(f"Predicted Sales: Next {len(predicted_future)} Days")
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+
+    return save_figure(fig, dpi, fmt)
+
+
+def plot_predicted_week(future_dates, predicted_future):
+    return base64.b64encode(render_predicted_week(future_dates, predicted_future)).decode("utf-8")
 
-    # Annotate values above points
-    for i, val in enumerate(predicted_future):
-        plt.text(future_dates[i], val + max(predicted_future)*0.01, f"{val:.1f}",
-                 ha="center", va="bottom", fontsize=9, fontweight="bold")
 
-    plt.xlabel("Date")
-    plt.ylabel("Predicted Units Sold")
-    plt.title("Predicted Sales: Next 7 Days")
-    plt.grid(True, alpha=0.3)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+@timed("plot.encode")
+def save_figure(fig, dpi, fmt):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
     buf = io.BytesIO()
-    plt.savefig(buf, format="png", dpi=150, bbox_inches="tight")
-    buf.seek(0)
-    img_str = base64.b64encode(buf.read()).decode("utf-8")
+    FigureCanvasAgg(fig).print_figure(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+    data = buf.getvalue()
 
-    # ✅ Cleanup
+    # ✅ Cleanup: the figure is local, so it is freed with the last reference
     buf.close()
-    plt.close()  # Prevents second plot from affecting others
 
-    return img_str
\ No newline at end of file
+    return data
@@ -1,31 +1,158 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
-import pandas as pd
 import numpy as np
+import base64
 import json
-from .utils import analyze_sales, suggest_price, plot_sales, plot_predicted_week
+import os
+from .utils import CONFIDENCE, FORECAST_DAYS, MAX_FORECAST_DAYS, analyze_sales, forecast_sales, sales_frame, suggest_price, render_sales, render_predicted_week
+from .trend import rounded_list
+from .ingest import DEFAULT_SERIES, UnknownSeries, ingest_rows, iter_rows, load_all_frame, load_series_frame
+from .batch import analyze_batch, batch_to_columns
+from .analysis_cache import all_series_version, analysis_cache, analysis_key, file_fingerprint, series_version
+from .plot_cache import CONTENT_TYPES, plot_cache, plot_etag
+from .downsample import DOWNSAMPLE_METHODS, series_columns
+from .render_pool import RenderBusy, RenderTimeout, render_pool
+from .snapshot import SNAPSHOT_ENABLED, open_snapshot
+from .scenarios import price_grid, price_scenarios, scenarios_to_json
+from project.metrics import timed
 
-LAST_ANALYSIS = {}  # cache results
+# Fallback data source while nothing has been ingested into the database
+CSV_PATH = os.getenv("SALES_CSV_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_data.csv"))
 
-CSV_PATH = r"F:\projects\Bookkeeping\Backend\project\app\sales_data.csv"
+UPLOAD_FORMATS = {
+    "text/csv": "csv",
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def request_options(request):
+    # JSON body (if any) merged over the query string
+    options = request.GET.dict()
+    if request.content_type == "application/json" and request.body:
+        options.update(json.loads(request.body))
+    return options
+
+
+def parse_flag(value, name):
+    # JSON true/false, or "true"/"false"/"1"/"0" from a query string; "false" is not truthy
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "1", "yes"):
+        return True
+    if str(value).lower() in ("false", "0", "no", ""):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def forecast_options(options):
+    # ?horizon= days ahead (1..365), ?confidence= interval level (e.g. 0.8, 0.95)
+    horizon = int(options.get("horizon", FORECAST_DAYS))
+    confidence = float(options.get("confidence", CONFIDENCE))
+    if not 1 <= horizon <= MAX_FORECAST_DAYS:
+        raise ValueError(f"horizon must be between 1 and {MAX_FORECAST_DAYS} days")
+    if not 0.5 <= confidence < 1:
+        raise ValueError("confidence must be between 0.5 and 1")
+    return horizon, confidence
+
+
+def csv_source(path):
+    # The memory-mapped snapshot of the CSV (rebuilt when the file changes);
+    # plain CSV parsing if snapshots are off or cannot be written here
+    if not SNAPSHOT_ENABLED:
+        return path
+    try:
+        return open_snapshot(path)
+    except OSError as e:
+        print(f"⚠️ Sales snapshot unavailable, parsing CSV: {e!r}")
+        return path
+
+
+def analysis_plan(options):
+    # Analysis results live in the shared cache under a key derived from the
+    # input data (series + ingest version + range, or the CSV's fingerprint),
+    # so every worker process sees the same result and computes it at most once.
+    # -> (key, run): the key costs one version lookup (or a stat), so views can
+    # answer conditional requests from it; run() reads or computes the analysis.
+    # Bad parameters are rejected before any cache lookup or computation
+    horizon, confidence = forecast_options(options)
+    series = options.get("series", DEFAULT_SERIES)
+    start, end = options.get("start"), options.get("end")
+
+    version = series_version(series)
+    if version:
+        descriptor = {"series": series, "version": version, "start": start, "end": end}
+        def load():
+            with timed("db.load"):
+                return load_series_frame(series, start, end)
+    elif series == DEFAULT_SERIES:
+        # Database first; the bundled CSV stands in for the default series
+        # until it is ingested
+        descriptor = {"csv": file_fingerprint(CSV_PATH)}
+        load = lambda: csv_source(CSV_PATH)
+    else:
+        raise UnknownSeries(f"No sales data ingested for series '{series}'")
+
+    key = analysis_key("sales", descriptor)
+
+    def compute():
+        # Only the fit and its summary are cached, never the frame: views that
+        # draw the data rebuild it from the snapshot or database (run(with_frame=True))
+        analysis = analyze_sales(load())
+        df = analysis["df"]
+        summary = {name: analysis[name] for name in ("slope", "intercept", "r2", "model")}
+        return {**summary, "last_date": df["date"].iloc[-1], "last_day": int(df["days"].iloc[-1])}
+
+    def run(with_frame=False):
+        with timed("analysis"):
+            analysis = analysis_cache.get_or_compute(key, compute)
+        # The cached fit serves every horizon: only the O(horizon) forecast is per request
+        result = {**analysis, **forecast_sales(analysis["model"], analysis["last_date"], analysis["last_day"], horizon, confidence)}
+        if with_frame:
+            df = sales_frame(load())
+            result.update(df=df, fitted_line=analysis["model"].predict(df["days"].values))
+        return result
+
+    return f"{key}:h{horizon}:c{confidence}", run
+
+
+def get_analysis(options):
+    key, run = analysis_plan(options)
+    return key, run()
+
+
+def error_response(e):
+    # A series that was never ingested is a 404, anything else bad input
+    return JsonResponse({"error": str(e)}, status=404 if isinstance(e, UnknownSeries) else 400)
+
+
+def forecast_json(analysis):
+    return {
+        "horizon": analysis["horizon"],
+        "confidence": analysis["confidence"],
+        "dates": [d.date().isoformat() for d in analysis["future_dates"]],
+        "predicted": rounded_list(analysis["predicted_future"]),
+        "lower": rounded_list(analysis["lower"]),
+        "upper": rounded_list(analysis["upper"]),
+    }
 
 @csrf_exempt
 def analyze_view(request):
     if request.method == "POST":
         try:
-            # ✅ Pass the CSV path directly to analyze_sales
-            results = analyze_sales(CSV_PATH)  # <-- This is correct
-            global LAST_ANALYSIS
-            LAST_ANALYSIS = results
+            _, results = get_analysis(request_options(request))
 
             return JsonResponse({
                 "slope": float(results["slope"]),
                 "intercept": float(results["intercept"]),
                 "r2": float(results["r2"]),
+                "forecast": forecast_json(results),
             })
 
         except Exception as e:
-            return JsonResponse({"error": str(e)}, status=400)
+            return error_response(e)
 
     return JsonResponse({"error": "Only POST allowed"}, status=405)
 
@@ -33,13 +160,12 @@ def analyze_view(request):
 def price_view(request):
     if request.method == "POST":
         try:
-            body = json.loads(request.body)
+            body = json.loads(request.body or "{}")
             base_price = float(body.get("base_price", 100))
 
-            if not LAST_ANALYSIS:
-                return JsonResponse({"error": "Run /analyze/ first"}, status=400)
+            _, analysis = get_analysis(body)
 
-            slope = LAST_ANALYSIS["slope"]
+            slope = analysis["slope"]
             suggested = suggest_price(base_price, slope)
 
             return JsonResponse({
@@ -49,48 +175,149 @@ def price_view(request):
             })
 
         except Exception as e:
-            return JsonResponse({"error": str(e)}, status=400)
+            return error_response(e)
 
     return JsonResponse({"error": "Only POST allowed"}, status=405)
 
 
-def plot_trend_view(request):
-    if not LAST_ANALYSIS:
-        return JsonResponse({"error": "Run /analyze/ first"}, status=400)
-
-    img = plot_sales(
-        LAST_ANALYSIS["df"],
-        LAST_ANALYSIS["fitted_line"],
-        LAST_ANALYSIS["future_dates"],
-        LAST_ANALYSIS["predicted_future"],
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def plot_params(request, default_size):
+    # ?width=&height= (inches), ?dpi=, ?format=png|webp
+    width = clamp(float(request.GET.get("width", default_size[0])), 2, 20)
+    height = clamp(float(request.GET.get("height", default_size[1])), 2, 20)
+    dpi = int(clamp(int(request.GET.get("dpi", 150)), 50, 300))
+    fmt = request.GET.get("format", "png")
+    if fmt not in CONTENT_TYPES:
+        fmt = "png"
+    return (width, height), dpi, fmt
+
+
+def serve_plot(request, plot_type, default_size, render, as_image, with_frame=False):
+    try:
+        figsize, dpi, fmt = plot_params(request, default_size)
+        key, run_analysis = analysis_plan(request.GET.dict())
+    except Exception as e:
+        return error_response(e)
+    if not as_image:
+        fmt = "png"  # the JSON variant has always been base64 PNG
+
+    # Unchanged data -> same ETag -> 304 without analysing, rendering or even a cache read
+    cache_key = (key, plot_type, figsize, dpi, fmt)
+    etag = plot_etag(cache_key + ("image" if as_image else "json",))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+
+    try:
+        analysis = run_analysis(with_frame=with_frame)
+    except Exception as e:
+        return error_response(e)
+    try:
+        with timed("plot.render"):
+            data = plot_cache.get_or_render(cache_key, lambda: render(analysis, figsize, dpi, fmt))
+    except RenderBusy as e:
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = "1"
+        return response
+    except RenderTimeout as e:
+        return JsonResponse({"error": str(e)}, status=504)
+    if as_image:
+        response = HttpResponse(data, content_type=CONTENT_TYPES[fmt])
+    else:
+        response = JsonResponse({"plot": base64.b64encode(data).decode("utf-8")})
+
+    response["ETag"] = etag
+    patch_cache_control(response, no_cache=True)  # always revalidate, usually a 304
+    return response
+
+
+# Rendering runs in the render pool's worker processes; only the columns the
+# plot needs are sent over
+def render_trend(analysis, figsize, dpi, fmt):
+    return render_pool.render(
+        render_sales,
+        analysis["df"][["date", "units_sold"]],
+        analysis["fitted_line"],
+        analysis["future_dates"],
+        analysis["predicted_future"],
+        analysis["lower"],
+        analysis["upper"],
+        figsize=figsize, dpi=dpi, fmt=fmt,
     )
-    return JsonResponse({"plot": img})
+
+
+def render_forecast(analysis, figsize, dpi, fmt):
+    return render_pool.render(
+        render_predicted_week,
+        analysis["future_dates"],
+        analysis["predicted_future"],
+        analysis["lower"],
+        analysis["upper"],
+        figsize=figsize, dpi=dpi, fmt=fmt,
+    )
+
+
+def plot_trend_view(request):
+    return serve_plot(request, "trend", (10, 5), render_trend, as_image=False, with_frame=True)
 
 
 def plot_forecast_view(request):
-    if not LAST_ANALYSIS:
-        return JsonResponse({"error": "Run /analyze/ first"}, status=400)
+    return serve_plot(request, "forecast", (8, 4), render_forecast, as_image=False)
 
-    img = plot_predicted_week(
-        LAST_ANALYSIS["future_dates"],
-        LAST_ANALYSIS["predicted_future"],
-    )
-    return JsonResponse({"plot": img})
+
+def plot_trend_image_view(request):
+    return serve_plot(request, "trend", (10, 5), render_trend, as_image=True, with_frame=True)
+
+
+def plot_forecast_image_view(request):
+    return serve_plot(request, "forecast", (8, 4), render_forecast, as_image=True)
+
+
+def series_view(request):
+    # Chart data for the frontend to draw itself: ?points=1000&method=lttb|minmax|none
+    # &encoding=json|binary (binary = base64 little-endian typed arrays)
+    try:
+        points = int(clamp(int(request.GET.get("points", 1000)), 10, 5000))
+        method = request.GET.get("method", "lttb")
+        encoding = request.GET.get("encoding", "json")
+        if method not in DOWNSAMPLE_METHODS:
+            return JsonResponse({"error": f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}"}, status=400)
+        key, run_analysis = analysis_plan(request.GET.dict())
+    except Exception as e:
+        return error_response(e)
+
+    etag = plot_etag((key, "series", points, method, encoding))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["ETag"] = etag
+        return not_modified
+
+    try:
+        analysis = run_analysis(with_frame=True)
+    except Exception as e:
+        return error_response(e)
+    response = JsonResponse(series_columns(analysis, points, method, encoding))
+    response["ETag"] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
 @csrf_exempt
 def revenue_view(request):
     if request.method == "POST":
         try:
-            body = json.loads(request.body)
+            body = json.loads(request.body or "{}")
             base_price = float(body.get("base_price", 0))
 
-            if not LAST_ANALYSIS:
-                return JsonResponse({"error": "Run /analyze/ first"}, status=400)
+            _, analysis = get_analysis(body)
 
-            slope = LAST_ANALYSIS["slope"]
+            slope = analysis["slope"]
             suggested = suggest_price(base_price, slope)
-            predicted_future = LAST_ANALYSIS["predicted_future"]
+            predicted_future = analysis["predicted_future"]
 
             revenue_base = float(np.sum(predicted_future) * base_price)
             revenue_suggested = float(np.sum(predicted_future) * suggested)
@@ -100,11 +327,119 @@ def revenue_view(request):
                 "suggested_price": suggested,
                 "revenue_base_price": round(revenue_base, 2),
                 "revenue_suggested_price": round(revenue_suggested, 2),
+                "forecast_days": len(predicted_future),
             })
 
+        except Exception as e:
+            return error_response(e)
+
+    return JsonResponse({"error": "Only POST allowed"}, status=405)
+
+
+@csrf_exempt
+def revenue_scenarios_view(request):
+    # Revenue for every candidate price x forecast day in one pass.
+    # Body: {"prices": [...]} or {"min_price", "max_price", "step"}, plus optional
+    # "base_price" (the current price, demand reference), "elasticity" and
+    # "surface": true for the per-day revenue of every price (capped in size).
+    if request.method == "POST":
+        try:
+            body = json.loads(request.body or "{}")
+            prices = price_grid(body)
+            elasticity = float(body.get("elasticity", 0))
+            # The median candidate only when no base_price was sent: an explicit 0 is an error
+            base_price = float(body["base_price"]) if "base_price" in body else float(np.median(prices))
+            if base_price <= 0:
+                return JsonResponse({"error": "base_price must be positive"}, status=400)
+
+            surface = parse_flag(body.get("surface", False), "surface")
+
+            _, analysis = get_analysis(body)
+            result = price_scenarios(prices, analysis["predicted_future"], base_price, elasticity, surface)
+
+            payload = scenarios_to_json(result)
+            payload.update({
+                "base_price": base_price,
+                "suggested_price": suggest_price(base_price, analysis["slope"]),
+                "elasticity": elasticity,
+                "forecast_days": len(analysis["predicted_future"]),
+            })
+            return JsonResponse(payload)
+
+        except Exception as e:
+            return error_response(e)
+
+    return JsonResponse({"error": "Only POST allowed"}, status=405)
+
+
+@csrf_exempt
+def ingest_view(request):
+    # Bulk upload of sales rows: multipart "file" field or a raw CSV/JSON body.
+    # Rows are parsed and upserted in batches straight from the stream, all or nothing.
+    if request.method == "POST":
+        try:
+            default_series = request.GET.get("series", DEFAULT_SERIES)
+            upload = request.FILES.get("file")
+            if upload is not None:
+                fmt = request.GET.get("format") or os.path.splitext(upload.name)[1].lstrip(".").lower()
+                stream = upload.file
+            else:
+                fmt = request.GET.get("format") or UPLOAD_FORMATS.get(request.content_type)
+                stream = request
+
+            if not fmt:
+                return JsonResponse({"error": "Send a CSV or JSON file, or set ?format=csv|json|ndjson"}, status=400)
+
+            result = ingest_rows(iter_rows(stream, fmt, default_series))
+            return JsonResponse(result)
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({"error": "Only POST allowed"}, status=405)
+
+
+@csrf_exempt
+def analyze_batch_view(request):
+    # Trend, suggested price and forecast for every SKU in one vectorized pass.
+    # Uses an uploaded long-format CSV (sku|series, date, units_sold) if given,
+    # otherwise everything ingested into the database.
+    if request.method == "POST":
+        try:
+            upload = request.FILES.get("file")
+            if upload is not None:
+                options = request.POST.dict()
+                import pandas as pd
+                df = pd.read_csv(upload)
+                if df.empty:
+                    return JsonResponse({"error": "No sales data to analyze"}, status=400)
+                horizon, confidence = forecast_options(options)
+                result = analyze_batch(df, float(options.get("base_price", 100)), horizon, confidence)
+                return JsonResponse(batch_to_columns(result))
+
+            options = request_options(request)
+            start, end = options.get("start"), options.get("end")
+            base_price = float(options.get("base_price", 100))
+            horizon, confidence = forecast_options(options)
+
+            def compute():
+                df = load_all_frame(start, end)
+                if df.empty:
+                    raise ValueError("No sales data to analyze")
+                return batch_to_columns(analyze_batch(df, base_price, horizon, confidence))
+
+            descriptor = {
+                "version": all_series_version(), "start": start, "end": end,
+                "base_price": base_price, "horizon": horizon, "confidence": confidence,
+            }
+            columns = analysis_cache.get_or_compute(analysis_key("batch", descriptor), compute)
+            return JsonResponse(columns)
+
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=400)
 
     return JsonResponse({"error": "Only POST allowed"}, status=405)
 
 
+def analysis_cache_stats_view(request):
+    return JsonResponse({"analysis": analysis_cache.stats(), "plots": plot_cache.stats(), "render": render_pool.stats()})
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Deterministic synthetic inputs: same seed -> same data on every machine
+
+
+def sales_series(rows, seed=0, start="2000-01-01"):
+    # One series, one row per day: trend + weekly seasonality + noise
+    rng = np.random.default_rng(seed)
+    days = np.arange(rows)
+    units = 100 + 0.05 * days + 15 * np.sin(2 * np.pi * days / 7) + rng.normal(0, 8, rows)
+    return pd.DataFrame({
+        "date": pd.date_range(start, periods=rows, freq="D"),
+        "units_sold": np.maximum(units, 0).round(),
+    })
+
+
+def sales_panel(rows, skus, seed=0):
+    # Long format (sku, day, units) arrays for the batch path. SKUs are integer
+    # codes so 1e7-row panels stay a few hundred MB.
+    rng = np.random.default_rng(seed)
+    per_sku = max(rows // skus, 2)
+    sku = np.repeat(np.arange(skus, dtype=np.int32), per_sku)
+    day = np.tile(np.arange(per_sku, dtype=np.int32), skus)
+    trend = rng.normal(0, 0.3, skus)[sku]
+    base = rng.uniform(20, 200, skus)[sku]
+    units = base + trend * day + rng.normal(0, 5, len(sku))
+    return sku, day, units
+
+
+def faq_chunks(n, seed=0):
+    # Index chunks shaped like the real FAQ: short paragraphs with shared vocabulary
+    rng = np.random.default_rng(seed)
+    topics = ["collection", "recycling", "pickup", "billing", "route", "bins", "compost", "e-waste"]
+    places = ["Nairobi", "Kisumu", "Mombasa", "Nakuru", "Eldoret", "Thika"]
+    chunks = []
+    for i in range(n):
+        topic = topics[rng.integers(len(topics))]
+        place = places[rng.integers(len(places))]
+        chunks.append({
+            "content": f"Document {i}: {topic} schedule for {place} zone {i % 97}. "
+                       f"Our {topic} team visits {place} every {1 + i % 6} days.",
+            "metadata": {"page": i},
+        })
+    return chunks
+
+
+def question(i):
+    # Distinct question per i, so every call is a cache miss
+    return f"When is the {['collection', 'recycling', 'pickup'][i % 3]} in zone {i} number {i * 7919}?"
@@ -0,0 +1,164 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+# Offline stand-ins for Groq (OpenAI-compatible chat completions), the Express
+# order endpoint and Twilio's Messages API, all on one local HTTP server.
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+    # Headers and body go out as separate writes; without TCP_NODELAY every
+    # keep-alive response would wait ~40ms on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        server = self.server
+        server.requests += 1
+
+        if self.path.endswith("/chat/completions"):
+            server.completions += 1
+            time.sleep(server.llm_latency)
+            request = json.loads(body)
+            prompt = request["messages"][-1]["content"]
+            answer = f"Fake answer ({len(prompt)} prompt chars)"
+            if request.get("stream"):
+                self.stream_answer(answer)
+                return
+            payload = {
+                "id": f"chatcmpl-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 5, "total_tokens": len(prompt) // 4 + 5},
+            }
+            self.reply(200, payload)
+        elif self.path.startswith("/express"):
+            time.sleep(server.express_latency)
+            self.reply(200, {"ok": True})
+        elif self.path.startswith("/twilio"):
+            self.reply(201, {"sid": f"SM{server.requests}"})
+        else:
+            self.reply(404, {"error": "unknown path"})
+
+    def stream_answer(self, answer):
+        # OpenAI-style SSE: one chat.completion.chunk per word, then [DONE],
+        # sent as separate HTTP chunks with token_delay between them
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"chatcmpl-{self.server.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                             "finish_reason": "stop" if i == len(words) - 1 else None}],
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(self.server.token_delay)
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServices(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, llm_latency=0.0, express_latency=0.0, token_delay=0.0):
+        super().__init__(("127.0.0.1", 0), FakeServicesHandler)
+        self.llm_latency = llm_latency
+        self.express_latency = express_latency
+        self.token_delay = token_delay
+        self.requests = 0
+        self.completions = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@contextmanager
+def fake_services(llm_latency=0.0, express_latency=0.0, token_delay=0.0):
+    # Points the Groq SDK, the outbox and the Twilio sender at the local fakes
+    from chatapp import outbound, outbox
+    from chatapp.chatbot import llm
+
+    server = FakeServices(llm_latency, express_latency, token_delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    saved_env = {k: os.environ.get(k) for k in ("GROQ_BASE_URL", "GROQ_API_KEY")}
+    saved = (outbox.EXPRESS_ORDER_ENDPOINT, outbound.TWILIO_MESSAGES_URL,
+             outbound.TWILIO_ACCOUNT_SID, outbound.TWILIO_AUTH_TOKEN)
+    os.environ["GROQ_BASE_URL"] = server.url
+    os.environ["GROQ_API_KEY"] = "fake"
+    outbox.EXPRESS_ORDER_ENDPOINT = f"{server.url}/express"
+    outbound.TWILIO_MESSAGES_URL = server.url + "/twilio/{sid}/Messages.json"
+    outbound.TWILIO_ACCOUNT_SID, outbound.TWILIO_AUTH_TOKEN = "ACfake", "fake"
+    llm.reset_clients()  # clients bound to the real base URL
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        (outbox.EXPRESS_ORDER_ENDPOINT, outbound.TWILIO_MESSAGES_URL,
+         outbound.TWILIO_ACCOUNT_SID, outbound.TWILIO_AUTH_TOKEN) = saved
+        llm.reset_clients()
+
+
+@contextmanager
+def fake_retriever(chunks, workdir):
+    # Builds a FAISS index over `chunks` with the offline hash embedder and
+    # swaps it (plus an empty answer cache) into the retrieval module
+    from chatapp.chatbot import retrieval
+    from chatapp.chatbot.answer_cache import AnswerCache
+    from chatapp.chatbot.fakes import HashEmbeddings
+    from chatapp.chatbot.service import RetrieverService
+    from chatapp.chatbot.vectorstore import build_index
+
+    index_dir = os.path.join(workdir, "faiss_index")
+    build_index(chunks, HashEmbeddings(), index_dir)
+    service = RetrieverService(index_dir=index_dir, embeddings=HashEmbeddings())
+    service.get()
+    cache = AnswerCache(path=os.path.join(workdir, "answer_cache.json"), save_seconds=1e9)
+
+    saved = (retrieval.retriever_service, retrieval.answer_cache)
+    retrieval.retriever_service, retrieval.answer_cache = service, cache
+    try:
+        yield service, cache
+    finally:
+        retrieval.retriever_service, retrieval.answer_cache = saved
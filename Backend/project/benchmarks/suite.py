@@ -0,0 +1,225 @@
+from contextlib import ExitStack, redirect_stdout
+import numpy as np
+import platform
+import tempfile
+import datetime
+import json
+import time
+import io
+import os
+
+from . import data
+from .fakes import fake_retriever, fake_services
+
+# Each case runs at least MIN_RUNS times and then until its time budget is spent
+MIN_RUNS = 5
+MAX_RUNS = 1000
+CASE_BUDGET_SECONDS = 1.0
+
+# compare(): slower than baseline by more than this fraction AND by more than
+# NOISE_FLOOR seconds counts as a regression
+REGRESSION_THRESHOLD = 0.2
+NOISE_FLOOR = 0.0005
+
+SCALES = ("quick", "full")
+
+
+def measure(fn, budget=CASE_BUDGET_SECONDS):
+    fn()  # warm-up: imports, caches, first-touch allocations
+    timings = []
+    deadline = time.perf_counter() + budget
+    while len(timings) < MIN_RUNS or (len(timings) < MAX_RUNS and time.perf_counter() < deadline):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings)
+    return {
+        "runs": len(timings),
+        "min": float(timings.min()),
+        "median": float(np.median(timings)),
+        "p95": float(np.percentile(timings, 95)),
+        "mean": float(timings.mean()),
+    }
+
+
+# === 1. Cases ===
+# Each generator yields (name, params, fn). Setup only happens for cases that
+# `wanted` selects, so --only skips building large inputs it will not time.
+
+def analytics_cases(scale, wanted):
+    from app.utils import analyze_sales, suggest_price
+    from app.batch import batch_suggest_price, batch_trends
+
+    for rows in (100, 1000, 10000) + ((100000,) if scale == "full" else ()):
+        name = f"analyze_sales[rows={rows}]"
+        if wanted(name):
+            df = data.sales_series(rows)
+            yield name, {"rows": rows}, lambda df=df: analyze_sales(df)
+
+    for horizon in (7, 365):
+        name = f"analyze_sales[rows=1000,horizon={horizon}]"
+        if wanted(name):
+            df = data.sales_series(1000)
+            yield name, {"rows": 1000, "horizon": horizon}, lambda df=df, h=horizon: analyze_sales(df, horizon=h)
+
+    slopes = np.random.default_rng(0).normal(0, 0.2, 10000)
+    if wanted("suggest_price[calls=10000]"):
+        yield "suggest_price[calls=10000]", {"calls": 10000}, lambda: [suggest_price(100.0, s) for s in slopes]
+    if wanted("batch_suggest_price[skus=10000]"):
+        yield "batch_suggest_price[skus=10000]", {"skus": 10000}, lambda: batch_suggest_price(100.0, slopes)
+
+    panels = [(1000, 1), (10000, 100), (1000000, 1000)]
+    if scale == "full":
+        panels += [(10000000, 10000)]
+    for rows, skus in panels:
+        name = f"batch_trends[rows={rows},skus={skus}]"
+        if wanted(name):
+            sku, day, units = data.sales_panel(rows, skus)
+            yield name, {"rows": rows, "skus": skus}, lambda a=(sku, day, units): batch_trends(*a)
+
+
+def plotting_cases(scale, wanted):
+    from app.utils import analyze_sales, plot_sales, plot_predicted_week
+
+    for rows in (100, 1000) + ((10000,) if scale == "full" else ()):
+        name = f"plot_sales[rows={rows}]"
+        if wanted(name):
+            a = analyze_sales(data.sales_series(rows))
+            yield (name, {"rows": rows},
+                   lambda a=a: plot_sales(a["df"], a["fitted_line"], a["future_dates"], a["predicted_future"]))
+
+    for horizon in (7, 90):
+        name = f"plot_predicted_week[horizon={horizon}]"
+        if wanted(name):
+            a = analyze_sales(data.sales_series(365), horizon=horizon)
+            yield name, {"horizon": horizon}, lambda a=a: plot_predicted_week(a["future_dates"], a["predicted_future"])
+
+
+def chatbot_cases(scale, wanted, stack, llm_latency):
+    from chatapp.chatbot import retrieval
+    from django.test import Client
+
+    stack.enter_context(fake_services(llm_latency=llm_latency))
+    counter = iter(range(10 ** 9))
+    indexed = False
+
+    for chunks in (100, 10000) + ((100000,) if scale == "full" else ()):
+        miss, hit = f"quey_vectorstore[chunks={chunks},miss]", f"quey_vectorstore[chunks={chunks},exact_hit]"
+        if not (wanted(miss) or wanted(hit)):
+            continue
+        workdir = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(fake_retriever(data.faq_chunks(chunks), workdir))
+        indexed = True
+
+        # Miss: embed + search + (fake) LLM round trip. Hit: answer cache only.
+        if wanted(miss):
+            yield miss, {"chunks": chunks, "llm_latency": llm_latency}, lambda: retrieval.quey_vectorstore(data.question(next(counter)))
+        if wanted(hit):
+            retrieval.quey_vectorstore("When is the pickup in zone 3?")
+            yield hit, {"chunks": chunks}, lambda: retrieval.quey_vectorstore("When is the pickup in zone 3?")
+
+    client = Client()
+
+    def ask():
+        i = next(counter)
+        return client.post("/chat/whatsapp/", {"Body": data.question(i), "From": f"whatsapp:+1{i}", "To": "whatsapp:+100"})
+
+    def order():
+        i = next(counter)
+        sender = f"whatsapp:+2{i}"
+        client.post("/chat/whatsapp/", {"Body": "order", "From": sender, "To": "whatsapp:+100"})
+        return client.post("/chat/whatsapp/", {"Body": "John, Maize Flour, 50", "From": sender, "To": "whatsapp:+100"})
+
+    if wanted("whatsapp_chatbot[question]"):
+        if not indexed:
+            # The webhook answers from an index too
+            workdir = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(fake_retriever(data.faq_chunks(100), workdir))
+        yield "whatsapp_chatbot[question]", {"llm_latency": llm_latency}, ask
+    if wanted("whatsapp_chatbot[order]"):
+        yield "whatsapp_chatbot[order]", {}, order
+
+
+# === 2. Runner ===
+def environment():
+    import django
+    import pandas as pd
+
+    commit = None
+    try:
+        import subprocess
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        pass
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "django": django.get_version(),
+    }
+
+
+def run_suite(scale="quick", only=None, llm_latency=0.0, budget=CASE_BUDGET_SECONDS, log=print):
+    # Chatbot cases need the database (orders, sessions): run inside a
+    # throwaway test database so nothing touches the real one.
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.db import connection
+
+    results = {}
+    with ExitStack() as stack:
+        setup_test_environment()
+        stack.callback(teardown_test_environment)
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        stack.callback(connection.creation.destroy_test_db, old_name, verbosity=0)
+
+        wanted = lambda name: not only or any(pattern in name for pattern in only)
+        groups = [
+            analytics_cases(scale, wanted),
+            plotting_cases(scale, wanted),
+            chatbot_cases(scale, wanted, stack, llm_latency),
+        ]
+        for group in groups:
+            for name, params, fn in group:
+                with redirect_stdout(io.StringIO()):  # the app's print() logging
+                    stats = measure(fn, budget)
+                results[name] = {"params": params, **stats}
+                log(f"{name:<50} median {stats['median'] * 1000:10.3f} ms   p95 {stats['p95'] * 1000:10.3f} ms   ({stats['runs']} runs)")
+
+    return {"meta": {**environment(), "scale": scale, "llm_latency": llm_latency}, "results": results}
+
+
+# === 3. Baselines ===
+def save_results(results, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD, noise_floor=NOISE_FLOOR):
+    # Median vs median for every case present in both runs
+    rows = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = new["median"] / old["median"] if old["median"] else float("inf")
+        regressed = ratio > 1 + threshold and new["median"] - old["median"] > noise_floor
+        rows.append({
+            "name": name,
+            "baseline": old["median"],
+            "current": new["median"],
+            "ratio": ratio,
+            "regressed": regressed,
+        })
+    return rows
@@ -0,0 +1,137 @@
+from contextlib import asynccontextmanager
+from .chatbot.llm import Limiter, LLMBusy, limiter as llm_limiter
+from project.metrics import registry
+import time
+import os
+
+# Questions answered (retrieval + LLM) at once per process; the rest wait,
+# at most ANSWER_MAX_WAITING of them, instead of piling up on blocked threads
+ANSWER_MAX_CONCURRENCY = int(os.getenv("ANSWER_MAX_CONCURRENCY", "8"))
+ANSWER_MAX_WAITING = int(os.getenv("ANSWER_MAX_WAITING", "32"))
+ANSWER_QUEUE_TIMEOUT = float(os.getenv("ANSWER_QUEUE_TIMEOUT", "10"))
+# Turned-away questions answered out-of-band later, at most this many at a time
+ANSWER_MAX_FOLLOW_UPS = int(os.getenv("ANSWER_MAX_FOLLOW_UPS", "64"))
+# Weight of the newest answer in the running average of answer time
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AnswerBusy(LLMBusy):
+    pass
+
+
+class Admission(Limiter):
+    # The LLM limiter's bounded queue around the whole answer path, plus
+    # deadline-aware admission: a question is turned away up front when,
+    # from the queue length and the average answer time, it would not even
+    # get a slot before its deadline.
+    label = "answer"
+    queue_stage = "answer.queue"
+
+    def __init__(self, limit=ANSWER_MAX_CONCURRENCY, max_waiting=ANSWER_MAX_WAITING,
+                 timeout=ANSWER_QUEUE_TIMEOUT, max_follow_ups=ANSWER_MAX_FOLLOW_UPS):
+        super().__init__(limit, max_waiting, timeout)
+        self.max_follow_ups = max_follow_ups
+        self.follow_ups = 0
+        self.shed = 0
+        self.service_seconds = 0.0
+        self.degraded = {"stale_cache": 0, "follow_up": 0, "busy": 0}
+
+    def busy(self, message):
+        return AnswerBusy(message)
+
+    def expected_wait(self):
+        # Everyone ahead in the queue, served `limit` at a time
+        with self._lock:
+            if self.in_flight < self.limit:
+                return 0.0
+            return (self.waiting + 1) / self.limit * self.service_seconds
+
+    def _observe(self, seconds):
+        with self._lock:
+            if self.service_seconds:
+                self.service_seconds += SERVICE_TIME_ALPHA * (seconds - self.service_seconds)
+            else:
+                self.service_seconds = seconds
+
+    @asynccontextmanager
+    async def aslot(self, deadline=None, bounded=True, wait_until=None):
+        # deadline: time.monotonic() by which the answer is needed; turned away
+        # up front if it can't be met. wait_until: for answers that can still
+        # be sent out-of-band, how long to stay queued instead of the queue timeout
+        timeout = self.timeout
+        now = time.monotonic()
+        if deadline is not None:
+            budget = deadline - now
+            if budget <= 0 or self.expected_wait() > budget:
+                with self._lock:
+                    self.shed += 1
+                raise self.busy(f"{self.label} would miss its deadline ({self.waiting} waiting)")
+            timeout = min(timeout, budget)
+        if wait_until is not None:
+            timeout = wait_until - now
+
+        async with super().aslot(timeout, bounded):
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._observe(time.monotonic() - started)
+
+    # === Degraded replies ===
+    def begin_follow_up(self):
+        with self._lock:
+            if self.follow_ups >= self.max_follow_ups:
+                return False
+            self.follow_ups += 1
+            return True
+
+    def end_follow_up(self):
+        with self._lock:
+            self.follow_ups -= 1
+
+    def count_degraded(self, kind):
+        with self._lock:
+            self.degraded[kind] += 1
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(
+                shed=self.shed,
+                follow_ups=self.follow_ups,
+                max_follow_ups=self.max_follow_ups,
+                avg_answer_seconds=round(self.service_seconds, 4),
+                degraded=dict(self.degraded),
+            )
+        return stats
+
+
+answer_admission = Admission()
+
+
+# === Prometheus export (wait time: stage_seconds{stage="answer.queue"}) ===
+def limiter_series(key):
+    return lambda: [
+        ({"limiter": name}, limiter.stats()[key])
+        for name, limiter in (("answer", answer_admission), ("llm", llm_limiter))
+    ]
+
+
+def rejection_series():
+    series = []
+    for name, limiter in (("answer", answer_admission), ("llm", llm_limiter)):
+        stats = limiter.stats()
+        series.append(({"limiter": name, "reason": "queue_full"}, stats["rejected"]))
+        series.append(({"limiter": name, "reason": "timeout"}, stats["timeouts"]))
+    series.append(({"limiter": "answer", "reason": "deadline"}, answer_admission.shed))
+    return series
+
+
+registry.collect("queue_depth", "Callers waiting for a concurrency slot", limiter_series("waiting"))
+registry.collect("in_flight", "Callers holding a concurrency slot", limiter_series("in_flight"))
+registry.collect("rejections_total", "Callers turned away by a concurrency limiter", rejection_series, kind="counter")
+registry.collect("degraded_replies_total", "WhatsApp questions answered in degraded mode",
+                 lambda: [({"reply": kind}, n) for kind, n in answer_admission.stats()["degraded"].items()],
+                 kind="counter")
+registry.collect("follow_ups", "Turned-away questions waiting to be answered out-of-band",
+                 lambda: [({}, answer_admission.follow_ups)])
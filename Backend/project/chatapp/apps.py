@@ -1,6 +1,46 @@
 from django.apps import AppConfig
+import os
+import sys
+
+
+# Set by project/wsgi.py and project/asgi.py before Django starts
+_serving = False
+
+
+def mark_serving():
+    global _serving
+    _serving = True
+
+
+def is_serving():
+    # Opt-in: background work starts only in a server process (gunicorn,
+    # uvicorn, ... through the wsgi/asgi modules, or runserver's child
+    # process), never in one-off commands, tests, shells or scripts.
+    if _serving:
+        return True
+    if os.path.basename(sys.argv[0]) == "manage.py":
+        command = sys.argv[1] if len(sys.argv) > 1 else ""
+        return command == "runserver" and os.environ.get("RUN_MAIN") == "true"
+    return False
+
+
+def should_preload():
+    return os.getenv("CHATBOT_PRELOAD", "1") == "1" and is_serving()
+
+
+def should_run_outbox():
+    # Set OUTBOX_WORKER=0 when orders are drained by 'manage.py run_outbox' instead
+    return os.getenv("OUTBOX_WORKER", "1") == "1" and is_serving()
 
 
 class ChatappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatapp'
+
+    def ready(self):
+        if should_preload():
+            from .chatbot.service import retriever_service
+            retriever_service.start()
+        if should_run_outbox():
+            from .outbox import start_worker_thread
+            start_worker_thread()
@@ -0,0 +1,173 @@
+import numpy as np
+import threading
+import json
+import csv
+import re
+import os
+
+# sku,name,aliases ("|"-separated) CSV, or a JSON list of {"sku", "name", "aliases"}.
+# Unset: no catalog, orders go to Express with the product as typed.
+CATALOG_PATH = os.getenv("PRODUCT_CATALOG_PATH", "")
+# Below this the customer is asked to correct the product instead
+CATALOG_MIN_CONFIDENCE = float(os.getenv("CATALOG_MIN_CONFIDENCE", "0.5"))
+# ... and also when the runner-up product scores within this much of the best
+# ("flour": Maize Flour 0.59 vs Wheat Flour 0.56 is a guess, not a match)
+CATALOG_MIN_MARGIN = float(os.getenv("CATALOG_MIN_MARGIN", "0.1"))
+CATALOG_ALTERNATIVES = 3
+MAX_RESOLVE_BATCH = 10000
+
+
+def normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def trigrams(text):
+    # Character trigrams of the padded, normalized text: a typo only
+    # disturbs the few trigrams around it ("maze flour" still shares most
+    # of "maize flour"'s)
+    key = normalize(text)
+    if not key:
+        return set()
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductCatalog:
+    # Names, aliases and SKUs are all "entries" pointing at a product. Exact
+    # (normalized) entries resolve through a dict; everything else through a
+    # trigram inverted index in CSR form (entries of gram g are
+    # postings[indptr[g]:indptr[g + 1]]), scored with the Dice coefficient
+    # 2|A∩B| / (|A| + |B|) as the confidence.
+    def __init__(self, products):
+        self.products = [{"sku": str(p["sku"]), "name": str(p["name"])} for p in products]
+        self.exact = {}
+        grams = {}
+        entry_product = []
+        entry_sizes = []
+        for i, product in enumerate(products):
+            for text in [product["name"], product["sku"], *product.get("aliases", [])]:
+                key = normalize(text)
+                if not key:
+                    continue
+                self.exact.setdefault(key, i)
+                entry = len(entry_product)
+                entry_product.append(i)
+                entry_grams = trigrams(key)
+                entry_sizes.append(len(entry_grams))
+                for gram in entry_grams:
+                    grams.setdefault(gram, []).append(entry)
+
+        self.vocab = {gram: g for g, gram in enumerate(grams)}
+        self.indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(entries) for entries in grams.values()], out=self.indptr[1:])
+        self.postings = np.fromiter((e for entries in grams.values() for e in entries),
+                                    dtype=np.int32, count=int(self.indptr[-1]))
+        self.entry_product = np.asarray(entry_product, dtype=np.int32)
+        self.entry_sizes = np.asarray(entry_sizes, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.products)
+
+    @classmethod
+    def from_file(cls, path):
+        if path.lower().endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                products = json.load(f)
+        else:
+            with open(path, newline="", encoding="utf-8") as f:
+                products = [
+                    {"sku": row["sku"], "name": row["name"],
+                     "aliases": [a.strip() for a in (row.get("aliases") or "").split("|") if a.strip()]}
+                    for row in csv.DictReader(f)
+                ]
+        return cls(products)
+
+    # === Resolution ===
+    def _ranked(self, entries, scores, limit):
+        # Best entry per product, best products first -> [(product index, score)].
+        # A product needs at most `limit` better entries ahead of it, so only
+        # the top 4 * limit entries get sorted.
+        if len(entries) > 4 * limit:
+            top = np.argpartition(-scores, 4 * limit - 1)[:4 * limit]
+            entries, scores = entries[top], scores[top]
+        order = np.lexsort((entries, -scores))
+        ranked, seen = [], set()
+        for i in order:
+            product = int(self.entry_product[entries[i]])
+            if product not in seen:
+                seen.add(product)
+                ranked.append((product, float(scores[i])))
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def _result(self, text, ranked):
+        best = ranked[0] if ranked else None
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        close_enough = best is not None and best[1] >= CATALOG_MIN_CONFIDENCE
+        ambiguous = close_enough and best[1] - runner_up < CATALOG_MIN_MARGIN
+        confident = close_enough and not ambiguous
+        return {
+            "query": text,
+            "sku": self.products[best[0]]["sku"] if confident else None,
+            "name": self.products[best[0]]["name"] if confident else None,
+            "confidence": round(best[1], 4) if best else 0.0,
+            "ambiguous": ambiguous,
+            "alternatives": [
+                {**self.products[product], "confidence": round(score, 4)}
+                for product, score in ranked[1 if confident else 0:]
+            ],
+        }
+
+    def resolve(self, text, limit=CATALOG_ALTERNATIVES + 1):
+        key = normalize(text)
+        if key in self.exact:
+            return self._result(text, [(self.exact[key], 1.0)])
+
+        query = trigrams(key)
+        ids = [self.vocab[gram] for gram in query if gram in self.vocab]
+        if not ids:
+            return self._result(text, [])
+        postings = np.concatenate([self.postings[self.indptr[g]:self.indptr[g + 1]] for g in ids])
+        # Shared trigrams per entry: counting runs in the few thousand sorted
+        # postings beats a dense count over every entry of a large catalog
+        entries, shared = np.unique(postings, return_counts=True)
+        scores = 2.0 * shared / (len(query) + self.entry_sizes[entries])
+        return self._result(text, self._ranked(entries, scores, limit))
+
+    def resolve_many(self, texts, limit=CATALOG_ALTERNATIVES + 1):
+        # Bulk imports repeat the same product names a lot: each distinct
+        # normalized text is scored once
+        resolved = {}
+        results = []
+        for text in texts:
+            key = normalize(text)
+            if key not in resolved:
+                resolved[key] = self.resolve(key, limit)
+            results.append({**resolved[key], "query": text})
+        return results
+
+
+# === Loading ===
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_catalog(path=None):
+    # Reloaded when the file changes; None when there is no catalog (orders
+    # then go out with the product exactly as typed)
+    path = path or CATALOG_PATH
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    fingerprint = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != fingerprint:
+            catalog = ProductCatalog.from_file(path)
+            print(f"🗂️ Product catalog loaded: {len(catalog)} products from {os.path.basename(path)}")
+            cached = _loaded[path] = (fingerprint, catalog)
+        return cached[1]
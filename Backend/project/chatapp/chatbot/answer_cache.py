@@ -0,0 +1,276 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import numpy as np
+import threading
+import atexit
+import json
+import time
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(BASE_DIR, "answer_cache.json"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Expired answers are kept this much longer for degraded (load-shed) replies,
+# then evicted by the next lookup that finds them
+ANSWER_CACHE_STALE_SECONDS = float(os.getenv("ANSWER_CACHE_STALE_SECONDS", str(24 * 3600)))
+# Cosine similarity needed for a "same question, different words" hit
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# Persist at most this often (seconds); always persisted at exit
+ANSWER_CACHE_SAVE_SECONDS = float(os.getenv("ANSWER_CACHE_SAVE_SECONDS", "30"))
+
+# Periodic saves run here, so writing the JSON never blocks the caller
+# (often the event loop); one worker, so saves never overlap
+_saver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answer-cache-save")
+
+
+def normalize_query(text):
+    # "Where are you located??" -> "where are you located"
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 threshold=ANSWER_CACHE_THRESHOLD, save_seconds=ANSWER_CACHE_SAVE_SECONDS,
+                 stale_seconds=ANSWER_CACHE_STALE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.threshold = threshold
+        self.save_seconds = save_seconds
+        self.index_version = None
+
+        # key -> {"answer", "vector", "created"}; order = least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked unit vectors for the semantic tier, rebuilt lazily after writes
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_created = None
+        self._dirty = False
+        self._last_save = 0.0
+        self._save_queued = False
+        self._save_lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.exact_misses = 0
+        self.stale_hits = 0
+        self.semantic_hits = 0
+        # Lookups that missed both tiers (the question went to the LLM)
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+        if path:
+            self.load()
+
+    # === Lookup ===
+    def get_exact(self, query, allow_expired=False):
+        # allow_expired: under load shedding a stale answer beats no answer
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._dead(entry, now):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.exact_misses += 1
+                return None
+            if self._expired(entry, now):
+                if not allow_expired:
+                    self.exact_misses += 1
+                    return None
+                self.stale_hits += 1
+            else:
+                self.exact_hits += 1
+            self._entries.move_to_end(key)
+            return entry["answer"]
+
+    def get_similar(self, vector):
+        # Nearest cached question by cosine similarity, if it clears the threshold
+        with self._lock:
+            matrix, keys = self._similarity_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            query = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                self.misses += 1
+                return None
+            scores = matrix @ (query / norm)
+            # Expired rows can't win, so a fresh runner-up still gets its hit
+            if self.ttl > 0:
+                scores[self._matrix_created < time.time() - self.ttl] = -np.inf
+            best = int(np.argmax(scores))
+
+            entry = self._entries.get(keys[best])
+            if scores[best] < self.threshold or entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return entry["answer"]
+
+    # === Store ===
+    def put(self, query, vector, answer):
+        key = normalize_query(query)
+        if not key:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": None if vector is None else [float(v) for v in vector],
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+            self._dirty = True
+        self._maybe_save()
+
+    def check_version(self, index_version):
+        # Answers were generated from a specific FAISS index; a rebuild makes them stale
+        with self._lock:
+            if self.index_version == index_version:
+                return
+            if self.index_version is not None and self._entries:
+                print(f"🧹 Index changed ({self.index_version} -> {index_version}), clearing answer cache")
+                self._entries.clear()
+                self._matrix = None
+                self.invalidations += 1
+                self._dirty = True
+            self.index_version = index_version
+        self._maybe_save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._dirty = True
+
+    # === Internals ===
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    def _dead(self, entry, now):
+        # Past its TTL and the stale grace period: not even a degraded reply uses it
+        return self.ttl > 0 and now - entry["created"] > self.ttl + self.stale_seconds
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._matrix = None
+        self._dirty = True
+        self.expirations += 1
+
+    def _similarity_matrix(self):
+        if self._matrix is None:
+            now = time.time()
+            for key in [k for k, e in self._entries.items() if self._dead(e, now)]:
+                self._drop(key)
+
+            keys = [k for k, e in self._entries.items() if e["vector"]]
+            if not keys:
+                return None, []
+            matrix = np.asarray([self._entries[k]["vector"] for k in keys], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrix = matrix / norms
+            self._matrix_keys = keys
+            self._matrix_created = np.asarray([self._entries[k]["created"] for k in keys])
+        return self._matrix, self._matrix_keys
+
+    # === Persistence ===
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        now = time.time()
+        with self._lock:
+            self.index_version = data.get("index_version")
+            for key, entry in data.get("entries", []):
+                if self._dead(entry, now):
+                    continue
+                self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+        print(f"📦 Answer cache warmed with {len(self._entries)} entries from '{self.path}'")
+
+    def save(self):
+        if not self.path:
+            return
+        # _save_lock serializes writers (the background save, save() at exit),
+        # so snapshots reach the file in the order they were taken
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {
+                    "index_version": self.index_version,
+                    "entries": list(self._entries.items()),
+                }
+                self._dirty = False
+                self._last_save = time.time()
+
+            # Write to a temp file and rename, so a crash never leaves half a cache;
+            # per process, so workers saving at once never write into one file
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _maybe_save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_queued or time.time() - self._last_save < self.save_seconds:
+                return
+            self._save_queued = True
+        _saver.submit(self._background_save)
+
+    def _background_save(self):
+        try:
+            self.save()
+        except OSError as e:
+            print(f"❌ Could not persist answer cache: {e}")
+        finally:
+            with self._lock:
+                self._save_queued = False
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                "index_version": self.index_version,
+                "exact_hits": self.exact_hits,
+                "exact_misses": self.exact_misses,
+                "stale_hits": self.stale_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache()
+atexit.register(answer_cache.save)
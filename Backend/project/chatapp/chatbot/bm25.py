@@ -0,0 +1,107 @@
+import numpy as np
+import time
+import re
+import os
+
+# Saved next to index.faiss by vectorstore.build_index
+BM25_FILE = "bm25.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words and numbers; prices ("1,200") and phone numbers split on punctuation
+# the same way in documents and queries, so they still match term for term
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    # Inverted index in CSR form: the postings of term t are
+    # docs[indptr[t]:indptr[t + 1]], and weights holds the full BM25 term
+    # score (idf x saturated, length-normalised tf) computed at build time,
+    # so a query is a sum over its terms' postings and nothing else.
+    # Doc ids are positions in the FAISS index.
+    def __init__(self, terms, indptr, docs, weights, n_docs):
+        self.terms = terms
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = n_docs
+        self.vocab = {term: i for i, term in enumerate(terms.tolist())}
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B):
+        postings = {}
+        lengths = []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc, tf))
+
+        n_docs = len(lengths)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        avg_length = lengths.mean() if n_docs and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths / avg_length)
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs, weights = [], []
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            df = len(entries)
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            tf = entries[:, 1].astype(np.float64)
+            docs.append(entries[:, 0])
+            weights.append(idf * tf * (k1 + 1) / (tf + norm[entries[:, 0]]))
+            indptr[i + 1] = indptr[i] + df
+
+        return cls(
+            np.asarray(terms, dtype=str),
+            indptr,
+            np.concatenate(docs).astype(np.int32) if docs else np.empty(0, dtype=np.int32),
+            np.concatenate(weights).astype(np.float32) if weights else np.empty(0, dtype=np.float32),
+            n_docs,
+        )
+
+    def search(self, query, k=10):
+        # -> [(doc position, score)], best first; only docs sharing a term
+        ids = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not ids:
+            return []
+        docs = np.concatenate([self.docs[self.indptr[t]:self.indptr[t + 1]] for t in ids])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in ids])
+
+        scores = np.bincount(docs, weights=weights, minlength=self.n_docs)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]  # ties -> earlier doc
+        return [(int(doc), float(scores[doc])) for doc in top if scores[doc] > 0]
+
+    # Plain arrays only (no pickle), so loading cannot execute code
+    def save(self, path):
+        np.savez(path, terms=self.terms, indptr=self.indptr, docs=self.docs,
+                 weights=self.weights, n_docs=np.int64(self.n_docs))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"], data["indptr"], data["docs"], data["weights"], int(data["n_docs"]))
+
+
+def load_keyword_index(index_dir, db):
+    # Indexes built before BM25 existed get one built from the docstore on load
+    path = os.path.join(index_dir, BM25_FILE)
+    if os.path.exists(path):
+        return BM25Index.load(path)
+
+    started = time.perf_counter()
+    texts = [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(len(db.index_to_docstore_id))]
+    index = BM25Index.build(texts)
+    print(f"🔤 Built keyword index for {len(texts)} chunks in {time.perf_counter() - started:.3f}s (no {BM25_FILE} on disk)")
+    return index
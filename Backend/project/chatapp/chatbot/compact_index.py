@@ -0,0 +1,188 @@
+import numpy as np
+import mmap
+import json
+import time
+import os
+
+# flat | sq8 | ivf-sq8 | ivf-pq, or any faiss index_factory string ("IVF1024,PQ32x8")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# Inverted lists probed per query (IVF types only): higher -> better recall, slower
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# Map index.faiss instead of reading it, so worker processes share its pages
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+# Vectors sampled to train IVF centroids / quantizers
+TRAIN_SAMPLE = 100_000
+# Below this many vectors a compressed index saves nothing worth its recall loss
+MIN_COMPRESSED_VECTORS = 1000
+
+# Pickle-free docstore: one JSON record per line + byte offsets, row i = FAISS position i
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "docs.offsets.npy"
+
+
+# === 1. Index types ===
+def pq_subquantizers(dim):
+    # Largest divisor of dim giving >= 4 dimensions per sub-quantizer, capped at 64 bytes/vector
+    for m in range(min(64, dim // 4), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type, n, dim):
+    if n < MIN_COMPRESSED_VECTORS or index_type == "flat":
+        return "Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    # ~4*sqrt(n) lists, with the 39 training points per centroid faiss asks for
+    nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+    if index_type == "ivf-sq8":
+        return f"IVF{nlist},SQ8"
+    if index_type == "ivf-pq":
+        nbits = 8 if n >= 256 * 39 else 4
+        return f"IVF{nlist},PQ{pq_subquantizers(dim)}x{nbits}"
+    return index_type
+
+
+def build_faiss(vectors, index_type=FAISS_INDEX_TYPE):
+    # -> (trained faiss index holding every vector, factory string). L2, like
+    # the IndexFlatL2 LangChain builds, so scores stay comparable across types.
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    factory = factory_string(index_type, len(vectors), vectors.shape[1])
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), TRAIN_SAMPLE, replace=False)]
+        started = time.perf_counter()
+        index.train(sample)
+        print(f"🏋️ Trained {factory} on {len(sample)} vectors in {time.perf_counter() - started:.2f}s")
+    index.add(vectors)
+    return index, factory
+
+
+def set_nprobe(index, nprobe=FAISS_NPROBE):
+    import faiss
+
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass  # not an IVF index
+
+
+def read_faiss(path, use_mmap=FAISS_MMAP):
+    import faiss
+
+    flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if use_mmap else 0
+    return faiss.read_index(path, flags)
+
+
+# === 2. Docstore ===
+def write_docstore(directory, chunks):
+    offsets = [0]
+    with open(os.path.join(directory, DOCS_FILE), "wb") as f:
+        for chunk in chunks:
+            record = {"content": chunk["content"], "metadata": chunk.get("metadata", {})}
+            line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+
+def iter_docstore(directory):
+    # Records back in row order, one line at a time
+    with open(os.path.join(directory, DOCS_FILE), "rb") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class MmapDocstore:
+    # LangChain's docstore interface (search(id) -> Document) over the mapped
+    # docs.jsonl; only the records a query returns are ever decoded
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, DOCS_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def search(self, doc_id):
+        from langchain_core.documents import Document
+
+        i = int(doc_id)
+        if not 0 <= i < len(self):
+            return f"ID {doc_id} not found."
+        record = json.loads(self._data[self.offsets[i]:self.offsets[i + 1]])
+        return Document(page_content=record["content"], metadata=record["metadata"])
+
+
+class PositionIds:
+    # index_to_docstore_id for a docstore keyed by FAISS position: no dict of
+    # n uuid strings per process
+    def __init__(self, n):
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise KeyError(i)
+        return int(i)
+
+    def get(self, i, default=None):
+        return int(i) if 0 <= i < self.n else default
+
+
+def load_store(index_dir, embeddings):
+    # A LangChain FAISS vector store without unpickling anything
+    from langchain.vectorstores import FAISS
+
+    index = read_faiss(os.path.join(index_dir, "index.faiss"))
+    set_nprobe(index)
+    return FAISS(embeddings, index, MmapDocstore(index_dir), PositionIds(index.ntotal))
+
+
+# === 3. Recall vs latency ===
+def recall_report(vectors, queries, index_types, nprobes=(1, 4, 16, 64), k=5):
+    # Every index type (and nprobe, for IVF) against exact flat search:
+    # recall@k, median/p95 single-query latency and serialized size
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        index, factory = build_faiss(vectors, index_type)
+        size = int(faiss.serialize_index(index).nbytes)
+        is_ivf = "IVF" in factory
+        for nprobe in (nprobes if is_ivf else (None,)):
+            if nprobe is not None:
+                set_nprobe(index, nprobe)
+            timings = []
+            found = []
+            for query in queries:
+                started = time.perf_counter()
+                _, ids = index.search(query[None, :], k)
+                timings.append(time.perf_counter() - started)
+                found.append(ids[0])
+            found = np.asarray(found)
+            recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+            rows.append({
+                "type": index_type,
+                "factory": factory,
+                "nprobe": nprobe,
+                "recall": round(float(recall), 4),
+                "median_ms": round(float(np.median(timings)) * 1000, 4),
+                "p95_ms": round(float(np.percentile(timings, 95)) * 1000, 4),
+                "size_bytes": size,
+            })
+    return rows
@@ -0,0 +1,37 @@
+from langchain.embeddings.base import Embeddings
+import numpy as np
+import hashlib
+import threading
+import re
+
+
+class HashEmbeddings(Embeddings):
+    # Deterministic offline embedder: hashed bag-of-words, L2 normalised.
+    # Texts that share words get similar vectors, so retrieval still behaves
+    # sensibly in tests and benchmarks without an Ollama server.
+    def __init__(self, size=768):
+        self.size = size
+        self.model = f"hash-{size}"
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.texts_embedded += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
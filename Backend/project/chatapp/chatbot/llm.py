@@ -0,0 +1,347 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from ..outbound import get_http_client, loop_local
+from project.metrics import timed
+import threading
+import hashlib
+import asyncio
+import os
+
+GROQ_MODEL = "llama-3.1-8b-instant"
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "20"))
+SYSTEM_PROMPT = "You are a helpful AI assistant. Answer clearly and concisely based ONLY on the provided context."
+
+# Completions in flight per process; further callers queue, at most
+# LLM_MAX_WAITING of them and for at most LLM_QUEUE_TIMEOUT seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+# A caller sharing another's identical prompt waits at most this long for it
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", str(LLM_QUEUE_TIMEOUT + GROQ_TIMEOUT)))
+
+
+class LLMBusy(Exception):
+    pass
+
+
+def chat_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def prompt_key(prompt):
+    raw = "\0".join([GROQ_MODEL, SYSTEM_PROMPT, prompt])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# === 1. Long-lived clients ===
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = {}
+
+
+def get_client():
+    # One sync client (and connection pool) per process and API endpoint,
+    # shared by every request thread
+    from groq import Groq
+
+    key = (os.getenv("GROQ_BASE_URL"), os.getenv("GROQ_API_KEY"))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = Groq(api_key=key[1], timeout=GROQ_TIMEOUT)
+    return client
+
+
+def get_async_client():
+    # Shares the pooled httpx client of the current event loop
+    from groq import AsyncGroq
+
+    return loop_local(_async_clients, lambda: AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        http_client=get_http_client(),
+        timeout=GROQ_TIMEOUT,
+    ))
+
+
+def reset_clients():
+    # After GROQ_BASE_URL / GROQ_API_KEY change (tests, benchmarks)
+    with _clients_lock:
+        _clients.clear()
+    _async_clients.clear()
+
+
+# === 2. Concurrency limit with a bounded FIFO queue ===
+class Waiter:
+    # One queued caller: a thread blocked on `event`, or a coroutine awaiting
+    # `future` on `loop`. `granted` is set (under the limiter lock) when a
+    # releasing caller hands it its slot.
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def wake(self):
+        # False when the waiter's event loop is gone and it can never run
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(resolve_waiter, self.future)
+        except RuntimeError:
+            return False
+        return True
+
+
+def resolve_waiter(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Limiter:
+    # A process-wide slot count shared by the sync and async paths. A release
+    # hands its slot straight to the longest waiter (threads or coroutines on
+    # any event loop), so nobody jumps the queue and nobody polls.
+    label = "LLM"
+    queue_stage = "llm.queue"
+
+    def __init__(self, limit=LLM_MAX_CONCURRENCY, max_waiting=LLM_MAX_WAITING, timeout=LLM_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def busy(self, message):
+        return LLMBusy(message)
+
+    def _enter(self, bounded, make_waiter):
+        # -> None when admitted right away, else the queued Waiter.
+        # bounded=False: the caller is capped elsewhere (e.g. follow-ups)
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return None
+            if bounded and self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise self.busy(f"{self.label} queue is full ({self.waiting} waiting)")
+            waiter = make_waiter()
+            self._waiters.append(waiter)
+            self.waiting += 1
+            return waiter
+
+    def _timed_out(self, waiter, timeout):
+        # A grant that raced the timeout still counts: keep the slot
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            self.waiting -= 1
+            self.timeouts += 1
+        raise self.busy(f"No {self.label} slot free within {timeout:.2f}s")
+
+    def _abandoned(self, waiter):
+        # Cancelled while queued: leave the queue, or pass on a slot already handed over
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self.waiting -= 1
+                return
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                self.waiting -= 1
+                waiter.granted = True
+                if waiter.wake():
+                    return  # the slot changes hands, in_flight stays
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, timeout=None, bounded=True):
+        timeout = self.timeout if timeout is None else timeout
+        waiter = self._enter(bounded, lambda: Waiter(event=threading.Event()))
+        if waiter is not None:
+            with timed(self.queue_stage):
+                granted = waiter.event.wait(max(timeout, 0))
+            if not granted:
+                self._timed_out(waiter, timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout=None, bounded=True):
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(bounded, lambda: Waiter(loop=loop, future=loop.create_future()))
+        if waiter is not None:
+            try:
+                with timed(self.queue_stage):
+                    await asyncio.wait_for(waiter.future, max(timeout, 0))
+            except asyncio.TimeoutError:
+                self._timed_out(waiter, timeout)
+            except BaseException:
+                self._abandoned(waiter)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+# === 3. Single-flight coalescing ===
+class SingleFlight:
+    # Identical prompts in flight at the same time share one completion: the
+    # first caller runs it, the others wait for its result (or its error)
+    def __init__(self, wait_seconds=COALESCE_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.follower_timeouts = 0
+
+    def _begin(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _follower_timeout(self):
+        with self._lock:
+            self.follower_timeouts += 1
+        return LLMBusy(f"Timed out after {self.wait_seconds}s waiting for a coalesced completion")
+
+    def do(self, key, fn):
+        future, leader = self._begin(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_seconds)
+            except FutureTimeout:
+                raise self._follower_timeout() from None
+        # Resolved in finally, so followers never hang on a leader that died
+        # of a BaseException (KeyboardInterrupt, cancellation, SystemExit...)
+        result = None
+        error = LLMBusy("Coalesced completion was interrupted")
+        try:
+            result = fn()
+            error = None
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(key, future, result, error)
+
+    async def ado(self, key, fn):
+        future, leader = self._begin(key)
+        if not leader:
+            # shield: a follower giving up must not cancel the shared result
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_seconds)
+            except asyncio.TimeoutError:
+                raise self._follower_timeout() from None
+        result = None
+        error = LLMBusy("Coalesced completion was cancelled")
+        try:
+            result = await fn()
+            error = None
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(key, future, result, error)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced,
+                    "follower_timeouts": self.follower_timeouts}
+
+
+limiter = Limiter()
+single_flight = SingleFlight()
+
+
+# === 4. Completions ===
+@timed("groq")
+def complete(prompt):
+    def call():
+        with limiter.slot():
+            response = get_client().chat.completions.create(model=GROQ_MODEL, messages=chat_messages(prompt))
+        return response.choices[0].message.content
+
+    return single_flight.do(prompt_key(prompt), call)
+
+
+@timed("groq")
+async def acomplete(prompt):
+    async def call():
+        async with limiter.aslot():
+            response = await get_async_client().chat.completions.create(model=GROQ_MODEL, messages=chat_messages(prompt))
+        return response.choices[0].message.content
+
+    return await single_flight.ado(prompt_key(prompt), call)
+
+
+def stream(prompt):
+    # Yields text deltas as Groq produces them (not coalesced: every caller
+    # consumes its own token stream); holds an LLM slot until exhausted or closed
+    with limiter.slot():
+        for chunk in get_client().chat.completions.create(model=GROQ_MODEL, messages=chat_messages(prompt), stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+async def astream(prompt):
+    async with limiter.aslot():
+        response = await get_async_client().chat.completions.create(
+            model=GROQ_MODEL, messages=chat_messages(prompt), stream=True)
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+def llm_stats():
+    return {"limiter": limiter.stats(), "single_flight": single_flight.stats()}
@@ -1,25 +1,171 @@
 from langchain_community.document_loaders import PyPDFLoader
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import json
+import os
 
-pdf_path = r"F:\projects\wastewise\backend\project\app\chatbot\WasteWise_Company_Profile_Updated.pdf"
-loader = PyPDFLoader(pdf_path)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-docs = loader.load()
-print(f"Loaded {len(docs)} documents from PDF.")
+DOCS_DIR = os.getenv("DOCS_DIR", BASE_DIR)
+CHUNKS_JSONL = os.getenv("CHUNKS_JSONL", os.path.join(BASE_DIR, "chunks.jsonl"))
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+# Plain text files are read in blocks of roughly this many characters ("pages"),
+# cut at a blank line, or anywhere once a block reaches MAX_TEXT_BLOCK_CHARS
+TEXT_BLOCK_CHARS = 20000
+MAX_TEXT_BLOCK_CHARS = 4 * TEXT_BLOCK_CHARS
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
 
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
 
 
-#splitting the document
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-documents = splitter.split_documents(docs)
+# === 1. Walk the corpus lazily ===
+def iter_files(docs_dir):
+    for root, dirs, files in os.walk(docs_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, name)
 
-#saving as ajson file
-json_data = [
-    {"content": doc.page_content, "metadata": doc.metadata}
-    for doc in documents
-]
-with open("chunks.json", "w", encoding="utf-8") as f:
-    json.dump(json_data, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+
+def iter_text_blocks(path):
+    # Paragraph-aligned blocks so a text file never has to be read in one go.
+    # Lines are read in bounded pieces and blocks capped, so a file without
+    # blank lines (or newlines) is still never held whole.
+    block = []
+    size = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in iter(lambda: f.readline(TEXT_BLOCK_CHARS), ""):
+            block.append(line)
+            size += len(line)
+            if size >= MAX_TEXT_BLOCK_CHARS or (size >= TEXT_BLOCK_CHARS and not line.strip()):
+                yield "".join(block)
+                block, size = [], 0
+    if block:
+        yield "".join(block)
+
+
+def iter_pages(path, source):
+    # Yields (text, metadata) one page at a time
+    if path.lower().endswith(".pdf"):
+        for doc in PyPDFLoader(path).lazy_load():
+            yield doc.page_content, {"source": source, "page": doc.metadata.get("page", 0)}
+    else:
+        for page, text in enumerate(iter_text_blocks(path)):
+            yield text, {"source": source, "page": page}
+
+
+# === 2. Split pages in worker processes ===
+_splitter = None
+
+
+def _init_worker():
+    global _splitter
+    _splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def split_page(page):
+    text, metadata = page
+    if _splitter is None:
+        _init_worker()
+    return [
+        {"content": chunk, "metadata": {**metadata, "chunk": i}}
+        for i, chunk in enumerate(_splitter.split_text(text))
+    ]
+
+
+def iter_split(pages, pool, max_pending):
+    # Ordered, bounded fan-out: at most max_pending pages are in flight, so
+    # memory stays flat no matter how large the corpus is.
+    pending = deque()
+    for page in pages:
+        pending.append(pool.submit(split_page, page))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+# === 3. Checkpoint ===
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"offset": 0, "files": {}}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+# === 4. Ingest ===
+def ingest(docs_dir=DOCS_DIR, out_path=CHUNKS_JSONL, workers=INGEST_WORKERS, rebuild=False):
+    checkpoint_path = f"{out_path}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path)
+    if rebuild or not os.path.exists(out_path):
+        checkpoint = {"offset": 0, "files": {}}
+
+    files = list(iter_files(docs_dir))
+    sources = {path: os.path.relpath(path, docs_dir) for path in files}
+
+    # A file that changed (or disappeared) after being ingested invalidates
+    # the chunks already written for it, so start over.
+    done = checkpoint["files"]
+    current = {sources[path]: file_signature(path) for path in files}
+    if any(current.get(source) != signature for source, signature in done.items()):
+        print("♻️ Ingested documents changed since the last run, rebuilding chunks from scratch")
+        checkpoint = {"offset": 0, "files": {}}
+        done = checkpoint["files"]
+
+    stats = {"files": 0, "skipped": 0, "chunks": 0}
+    mode = "r+b" if os.path.exists(out_path) else "wb"
+    with open(out_path, mode) as out, ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # Drop anything written after the last completed file (interrupted run)
+        out.seek(checkpoint["offset"])
+        out.truncate()
+
+        for path in files:
+            source = sources[path]
+            if source in done:
+                stats["skipped"] += 1
+                continue
+
+            count = 0
+            for chunk in iter_split(iter_pages(path, source), pool, max_pending=workers * 4):
+                out.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+                count += 1
+            out.flush()
+            os.fsync(out.fileno())
+
+            done[source] = current[source]
+            checkpoint["offset"] = out.tell()
+            save_checkpoint(checkpoint_path, checkpoint)
+            stats["files"] += 1
+            stats["chunks"] += count
+            print(f"📄 {source}: {count} chunks")
+
+    print(f"✅ Ingested {stats['files']} files ({stats['skipped']} already done), {stats['chunks']} new chunks -> {out_path}")
+    return stats
+
+
+def iter_chunks(path=CHUNKS_JSONL):
+    # Stream chunks back one line at a time (consumed by vectorstore.build_index)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    ingest()
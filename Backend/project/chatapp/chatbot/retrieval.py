@@ -1,52 +1,152 @@
-from langchain.chains import RetrievalQA
-from langchain.vectorstores import FAISS
-#from langchain.embeddings import HuggingFaceEmbeddings
-from groq import Groq
-import os
-from langchain.embeddings import OllamaEmbeddings
 from dotenv import load_dotenv
+from asgiref.sync import sync_to_async
+from .service import retriever_service
+from .answer_cache import answer_cache
+from .llm import acomplete, astream, complete
+from project.metrics import timed
+import numpy as np
 import os
 
 load_dotenv()
 
-# ✅ Initialize Groq Client
-def get_groq_response(prompt):
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Hybrid retrieval: chunks sent to Groq, candidates taken from each of the
+# vector and keyword (BM25) rankings before fusing them
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "3"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RRF_K = 60
+# Upper bound on the context pasted into the prompt (~4 characters per token)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CHARS_PER_TOKEN = 4
+
+# === Hybrid retrieval ===
+def vector_hits(db, vector, k):
+    # FAISS positions, nearest first (same ids as the keyword index)
+    if not db.index.ntotal:
+        return []
+    _, positions = db.index.search(np.asarray([vector], dtype=np.float32), min(k, db.index.ntotal))
+    return [int(p) for p in positions[0] if p >= 0]
+
 
-    response = client.chat.completions.create(
-       # model="llama3-8b-8192",  # Groq's fast free model
-        model="llama-3.1-8b-instant",
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    # score(doc) = sum over rankings of 1 / (rrf_k + rank); no score scales to reconcile
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda doc: (-scores[doc], doc))[:k]
 
-        messages=[
-            {"role": "system", "content": "You are a helpful AI assistant. Answer clearly and concisely based ONLY on the provided context."},
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    return response.choices[0].message.content
+def hybrid_search(loaded, query, vector, k=RETRIEVAL_K):
+    db = loaded.db
+    with timed("faiss.search"):
+        dense = vector_hits(db, vector, RETRIEVAL_CANDIDATES)
+    sparse = []
+    if loaded.keyword is not None:
+        with timed("bm25.search"):
+            sparse = [doc for doc, _ in loaded.keyword.search(query, RETRIEVAL_CANDIDATES)]
+    return [db.docstore.search(db.index_to_docstore_id[p]) for p in reciprocal_rank_fusion([dense, sparse], k)]
+
+
+def build_context(texts, budget=CONTEXT_TOKEN_BUDGET):
+    # Best chunks first until the token budget is spent; the top chunk always
+    # goes in, cut down to the budget if it is too long on its own
+    parts, used = [], 0
+    for text in texts:
+        cost = len(text) // CHARS_PER_TOKEN + 1
+        if used + cost > budget:
+            if not parts:
+                parts.append(text[:budget * CHARS_PER_TOKEN])
+            break
+        parts.append(text)
+        used += cost
+    return "\n\n".join(parts) if parts else "No relevant context found."
 
 
 def quey_vectorstore(query):
-    # ✅ Replace Ollama embeddings with HuggingFace (free & offline)
-   # embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
-
-    print("Loading vector store from 'faiss_index/'...")
-    db = FAISS.load_local(
-        r"F:\Program Files\projects\Bookkeeping\Backend\project\chatapp\chatbot\faiss_index",
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
-    print("Vector store loaded.")
-
-    # ✅ Retrieve best matching context
-    retriever = db.as_retriever(search_kwargs={"k": 1})
-    docs = retriever.get_relevant_documents(query)
-    context = docs[0].page_content if docs else "No relevant context found."
+    # ✅ Index + embedding client stay resident in the process (see service.py)
+    with timed("faiss.load"):
+        loaded = retriever_service.get()
+    answer_cache.check_version(loaded.version)
+
+    # ✅ Tier 1: same question asked before (no embedding, no LLM call)
+    with timed("answer_cache"):
+        cached = answer_cache.get_exact(query)
+    if cached is not None:
+        return cached
+
+    # ✅ Tier 2: a near-identical question, matched on the query embedding
+    with timed("embed"):
+        vector = retriever_service.embeddings.embed_query(query)
+    with timed("answer_cache"):
+        cached = answer_cache.get_similar(vector)
+    if cached is not None:
+        return cached
+
+    # ✅ Retrieve best matching context: vector + keyword hits, fused (reusing the embedding computed above)
+    docs = hybrid_search(loaded, query, vector)
+    context = build_context([doc.page_content for doc in docs])
 
     # ✅ Build structured prompt for Groq model
     prompt = f"Context: {context}\n\nQuestion: {query}\n\nAnswer clearly using ONLY the context."
 
-    answer = get_groq_response(prompt)
+    # ✅ Pooled client; identical prompts in flight share one completion
+    answer = complete(prompt)
+    answer_cache.put(query, vector, answer)
+    return answer
+
+
+async def aprepare(query, exact_checked=False):
+    # Async twin of the retrieval steps of quey_vectorstore for the ASGI views:
+    # embedding is awaited, only the in-memory hybrid search runs in a worker
+    # thread. -> (cached answer, None, None) or (None, query vector, prompt)
+    # exact_checked: the caller already missed get_exact, don't count it twice
+    with timed("faiss.load"):
+        loaded = await sync_to_async(retriever_service.get, thread_sensitive=False)()
+    answer_cache.check_version(loaded.version)
+
+    if not exact_checked:
+        with timed("answer_cache"):
+            cached = answer_cache.get_exact(query)
+        if cached is not None:
+            return cached, None, None
+
+    with timed("embed"):
+        vector = await retriever_service.embeddings.aembed_query(query)
+    with timed("answer_cache"):
+        cached = answer_cache.get_similar(vector)
+    if cached is not None:
+        return cached, None, None
+
+    docs = await sync_to_async(hybrid_search, thread_sensitive=False)(loaded, query, vector)
+    context = build_context([doc.page_content for doc in docs])
+
+    prompt = f"Context: {context}\n\nQuestion: {query}\n\nAnswer clearly using ONLY the context."
+    return None, vector, prompt
+
+
+async def aquey_vectorstore(query, exact_checked=False):
+    cached, vector, prompt = await aprepare(query, exact_checked)
+    if cached is not None:
+        return cached
+
+    answer = await acomplete(prompt)
+    answer_cache.put(query, vector, answer)
     return answer
+
+
+async def astream_answer(query):
+    # Pieces of the answer as Groq produces them; a cached answer comes in one piece
+    cached, vector, prompt = await aprepare(query)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for delta in astream(prompt):
+        parts.append(delta)
+        yield delta
+    answer_cache.put(query, vector, "".join(parts))
+
+
+# Rebuilt index -> cached answers may no longer match the documents
+retriever_service.on_reload(lambda loaded: answer_cache.check_version(loaded.version))
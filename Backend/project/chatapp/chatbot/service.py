@@ -0,0 +1,183 @@
+from dotenv import load_dotenv
+from .bm25 import load_keyword_index
+from .compact_index import DOCS_FILE, OFFSETS_FILE, load_store
+import hashlib
+import threading
+import time
+import os
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", os.path.join(BASE_DIR, "faiss_index"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+# How often the watcher stats the index directory for changes
+RELOAD_CHECK_SECONDS = float(os.getenv("FAISS_RELOAD_CHECK_SECONDS", "5"))
+
+INDEX_FILES = ("index.faiss", "index.pkl")
+# Pickle-free layout written by vectorstore.build_index (see compact_index.py)
+COMPACT_FILES = ("index.faiss", DOCS_FILE, OFFSETS_FILE)
+
+
+def index_files(index_dir):
+    # Indexes built before the pickle-free docstore only have LangChain's index.pkl
+    return COMPACT_FILES if os.path.exists(os.path.join(index_dir, DOCS_FILE)) else INDEX_FILES
+
+
+def index_fingerprint(index_dir):
+    # (name, size, mtime) of every index file - changes whenever the index is rebuilt
+    parts = []
+    for name in index_files(index_dir):
+        path = os.path.join(index_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        parts.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(parts)
+
+
+class LoadedIndex:
+    # Immutable snapshot of one loaded index. Queries keep a reference to the
+    # snapshot they started with, so a hot swap never pulls it out from under them.
+    def __init__(self, db, fingerprint, load_seconds, keyword=None):
+        self.db = db
+        self.keyword = keyword
+        self.fingerprint = fingerprint
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.size_bytes = sum(size for _, size, _ in fingerprint)
+        self.vectors = getattr(getattr(db, "index", None), "ntotal", None)
+        self.version = hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()[:12]
+
+
+class RetrieverService:
+    def __init__(self, index_dir=FAISS_INDEX_DIR, embeddings=None, check_seconds=RELOAD_CHECK_SECONDS):
+        self.index_dir = index_dir
+        self.check_seconds = check_seconds
+        self._embeddings = embeddings
+        self._current = None
+        self._load_lock = threading.Lock()
+        self._embeddings_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.reload_errors = 0
+        self._listeners = []
+
+    @property
+    def embeddings(self):
+        # One embedding client per process, shared by every request thread
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    # langchain is imported here, not when the URLconf loads
+                    from langchain.embeddings import OllamaEmbeddings
+                    self._embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
+        return self._embeddings
+
+    def _load(self):
+        # Resolve the published build once, so every file comes from the same
+        # build even if a new one is published while this one loads
+        index_dir = os.path.realpath(self.index_dir)
+        fingerprint = index_fingerprint(index_dir)
+        if fingerprint is None:
+            raise FileNotFoundError(f"No FAISS index found in {self.index_dir}")
+
+        started = time.perf_counter()
+        if any(name == DOCS_FILE for name, _, _ in fingerprint):
+            # Memory-mapped index + docstore, nothing unpickled
+            db = load_store(index_dir, self.embeddings)
+        else:
+            from langchain.vectorstores import FAISS
+
+            db = FAISS.load_local(
+                index_dir,
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+        keyword = load_keyword_index(index_dir, db)
+        loaded = LoadedIndex(db, fingerprint, time.perf_counter() - started, keyword)
+        print(f"📚 Vector store loaded from '{self.index_dir}' in {loaded.load_seconds:.3f}s "
+              f"({loaded.size_bytes} bytes, {loaded.vectors} vectors)")
+        return loaded
+
+    def get(self):
+        current = self._current
+        if current is not None:
+            return current
+
+        with self._load_lock:
+            if self._current is None:
+                self._current = self._load()
+            return self._current
+
+    def reload(self, force=False):
+        # Build the new index off to the side, then swap the reference in one
+        # assignment. In-flight queries finish against the snapshot they hold.
+        with self._load_lock:
+            current = self._current
+            fingerprint = index_fingerprint(self.index_dir)
+            if fingerprint is None:
+                return False
+            if not force and current is not None and current.fingerprint == fingerprint:
+                return False
+            try:
+                loaded = self._load()
+            except Exception as e:
+                self.reload_errors += 1
+                print(f"❌ Vector store reload failed, keeping previous index: {e}")
+                return False
+            self._current = loaded
+            if current is not None:
+                self.reloads += 1
+
+        for listener in list(self._listeners):
+            listener(loaded)
+        return True
+
+    def on_reload(self, listener):
+        # listener(loaded_index) is called after every successful swap
+        self._listeners.append(listener)
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"❌ Vector store watcher error: {e}")
+            self._stop.wait(self.check_seconds)
+
+    def start(self):
+        # Loads the index (in the background) and keeps watching it for changes
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="faiss-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        current = self._current
+        stats = {
+            "index_dir": self.index_dir,
+            "loaded": current is not None,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+        if current is not None:
+            stats.update({
+                "version": current.version,
+                "load_seconds": round(current.load_seconds, 6),
+                "index_size_bytes": current.size_bytes,
+                "vectors": current.vectors,
+                "keyword_terms": len(current.keyword.vocab) if current.keyword is not None else None,
+                "loaded_at": current.loaded_at,
+            })
+        return stats
+
+
+retriever_service = RetrieverService()
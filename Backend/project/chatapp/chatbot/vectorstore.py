@@ -1,24 +1,212 @@
-from langchain.vectorstores import FAISS
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import numpy as np
+import hashlib
+import shutil
 import json
+import time
 import os
 from langchain.embeddings import OllamaEmbeddings
+from .service import BASE_DIR, FAISS_INDEX_DIR, EMBEDDING_MODEL
+from .pdf import CHUNKS_JSONL, iter_chunks
+from .bm25 import BM25_FILE, BM25Index
+from .compact_index import FAISS_INDEX_TYPE, build_faiss, iter_docstore, write_docstore
 
+# Prefer the streamed JSONL written by pdf.ingest, fall back to the old chunks.json
+CHUNKS_PATH = os.getenv("CHUNKS_PATH", CHUNKS_JSONL if os.path.exists(CHUNKS_JSONL) else os.path.join(BASE_DIR, "chunks.json"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
 
-from langchain.schema import Document
+# Stored next to index.faiss and the docstore so the next build can reuse vectors
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+# Builds kept next to the published one, so a reader still opening the
+# previous build's files never finds them deleted
+KEEP_INDEX_VERSIONS = 2
 
 
+def chunk_hash(chunk):
+    key = json.dumps([chunk["content"], chunk.get("metadata", {})], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-with open(r"F:\projects\wastewise\backend\project\app\chatbot\chunks.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
 
-# Convert back to Document objects
-documents = [Document(page_content=d["content"], metadata=d["metadata"]) for d in data]
+def load_chunks(path=CHUNKS_PATH):
+    if path.endswith(".jsonl"):
+        return iter_chunks(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
 
+def embedder_name(embeddings):
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
 
-#now the vector db
-vectorstore = FAISS.from_documents(documents, embeddings)
-print("Vector store created with FAISS.")
-vectorstore.save_local("faiss_index")
-print("Vector store saved to 'faiss_index/'")
\ No newline at end of file
+
+# === 1. Vectors from the previous build ===
+def load_previous_vectors(index_dir, model):
+    # hash -> vector, only if the previous build used the same embedding model
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    if manifest.get("model") != model or len(manifest["hashes"]) != len(vectors):
+        return {}
+    return dict(zip(manifest["hashes"], vectors))
+
+
+# === 2. Batched, bounded-concurrency embedding ===
+class StreamEmbedder:
+    # Embeds texts as they stream past: each full batch is sent right away,
+    # at most max_workers requests run at once and at most twice that many
+    # batches (texts included) are held, however long the stream is.
+    def __init__(self, embeddings, batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_MAX_WORKERS):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_in_flight = 2 * max(1, max_workers)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        self.keys = []
+        self.texts = []
+        self.in_flight = deque()
+        self.vectors = {}
+
+    def add(self, key, text):
+        self.keys.append(key)
+        self.texts.append(text)
+        if len(self.texts) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        if self.texts:
+            self.in_flight.append((self.keys, self.pool.submit(self.embeddings.embed_documents, self.texts)))
+            self.keys, self.texts = [], []
+        while len(self.in_flight) > self.max_in_flight:
+            self._collect()
+
+    def _collect(self):
+        keys, future = self.in_flight.popleft()
+        self.vectors.update(zip(keys, future.result()))
+
+    def finish(self):
+        # -> {key: vector} for every text added
+        self._submit()
+        while self.in_flight:
+            self._collect()
+        return self.vectors
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+# === 3. Atomic publish ===
+# index_dir is a symlink to the current build (faiss_index -> faiss_index.v-<ns>).
+# Publishing repoints it with one os.replace, so index_dir always exists and
+# readers see either the old build or the new one, never a mix or nothing.
+def version_prefix(index_dir):
+    return f"{os.path.basename(index_dir)}.v-"
+
+
+def new_version_dir(index_dir):
+    return f"{index_dir}.v-{time.time_ns():020d}"
+
+
+def publish(build_dir, index_dir):
+    if os.path.isdir(index_dir) and not os.path.islink(index_dir):
+        # An index built before versioned builds: it becomes the first version.
+        # A directory can't be atomically replaced by a link, so this one-time
+        # move is the only moment index_dir is missing.
+        legacy = f"{index_dir}.v-{0:020d}"
+        os.rename(index_dir, legacy)
+        os.symlink(os.path.basename(legacy), index_dir)
+
+    link = f"{index_dir}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(build_dir), link)
+    os.replace(link, index_dir)
+    prune_versions(index_dir)
+
+
+def prune_versions(index_dir, keep=KEEP_INDEX_VERSIONS):
+    # Only builds older than the published one: newer ones may still be in progress
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    prefix = version_prefix(index_dir)
+    current = os.path.basename(os.path.realpath(index_dir))
+    older = sorted(name for name in os.listdir(parent) if name.startswith(prefix) and name <= current)
+    for name in older[:-keep]:
+        shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+# === 4. Incremental build ===
+def build_index(chunks, embeddings, index_dir=FAISS_INDEX_DIR,
+                batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_MAX_WORKERS, index_type=FAISS_INDEX_TYPE):
+    # chunks may be a list or a stream such as pdf.iter_chunks(): it is read
+    # once, straight into the docstore on disk, while new chunks are embedded
+    # in batches. Only hashes and vectors (which FAISS needs all of) stay in
+    # memory; the later steps read the texts back from the docstore.
+    model = embedder_name(embeddings)
+    previous = load_previous_vectors(index_dir, model)
+    hashes = []
+    pending = set()
+    embedder = StreamEmbedder(embeddings, batch_size, max_workers)
+
+    def recorded(chunks):
+        for chunk in chunks:
+            h = chunk_hash(chunk)
+            hashes.append(h)
+            # Only new or changed chunks go to the embedder (each distinct chunk once)
+            if h not in previous and h not in pending:
+                pending.add(h)
+                embedder.add(h, chunk["content"])
+            yield chunk
+
+    # Written to a fresh version directory nobody reads until it is published;
+    # removed again if anything fails before then, so no build is left orphaned
+    tmp_dir = new_version_dir(index_dir)
+    os.makedirs(tmp_dir)
+    try:
+        try:
+            # Pickle-free docstore the service loads from (row i = FAISS position i)
+            write_docstore(tmp_dir, recorded(chunks))
+            if not hashes:
+                raise ValueError("No chunks to index")
+            vectors_by_hash = dict(previous)
+            vectors_by_hash.update(embedder.finish())
+        finally:
+            embedder.close()
+
+        vectors = np.asarray([vectors_by_hash[h] for h in hashes], dtype=np.float32)
+        del vectors_by_hash
+        import faiss
+
+        # Every type, flat included, is built straight from the vectors: the texts
+        # are only in the docstore, never loaded together or pickled
+        index, factory = build_faiss(vectors, index_type)
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        del index
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), vectors)
+        # Keyword side of hybrid retrieval; doc ids are the FAISS positions above
+        BM25Index.build(record["content"] for record in iter_docstore(tmp_dir)).save(os.path.join(tmp_dir, BM25_FILE))
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"model": model, "dim": int(vectors.shape[1]), "index": factory, "hashes": hashes}, f)
+        publish(tmp_dir, index_dir)
+    except BaseException:
+        # Once published the build is live and must stay
+        if os.path.realpath(index_dir) != os.path.realpath(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    current = set(hashes)
+    stats = {
+        "chunks": len(hashes),
+        "embedded": len(pending),
+        "reused": sum(1 for h in current if h in previous),
+        "removed": sum(1 for h in previous if h not in current),
+    }
+    print(f"✅ Vector store saved to '{index_dir}' ({factory}): {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    build_index(load_chunks(), OllamaEmbeddings(model=EMBEDDING_MODEL))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from chatapp.chatbot.vectorstore import (
+    CHUNKS_PATH, EMBED_BATCH_SIZE, EMBED_MAX_WORKERS, build_index, load_chunks,
+)
+from chatapp.chatbot.compact_index import FAISS_INDEX_TYPE
+from chatapp.chatbot.service import FAISS_INDEX_DIR, EMBEDDING_MODEL
+
+
+class Command(BaseCommand):
+    help = "Incrementally (re)build the chatbot FAISS index, re-embedding only new or changed chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunks", default=CHUNKS_PATH)
+        parser.add_argument("--index-dir", default=FAISS_INDEX_DIR)
+        parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=EMBED_MAX_WORKERS)
+        parser.add_argument("--index-type", default=FAISS_INDEX_TYPE,
+                            help="flat, sq8, ivf-sq8, ivf-pq or a faiss index_factory string")
+        parser.add_argument("--fake", action="store_true",
+                            help="Use the deterministic offline HashEmbeddings instead of Ollama")
+
+    def handle(self, *args, **options):
+        if options["fake"]:
+            from chatapp.chatbot.fakes import HashEmbeddings
+            embeddings = HashEmbeddings()
+        else:
+            from langchain.embeddings import OllamaEmbeddings
+            embeddings = OllamaEmbeddings(model=EMBEDDING_MODEL)
+
+        stats = build_index(
+            load_chunks(options["chunks"]),
+            embeddings,
+            index_dir=options["index_dir"],
+            batch_size=options["batch_size"],
+            max_workers=options["workers"],
+            index_type=options["index_type"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {stats['chunks']} chunks: {stats['embedded']} embedded, "
+            f"{stats['reused']} reused, {stats['removed']} removed"
+        ))
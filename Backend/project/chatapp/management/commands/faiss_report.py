@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatapp.chatbot.compact_index import recall_report
+from chatapp.chatbot.service import FAISS_INDEX_DIR
+from chatapp.chatbot.vectorstore import VECTORS_FILE
+import numpy as np
+import json
+import os
+
+
+class Command(BaseCommand):
+    help = "Recall@k and query latency of compressed FAISS index types (and nprobe values) against exact flat search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index-dir", default=FAISS_INDEX_DIR, help="Use the vectors saved with this index")
+        parser.add_argument("--synthetic", type=int, metavar="N", help="Use N random clustered vectors instead")
+        parser.add_argument("--dim", type=int, default=768, help="Dimension of --synthetic vectors")
+        parser.add_argument("--types", default="flat,sq8,ivf-sq8,ivf-pq", help="Comma-separated index types")
+        parser.add_argument("--nprobe", default="1,4,16,64", help="Comma-separated nprobe values for IVF types")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        if options["synthetic"]:
+            centers = rng.normal(size=(max(1, options["synthetic"] // 100), options["dim"]))
+            vectors = centers[rng.integers(0, len(centers), options["synthetic"])]
+            vectors = (vectors + rng.normal(scale=0.5, size=vectors.shape)).astype(np.float32)
+        else:
+            path = os.path.join(options["index_dir"], VECTORS_FILE)
+            if not os.path.exists(path):
+                raise CommandError(f"No {VECTORS_FILE} in {options['index_dir']}; rebuild the index or use --synthetic")
+            vectors = np.load(path)
+
+        # Queries near (not on) indexed vectors, like a paraphrased question
+        picks = vectors[rng.integers(0, len(vectors), options["queries"])]
+        queries = picks + rng.normal(scale=0.1 * float(np.std(vectors)), size=picks.shape).astype(np.float32)
+
+        rows = recall_report(vectors, queries, options["types"].split(","),
+                             [int(n) for n in options["nprobe"].split(",")], options["k"])
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{options['k']}")
+        for row in rows:
+            nprobe = "" if row["nprobe"] is None else f"nprobe={row['nprobe']}"
+            self.stdout.write(f"{row['factory']:<22} {nprobe:<11} recall {row['recall']:.3f}   "
+                              f"median {row['median_ms']:8.3f} ms   p95 {row['p95_ms']:8.3f} ms   "
+                              f"{row['size_bytes'] / 1e6:9.2f} MB")
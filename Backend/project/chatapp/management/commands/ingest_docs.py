@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from chatapp.chatbot.pdf import CHUNKS_JSONL, DOCS_DIR, INGEST_WORKERS, ingest
+
+
+class Command(BaseCommand):
+    help = "Stream PDFs and text files from a directory into chunks.jsonl (resumable)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs-dir", default=DOCS_DIR)
+        parser.add_argument("--out", default=CHUNKS_JSONL)
+        parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Ignore the checkpoint and re-ingest every document")
+
+    def handle(self, *args, **options):
+        stats = ingest(
+            docs_dir=options["docs_dir"],
+            out_path=options["out"],
+            workers=options["workers"],
+            rebuild=options["rebuild"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {stats['files']} files ({stats['skipped']} skipped), {stats['chunks']} chunks"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from chatapp.outbox import OUTBOX_POLL_SECONDS, run_worker
+
+
+class Command(BaseCommand):
+    help = "Drain the WhatsApp order outbox to the Express backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=OUTBOX_POLL_SECONDS)
+
+    def handle(self, *args, **options):
+        try:
+            run_worker(poll_seconds=options["poll"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
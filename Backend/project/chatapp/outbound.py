@@ -0,0 +1,90 @@
+import threading
+import asyncio
+import os
+
+# Pool size for all outbound calls made from the async webhook
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "10"))
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+TWILIO_MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+_clients = {}
+_ssl_context = None
+# (pid, loop) of the background event loop thread
+_background = None
+_background_lock = threading.Lock()
+
+
+def loop_local(registry, factory):
+    # One long-lived client per event loop. Under uvicorn that is one per
+    # process; under WSGI each request runs on a throwaway loop, so key by loop
+    # and drop the entries of loops that have closed.
+    loop = asyncio.get_running_loop()
+    client = registry.get(loop)
+    if client is None:
+        for old_loop in [l for l in registry if l.is_closed()]:
+            registry.pop(old_loop, None)
+        client = registry[loop] = factory()
+    return client
+
+
+def background_loop():
+    # A long-lived event loop on a daemon thread, for work that must outlive
+    # the request: under WSGI / runserver each async view runs on a throwaway
+    # loop and asgiref cancels whatever is still pending on it when the view
+    # returns. Recreated after a fork (the thread does not survive one).
+    global _background
+    with _background_lock:
+        if _background is None or _background[0] != os.getpid() or _background[1].is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="chat-background", daemon=True).start()
+            _background = (os.getpid(), loop)
+        return _background[1]
+
+
+def run_in_background(coro):
+    # -> concurrent.futures.Future of the coroutine's result. Context variables
+    # (e.g. the request's Server-Timing stages) are carried over.
+    return asyncio.run_coroutine_threadsafe(coro, background_loop())
+
+
+def ssl_context():
+    # Loading the CA bundle takes ~50ms: once per process, not once per client
+    # (WSGI builds a client for every request's throwaway event loop)
+    global _ssl_context
+    if _ssl_context is None:
+        import httpx
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def get_http_client():
+    import httpx
+
+    return loop_local(_clients, lambda: httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(HTTP_TIMEOUT),
+        verify=ssl_context(),
+    ))
+
+
+async def send_whatsapp_message(to, from_, body):
+    # Out-of-band reply through the Twilio REST API, for answers that missed
+    # the webhook window.
+    if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN):
+        print("❌ Cannot send follow-up: TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN not set")
+        return None
+
+    client = get_http_client()
+    response = await client.post(
+        TWILIO_MESSAGES_URL.format(sid=TWILIO_ACCOUNT_SID),
+        data={"To": to, "From": from_, "Body": body},
+        auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+        timeout=TWILIO_TIMEOUT,
+    )
+    print(f"📨 Follow-up to {to}: {response.status_code}")
+    return response
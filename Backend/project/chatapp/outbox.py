@@ -0,0 +1,221 @@
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
+from .models import OrderOutbox
+from project.metrics import timed
+import threading
+import requests
+import random
+import uuid
+import os
+
+EXPRESS_ORDER_ENDPOINT = os.getenv("EXPRESS_ORDER_ENDPOINT", "https://6051c516b18b.ngrok-free.app/twilio-callback")
+# Optional endpoint that accepts {"orders": [...]} in one request
+EXPRESS_ORDER_BATCH_ENDPOINT = os.getenv("EXPRESS_ORDER_BATCH_ENDPOINT", "")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "10"))
+# Added to the worst-case send time of a batch when sizing its lease
+OUTBOX_LEASE_MARGIN = 30
+
+# Express rejected the order itself - retrying will not help
+PERMANENT_STATUSES = {400, 401, 403, 404, 409, 410, 422}
+
+# Set by enqueue_order so an in-process worker drains right away
+_wakeup = threading.Event()
+
+
+def enqueue_order(payload):
+    row = OrderOutbox.objects.create(idempotency_key=uuid.uuid4().hex, payload=payload)
+    _wakeup.set()
+    print(f"📥 Order {row.idempotency_key} queued for Express")
+    return row
+
+
+def enqueue_orders(payloads):
+    # The lines of one multi-item order are queued all or nothing
+    with transaction.atomic():
+        rows = [OrderOutbox.objects.create(idempotency_key=uuid.uuid4().hex, payload=payload) for payload in payloads]
+    _wakeup.set()
+    print(f"📥 {len(rows)} order line(s) queued for Express")
+    return rows
+
+
+def make_session():
+    # Reused keep-alive session for every delivery made by one worker
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+def backoff_seconds(attempts):
+    # Exponential backoff with full jitter, capped
+    return random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** attempts)))
+
+
+# === 1. Claim ===
+def lease_seconds(batch_size):
+    # How long claimed rows are hidden from other workers: long enough to send
+    # every row alone at the full timeout (plus the batch request that failed
+    # first), so a live worker's rows are never reclaimed mid-send
+    return (batch_size + 1) * OUTBOX_TIMEOUT + OUTBOX_LEASE_MARGIN
+
+
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    # The lease end written to next_attempt_at doubles as the claim token:
+    # outcomes are only recorded while the row still carries it
+    now = timezone.now()
+    due = list(
+        OrderOutbox.objects
+        .filter(status=OrderOutbox.PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")[:batch_size]
+    )
+
+    # Conditional update per row: if another worker got there first, skip it
+    claimed = []
+    lease_until = now + timedelta(seconds=lease_seconds(batch_size))
+    for row in due:
+        updated = OrderOutbox.objects.filter(
+            pk=row.pk, status=OrderOutbox.PENDING, next_attempt_at=row.next_attempt_at,
+        ).update(next_attempt_at=lease_until)
+        if updated:
+            row.next_attempt_at = lease_until
+            claimed.append(row)
+    return claimed
+
+
+# === 2. Record outcome ===
+def mark_sent(rows):
+    # Express has the order whoever holds the claim now; only a row that is
+    # already finished is left alone
+    OrderOutbox.objects.filter(pk__in=[row.pk for row in rows], status=OrderOutbox.PENDING).update(
+        status=OrderOutbox.SENT, sent_at=timezone.now(), last_error="",
+    )
+
+
+def mark_failed(row, error, permanent=False):
+    attempts = row.attempts + 1
+    last_error = str(error)[:1000]
+    if permanent or attempts >= OUTBOX_MAX_ATTEMPTS:
+        status, next_attempt_at = OrderOutbox.DEAD, row.next_attempt_at
+    else:
+        status = OrderOutbox.PENDING
+        next_attempt_at = timezone.now() + timedelta(seconds=backoff_seconds(attempts))
+
+    # Only while our claim stands: a worker that reclaimed the row after the
+    # lease ran out may already have sent it
+    updated = OrderOutbox.objects.filter(
+        pk=row.pk, status=OrderOutbox.PENDING, next_attempt_at=row.next_attempt_at,
+    ).update(attempts=attempts, last_error=last_error, status=status, next_attempt_at=next_attempt_at)
+    if not updated:
+        print(f"⚠️ Order {row.idempotency_key} was reclaimed, not recording: {error}")
+        return
+    row.attempts, row.last_error, row.status, row.next_attempt_at = attempts, last_error, status, next_attempt_at
+    if status == OrderOutbox.DEAD:
+        print(f"☠️ Order {row.idempotency_key} moved to dead letter after {attempts} attempts: {error}")
+
+
+def classify(response):
+    # (ok, permanent)
+    if 200 <= response.status_code < 300:
+        return True, False
+    return False, response.status_code in PERMANENT_STATUSES
+
+
+# === 3. Deliver ===
+@timed("express.post")
+def deliver_one(session, row):
+    try:
+        response = session.post(
+            EXPRESS_ORDER_ENDPOINT,
+            json=row.payload,
+            headers={"Idempotency-Key": row.idempotency_key},
+            timeout=OUTBOX_TIMEOUT,
+        )
+    except requests.exceptions.RequestException as e:
+        mark_failed(row, e)
+        return False
+
+    ok, permanent = classify(response)
+    if ok:
+        mark_sent([row])
+    else:
+        mark_failed(row, f"HTTP {response.status_code}: {response.text[:200]}", permanent)
+    return ok
+
+
+@timed("express.post")
+def deliver_batch(session, rows):
+    orders = [{**row.payload, "idempotency_key": row.idempotency_key} for row in rows]
+    try:
+        response = session.post(EXPRESS_ORDER_BATCH_ENDPOINT, json={"orders": orders}, timeout=OUTBOX_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        for row in rows:
+            mark_failed(row, e)
+        return 0
+
+    ok, permanent = classify(response)
+    if ok:
+        mark_sent(rows)
+        return len(rows)
+    if permanent and len(rows) > 1:
+        # One bad order must not dead-letter the rest: find it by sending each alone
+        print(f"⚠️ Outbox batch rejected (HTTP {response.status_code}), sending its {len(rows)} orders one by one")
+        return sum(1 for row in rows if deliver_one(session, row))
+    for row in rows:
+        mark_failed(row, f"HTTP {response.status_code}: {response.text[:200]}", permanent)
+    return 0
+
+
+def drain_once(session, batch_size=OUTBOX_BATCH_SIZE):
+    # Returns (claimed, delivered)
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0, 0
+    if EXPRESS_ORDER_BATCH_ENDPOINT:
+        delivered = deliver_batch(session, rows)
+    else:
+        delivered = sum(1 for row in rows if deliver_one(session, row))
+    print(f"📤 Outbox: delivered {delivered}/{len(rows)} orders")
+    return len(rows), delivered
+
+
+# === 4. Worker loop ===
+def run_worker(stop_event=None, poll_seconds=OUTBOX_POLL_SECONDS):
+    stop_event = stop_event or threading.Event()
+    session = make_session()
+    print("🚚 Order outbox worker started")
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            claimed, _ = drain_once(session)
+        except Exception as e:
+            print(f"❌ Outbox worker error: {e!r}")
+            claimed = 0
+        if claimed == 0:
+            # Sleep until the next poll, or until a new order is queued
+            _wakeup.wait(poll_seconds)
+            _wakeup.clear()
+    session.close()
+
+
+def start_worker_thread():
+    thread = threading.Thread(target=run_worker, name="order-outbox", daemon=True)
+    thread.start()
+    return thread
+
+
+def outbox_stats():
+    counts = {status: 0 for status, _ in OrderOutbox.STATUS_CHOICES}
+    for row in OrderOutbox.objects.values("status").annotate(n=Count("id")):
+        counts[row["status"]] = row["n"]
+    return counts
+
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.cache import caches
+from collections import OrderedDict
+import threading
+import time
+
+
+class MemorySessionStore:
+    # Per-process LRU + TTL store. O(1) get/set; a sweeper thread drops
+    # expired conversations so the dict can't grow without bound.
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, state), least recently used first
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, state = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return state
+
+    def set(self, key, state):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, state)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def start_sweeper(self, interval):
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="chat-session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def __len__(self):
+        return len(self._data)
+
+    # The webhook is async; nothing here blocks, so call straight through
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, state):
+        self.set(key, state)
+
+    async def adelete(self, key):
+        self.delete(key)
+
+
+class CacheSessionStore:
+    # Shared by every worker process through a Django cache (database, redis,
+    # memcached...). Expiry is the cache's own timeout, so no sweeper is needed.
+    def __init__(self, alias, ttl, prefix="chat-session:"):
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, state):
+        self.cache.set(self.prefix + key, state, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self.prefix + key)
+
+    def sweep(self):
+        return 0
+
+    async def aget(self, key):
+        return await self.cache.aget(self.prefix + key)
+
+    async def aset(self, key, state):
+        await self.cache.aset(self.prefix + key, state, self.ttl)
+
+    async def adelete(self, key):
+        await self.cache.adelete(self.prefix + key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                ttl = settings.CHAT_SESSION_TTL
+                if settings.CHAT_SESSION_BACKEND == "cache":
+                    _store = CacheSessionStore(settings.CHAT_SESSION_CACHE, ttl)
+                else:
+                    _store = MemorySessionStore(ttl, settings.CHAT_SESSION_MAX_ENTRIES)
+                    _store.start_sweeper(settings.CHAT_SESSION_SWEEP_SECONDS)
+    return _store
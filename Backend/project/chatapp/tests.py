@@ -1,3 +1,909 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.conf import settings
+from django.utils import timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+import asyncio
+import time
+import threading
+import tempfile
+import shutil
+import json
+import os
 
-# Create your tests here.
+from .chatbot.fakes import HashEmbeddings
+from .chatbot.vectorstore import KEEP_INDEX_VERSIONS, build_index
+from .chatbot.bm25 import BM25_FILE, BM25Index
+from .chatbot.service import RetrieverService, index_fingerprint
+from .chatbot.compact_index import DOCS_FILE, MmapDocstore, load_store, recall_report
+from .chatbot import retrieval
+from .chatbot import pdf
+from .chatbot import llm
+from .models import OrderOutbox
+from .catalog import ProductCatalog
+from .admission import Admission, AnswerBusy
+from .sessions import CacheSessionStore, MemorySessionStore
+from . import sessions
+from .chatbot.answer_cache import AnswerCache
+from .views import parse_order
+from . import outbox
+from . import views
+
+
+def make_chunks(n):
+    return [{"content": f"paragraph {i} about waste collection route {i}", "metadata": {"page": i}} for i in range(n)]
+
+
+class IncrementalIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp, "faiss_index")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rebuild_only_embeds_changed_chunks(self):
+        chunks = make_chunks(50)
+        first = build_index(chunks, HashEmbeddings(), self.index_dir, batch_size=8, max_workers=2)
+        self.assertEqual(first["embedded"], 50)
+
+        chunks[3] = {"content": "we now also collect e-waste", "metadata": {"page": 3}}
+        del chunks[10]
+        embeddings = HashEmbeddings()
+        second = build_index(chunks, embeddings, self.index_dir, batch_size=8, max_workers=2)
+
+        self.assertEqual(second, {"chunks": 49, "embedded": 1, "reused": 48, "removed": 2})
+        self.assertEqual(embeddings.texts_embedded, 1)
+
+    def test_publish_swaps_a_link_and_keeps_index_dir_present(self):
+        # An index from before versioned builds is a plain directory
+        os.makedirs(self.index_dir)
+        with open(os.path.join(self.index_dir, "index.faiss"), "w") as f:
+            f.write("legacy")
+
+        seen_missing = []
+        stop = threading.Event()
+
+        def watch():
+            while not stop.is_set():
+                if not os.path.exists(os.path.join(self.index_dir, "index.faiss")):
+                    seen_missing.append(1)
+
+        chunks = make_chunks(10)
+        build_index(chunks, HashEmbeddings(), self.index_dir)  # one-time migration to a link
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        try:
+            for i in range(4):
+                chunks[0] = {"content": f"revision {i}", "metadata": {"page": 0}}
+                build_index(chunks, HashEmbeddings(), self.index_dir)
+        finally:
+            stop.set()
+            watcher.join()
+
+        self.assertEqual(seen_missing, [])
+        self.assertTrue(os.path.islink(self.index_dir))
+        versions = sorted(name for name in os.listdir(self.tmp) if name.startswith("faiss_index.v-"))
+        self.assertEqual(len(versions), KEEP_INDEX_VERSIONS)
+        self.assertEqual(os.path.basename(os.path.realpath(self.index_dir)), versions[-1])
+
+    def test_failed_build_leaves_no_version_behind(self):
+        build_index(make_chunks(10), HashEmbeddings(), self.index_dir)
+        published = os.path.realpath(self.index_dir)
+
+        with mock.patch("chatapp.chatbot.vectorstore.BM25Index.build", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                build_index(make_chunks(12), HashEmbeddings(), self.index_dir)
+
+        versions = [name for name in os.listdir(self.tmp) if name.startswith("faiss_index.v-")]
+        self.assertEqual(versions, [os.path.basename(published)])
+        self.assertEqual(os.path.realpath(self.index_dir), published)
+
+    def test_index_answers_queries(self):
+        build_index(make_chunks(20), HashEmbeddings(), self.index_dir)
+
+        db = load_store(self.index_dir, HashEmbeddings())
+        doc = db.similarity_search("route 7", k=1)[0]
+        self.assertEqual(doc.metadata["page"], 7)
+
+
+class IngestTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.docs = os.path.join(self.tmp, "docs")
+        os.makedirs(self.docs)
+        self.out = os.path.join(self.tmp, "chunks.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        with open(os.path.join(self.docs, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def sources(self):
+        return [chunk["metadata"]["source"] for chunk in pdf.iter_chunks(self.out)]
+
+    def test_resumes_from_checkpoint(self):
+        self.write("a.txt", "We collect plastic on Mondays.\n\nAnd glass on Fridays.")
+        self.assertEqual(pdf.ingest(self.docs, self.out, workers=1), {"files": 1, "skipped": 0, "chunks": 1})
+
+        # An interrupted run left a partial line past the checkpoint
+        with open(self.out, "ab") as f:
+            f.write(b'{"content": "half')
+        self.write("b.md", "# Pricing\nPickup costs 200 KES.")
+        self.assertEqual(pdf.ingest(self.docs, self.out, workers=1), {"files": 1, "skipped": 1, "chunks": 1})
+        self.assertEqual(self.sources(), ["a.txt", "b.md"])
+
+        # A changed document invalidates what was written for it
+        self.write("a.txt", "We now collect plastic on Tuesdays.")
+        self.assertEqual(pdf.ingest(self.docs, self.out, workers=1), {"files": 2, "skipped": 0, "chunks": 2})
+        self.assertEqual(self.sources(), ["a.txt", "b.md"])
+
+    def test_text_blocks_are_bounded_without_blank_lines(self):
+        self.write("long.txt", "route ".join("x" for _ in range(5000)))  # no newline at all
+        with mock.patch.multiple(pdf, TEXT_BLOCK_CHARS=1000, MAX_TEXT_BLOCK_CHARS=4000):
+            blocks = list(pdf.iter_text_blocks(os.path.join(self.docs, "long.txt")))
+        self.assertTrue(all(len(block) <= 4000 for block in blocks))
+        self.assertEqual("".join(blocks), "route ".join("x" for _ in range(5000)))
+
+    def test_build_index_consumes_a_stream_once(self):
+        self.write("a.txt", "\n\n".join(f"paragraph {i} about route {i}" for i in range(200)))
+        pdf.ingest(self.docs, self.out, workers=1)
+        index_dir = os.path.join(self.tmp, "faiss_index")
+        stats = build_index(pdf.iter_chunks(self.out), HashEmbeddings(), index_dir, batch_size=4, max_workers=2)
+        self.assertGreater(stats["chunks"], 8)  # several batches
+        self.assertEqual(stats["chunks"], stats["embedded"])
+        with self.assertRaises(ValueError):
+            build_index(iter([]), HashEmbeddings(), index_dir)
+        self.assertEqual(len([name for name in os.listdir(self.tmp) if name.startswith("faiss_index.v-")]), 1)
+
+
+class HybridRetrievalTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp, "faiss_index")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_bm25_ranks_exact_terms(self):
+        texts = [c["content"] for c in make_chunks(30)] + ["call our hotline on 0712 345 678 for bulk pickups"]
+        index = BM25Index.build(texts)
+        self.assertEqual(index.search("what is the hotline 0712 345 678", k=3)[0][0], 30)
+        self.assertEqual(index.search("unknown words only", k=3), [])
+
+        index.save(os.path.join(self.tmp, BM25_FILE))
+        loaded = BM25Index.load(os.path.join(self.tmp, BM25_FILE))
+        self.assertEqual(loaded.search("route 7", k=5), index.search("route 7", k=5))
+
+    def test_hybrid_search_uses_both_rankings(self):
+        chunks = make_chunks(40) + [{"content": "maize flour costs KES 1450 per 50kg bag", "metadata": {"page": 40}}]
+        build_index(chunks, HashEmbeddings(), self.index_dir)
+        self.assertTrue(os.path.exists(os.path.join(self.index_dir, BM25_FILE)))
+
+        service = RetrieverService(index_dir=self.index_dir, embeddings=HashEmbeddings())
+        loaded = service.get()
+        query = "price of a bag 1450"
+        docs = retrieval.hybrid_search(loaded, query, service.embeddings.embed_query(query), k=3)
+        self.assertEqual(len(docs), 3)
+        self.assertEqual(docs[0].metadata["page"], 40)
+
+    def test_fusion_and_context_budget(self):
+        # Found by both retrievers beats first place in only one
+        self.assertEqual(retrieval.reciprocal_rank_fusion([[1, 2, 3], [2, 4]], k=3), [2, 1, 4])
+
+        context = retrieval.build_context(["a" * 400, "b" * 400, "c" * 400], budget=250)
+        self.assertEqual(context, "a" * 400 + "\n\n" + "b" * 400)
+        self.assertEqual(retrieval.build_context(["x" * 1000], budget=10), "x" * 40)
+        self.assertEqual(retrieval.build_context([]), "No relevant context found.")
+
+
+class CompactIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp, "faiss_index")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_flat_index_loads_without_pickle(self):
+        build_index(make_chunks(20), HashEmbeddings(), self.index_dir)
+        self.assertTrue(os.path.exists(os.path.join(self.index_dir, DOCS_FILE)))
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "index.pkl")))
+
+        with mock.patch("langchain_community.vectorstores.FAISS.load_local", side_effect=AssertionError):
+            loaded = RetrieverService(index_dir=self.index_dir, embeddings=HashEmbeddings()).get()
+        self.assertIsInstance(loaded.db.docstore, MmapDocstore)
+        self.assertEqual(loaded.db.similarity_search("route 7", k=1)[0].metadata["page"], 7)
+
+    def test_ivf_index(self):
+        chunks = make_chunks(1500)
+        build_index(chunks, HashEmbeddings(), self.index_dir, index_type="ivf-sq8")
+        self.assertFalse(os.path.exists(os.path.join(self.index_dir, "index.pkl")))
+        with open(os.path.join(self.index_dir, "manifest.json"), encoding="utf-8") as f:
+            self.assertTrue(json.load(f)["index"].startswith("IVF"))
+
+        service = RetrieverService(index_dir=self.index_dir, embeddings=HashEmbeddings())
+        loaded = service.get()
+        query = "paragraph 1234 about waste collection route 1234"
+        docs = retrieval.hybrid_search(loaded, query, service.embeddings.embed_query(query), k=1)
+        self.assertEqual(docs[0].metadata["page"], 1234)
+
+    def test_recall_report(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 32)).astype(np.float32)
+        rows = recall_report(vectors, vectors[:20] + 0.01, ["flat", "ivf-sq8"], nprobes=(1, 64), k=5)
+
+        self.assertEqual(rows[0]["recall"], 1.0)
+        self.assertEqual([row["nprobe"] for row in rows], [None, 1, 64])
+        self.assertLess(rows[1]["size_bytes"], rows[0]["size_bytes"])
+        self.assertGreaterEqual(rows[2]["recall"], rows[1]["recall"])
+
+
+class RetrieverServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp, "faiss_index")
+        build_index(make_chunks(10), HashEmbeddings(), self.index_dir)
+        self.service = RetrieverService(index_dir=self.index_dir, embeddings=HashEmbeddings(), check_seconds=0.05)
+
+    def tearDown(self):
+        self.service.stop()
+        shutil.rmtree(self.tmp)
+
+    def rebuild(self, extra):
+        chunks = make_chunks(10) + [{"content": extra, "metadata": {"page": 99}}]
+        build_index(chunks, HashEmbeddings(), self.index_dir)
+
+    def test_rebuild_swaps_in_new_index_and_old_references_stay_usable(self):
+        old = self.service.get()
+        self.assertIs(self.service.get(), old)
+        self.assertFalse(self.service.reload())  # nothing changed on disk
+        swapped = []
+        self.service.on_reload(swapped.append)
+
+        self.rebuild("glass recycling drop-off at gate 99")
+        self.assertTrue(self.service.reload())
+        new = self.service.get()
+        self.assertIsNot(new, old)
+        self.assertEqual(swapped, [new])
+        self.assertNotEqual(new.version, old.version)
+        self.assertEqual((old.vectors, new.vectors), (10, 11))
+
+        # A query that started on the old snapshot finishes on it
+        self.assertEqual(old.db.similarity_search("route 7", k=1)[0].metadata["page"], 7)
+        self.assertEqual(new.db.similarity_search("glass recycling drop-off at gate 99", k=1)[0].metadata["page"], 99)
+        self.assertEqual(self.service.stats()["reloads"], 1)
+
+    def test_watcher_picks_up_rebuilds(self):
+        old = self.service.get()
+        self.service.start()
+        self.rebuild("e-waste collected on the first Monday")
+        for _ in range(100):
+            if self.service.get() is not old:
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.service.get().vectors, 11)
+
+    def test_fingerprint_and_failed_reload_keep_the_current_index(self):
+        current = self.service.get()
+        self.assertEqual(index_fingerprint(self.index_dir), current.fingerprint)
+        self.assertIsNone(index_fingerprint(os.path.join(self.tmp, "missing")))
+        with self.assertRaises(FileNotFoundError):
+            RetrieverService(index_dir=os.path.join(self.tmp, "missing"), embeddings=HashEmbeddings()).get()
+
+        # A corrupt index file changes the fingerprint but can't be loaded
+        # (replaced, not overwritten: the current index has the old one mapped)
+        corrupt = os.path.join(self.tmp, "corrupt.faiss")
+        with open(corrupt, "wb") as f:
+            f.write(b"not a faiss index")
+        os.replace(corrupt, os.path.join(self.index_dir, "index.faiss"))
+        self.assertNotEqual(index_fingerprint(self.index_dir), current.fingerprint)
+        self.assertFalse(self.service.reload())
+        self.assertIs(self.service.get(), current)
+
+        stats = self.service.stats()
+        self.assertEqual((stats["loaded"], stats["reloads"], stats["reload_errors"]), (True, 0, 1))
+        self.assertEqual((stats["version"], stats["vectors"]), (current.version, 10))
+        self.assertEqual(stats["index_size_bytes"], current.size_bytes)
+
+
+class LLMClientTests(SimpleTestCase):
+    # Against the local OpenAI-compatible fake from the benchmark suite
+    def test_client_is_reused(self):
+        from benchmarks.fakes import fake_services
+
+        with fake_services() as server:
+            self.assertIs(llm.get_client(), llm.get_client())
+            self.assertTrue(llm.complete("Question one").startswith("Fake answer"))
+            llm.complete("Question two")
+            self.assertEqual(server.completions, 2)
+
+    def test_identical_prompts_in_flight_are_coalesced(self):
+        from benchmarks.fakes import fake_services
+
+        with fake_services(llm_latency=0.3) as server:
+            with ThreadPoolExecutor(max_workers=5) as pool:
+                answers = list(pool.map(llm.complete, ["Same question?"] * 5))
+            self.assertEqual(len(set(answers)), 1)
+            self.assertEqual(server.completions, 1)
+
+            async def ask_twice():
+                return await asyncio.gather(llm.acomplete("Async question?"), llm.acomplete("Async question?"))
+
+            self.assertEqual(len(set(asyncio.run(ask_twice()))), 1)
+            self.assertEqual(server.completions, 2)
+
+    def test_followers_are_released_when_the_leader_dies(self):
+        flight = llm.SingleFlight(wait_seconds=5)
+        started = threading.Event()
+
+        def interrupted():
+            started.set()
+            time.sleep(0.2)
+            raise KeyboardInterrupt
+
+        def lead():
+            try:
+                flight.do("k", interrupted)
+            except KeyboardInterrupt:
+                pass
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        with self.assertRaises(llm.LLMBusy):
+            flight.do("k", lambda: "never called")
+        leader.join()
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_followers_give_up_after_wait_seconds(self):
+        flight = llm.SingleFlight(wait_seconds=0.05)
+
+        async def slow():
+            await asyncio.sleep(0.3)
+            return "late"
+
+        async def ask_twice():
+            return await asyncio.gather(flight.ado("k", slow), flight.ado("k", slow), return_exceptions=True)
+
+        leader, follower = asyncio.run(ask_twice())
+        self.assertEqual(leader, "late")
+        self.assertIsInstance(follower, llm.LLMBusy)
+        self.assertEqual(flight.stats()["follower_timeouts"], 1)
+
+    def test_limiter_rejects_when_queue_is_full(self):
+        limiter = llm.Limiter(limit=1, max_waiting=1, timeout=0.05)
+        with limiter.slot():
+            with self.assertRaises(llm.LLMBusy):  # waits, then times out
+                with limiter.slot():
+                    pass
+            limiter.max_waiting = 0
+            with self.assertRaises(llm.LLMBusy):  # turned away without waiting
+                with limiter.slot():
+                    pass
+
+            async def wait_async():
+                async with limiter.aslot():
+                    pass
+
+            limiter.max_waiting = 1
+            with self.assertRaises(llm.LLMBusy):
+                asyncio.run(wait_async())
+        self.assertEqual(limiter.stats(), {"limit": 1, "in_flight": 0, "waiting": 0, "max_waiting": 1,
+                                           "rejected": 1, "timeouts": 2})
+
+    def test_streaming_endpoint(self):
+        from benchmarks.fakes import fake_retriever, fake_services
+        from django.test import AsyncClient
+
+        async def stream():
+            response = await AsyncClient().get("/chat/stream/", {"q": "When is the pickup on route 3?"})
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode("utf-8")
+            return response, body
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with fake_services(token_delay=0.01), fake_retriever(make_chunks(10), tmp):
+            response, body = asyncio.run(stream())
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        tokens = [json.loads(line[6:])["text"] for line in body.splitlines() if line.startswith("data: {\"text")]
+        self.assertGreater(len(tokens), 1)
+        self.assertTrue("".join(tokens).startswith("Fake answer ("))
+        self.assertTrue(body.rstrip().endswith("event: done\ndata: {}"))
+
+    def test_stream_errors_do_not_leak_details(self):
+        from django.test import AsyncClient
+
+        async def failing(query):
+            raise RuntimeError("groq key gsk_secret rejected")
+            yield
+
+        async def stream():
+            response = await AsyncClient().get("/chat/stream/", {"q": "hello"})
+            return b"".join([chunk async for chunk in response.streaming_content]).decode("utf-8")
+
+        with mock.patch.object(views, "astream_answer", failing):
+            body = asyncio.run(stream())
+        self.assertIn("event: error", body)
+        self.assertNotIn("gsk_secret", body)
+
+
+class SessionStoreTests(SimpleTestCase):
+    def test_memory_store_lru_and_ttl(self):
+        store = MemorySessionStore(ttl=60, max_entries=2)
+        store.set("a", {"state": "ordering"})
+        store.set("b", {"state": "ordering"})
+        self.assertEqual(store.get("a"), {"state": "ordering"})  # a is now most recent
+        store.set("c", {"state": "ordering"})
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(len(store), 2)
+
+        with mock.patch("chatapp.sessions.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(store.get("a"))  # expired on read
+            self.assertEqual(store.sweep(), 1)  # c, never read again
+        self.assertEqual(len(store), 0)
+
+    def test_cache_store_roundtrip(self):
+        store = CacheSessionStore("default", ttl=60, prefix=f"test-session-{time.time()}:")
+
+        async def flow():
+            await store.aset("whatsapp:+1", {"state": "ordering", "attempts": 1})
+            state = await store.aget("whatsapp:+1")
+            await store.adelete("whatsapp:+1")
+            return state, await store.aget("whatsapp:+1")
+
+        self.assertEqual(asyncio.run(flow()), ({"state": "ordering", "attempts": 1}, None))
+
+
+class WebhookTests(TransactionTestCase):
+    def send(self, body, sender="whatsapp:+254711"):
+        response = self.client.post("/chat/whatsapp/", {"Body": body, "From": sender, "To": "whatsapp:+100"})
+        return response.content.decode("utf-8")
+
+    def test_ordering_state_is_shared_and_allows_corrections(self):
+        with mock.patch.object(sessions, "_store", None):
+            self.assertIsInstance(sessions.get_session_store(), CacheSessionStore)  # the default
+        self.assertIn("Please send your order", self.send("order"))
+        # Another worker process sees the same conversation through the cache
+        other_worker = CacheSessionStore(settings.CHAT_SESSION_CACHE, settings.CHAT_SESSION_TTL)
+        self.assertEqual(other_worker.get("whatsapp:+254711"), {"state": "ordering", "attempts": 0})
+
+        for attempt in range(1, views.MAX_ORDER_ATTEMPTS):
+            self.assertIn(views.ORDER_HELP, self.send("maize please"))
+            self.assertEqual(other_worker.get("whatsapp:+254711")["attempts"], attempt)
+        self.send("maize please")
+        self.assertIsNone(other_worker.get("whatsapp:+254711"))
+
+    def test_late_answer_is_sent_out_of_band(self):
+        # The sync test Client runs the async view on a throwaway loop, as WSGI does
+        async def slow_answer(question, exact_checked=False):
+            await asyncio.sleep(0.3)
+            return "Pickups are on Mondays."
+
+        send = mock.AsyncMock()
+        with mock.patch.multiple(views, REPLY_DEADLINE=0.05, aquey_vectorstore=slow_answer,
+                                 answer_cache=AnswerCache(path=None), send_whatsapp_message=send):
+            response = self.client.post("/chat/whatsapp/", {"Body": "When is pickup?", "From": "whatsapp:+254700",
+                                                            "To": "whatsapp:+100"})
+            self.assertIn("shortly", response.content.decode("utf-8"))
+            for _ in range(100):
+                if send.await_count:
+                    break
+                time.sleep(0.02)
+
+        send.assert_awaited_once_with("whatsapp:+254700", "whatsapp:+100",
+                                      views.format_answer("Pickups are on Mondays."))
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def test_lru_eviction(self):
+        cache = AnswerCache(path=None, max_entries=2)
+        cache.put("a?", None, "A")
+        cache.put("b?", None, "B")
+        self.assertEqual(cache.get_exact("A"), "A")  # a is now most recent
+        cache.put("c?", None, "C")
+        self.assertIsNone(cache.get_exact("b"))
+        self.assertEqual((cache.get_exact("a"), cache.get_exact("c")), ("A", "C"))
+        stats = cache.stats()
+        self.assertEqual((stats["evictions"], stats["exact_hits"], stats["exact_misses"]), (1, 3, 1))
+
+    def test_ttl_expiry_and_stale_eviction(self):
+        cache = AnswerCache(path=None, ttl=10, stale_seconds=100)
+        cache.put("pickup?", None, "Mondays.")
+        cache._entries["pickup"]["created"] -= 50  # expired, still within the stale window
+        self.assertIsNone(cache.get_exact("pickup?"))
+        self.assertEqual(cache.get_exact("pickup?", allow_expired=True), "Mondays.")
+
+        cache._entries["pickup"]["created"] -= 100  # past the stale window: evicted on lookup
+        self.assertIsNone(cache.get_exact("pickup?", allow_expired=True))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["expirations"], stats["stale_hits"]), (0, 1, 1))
+
+    def test_similar_skips_expired_best_match(self):
+        cache = AnswerCache(path=None, ttl=10, threshold=0.9)
+        cache.put("where are you", [1.0, 0.0], "Old answer")
+        cache.put("where are you located", [0.95, 0.05], "Nairobi")
+        cache._entries["where are you"]["created"] -= 60
+        self.assertEqual(cache.get_similar([1.0, 0.0]), "Nairobi")
+        self.assertIsNone(cache.get_similar([0.0, 1.0]))
+        stats = cache.stats()
+        self.assertEqual((stats["semantic_hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_persistence_and_version_invalidation(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "answers.json")
+            cache = AnswerCache(path=path, save_seconds=3600)
+            cache.check_version("v1")
+            cache.put("hours?", [0.0, 1.0], "9 to 5")
+            cache.save()
+
+            warm = AnswerCache(path=path)
+            self.assertEqual(warm.index_version, "v1")
+            self.assertEqual(warm.get_exact("Hours"), "9 to 5")
+            self.assertEqual(warm.get_similar([0.0, 2.0]), "9 to 5")
+
+            warm.check_version("v1")  # same index: kept
+            self.assertEqual(warm.stats()["size"], 1)
+            warm.check_version("v2")  # rebuilt index: answers are stale
+            self.assertIsNone(warm.get_exact("hours?"))
+            self.assertEqual(warm.stats()["invalidations"], 1)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class AnswerCacheSaveTests(SimpleTestCase):
+    def test_put_does_not_wait_for_the_save(self):
+        tmp = tempfile.mkdtemp()
+        release = threading.Event()
+        saved = threading.Event()
+
+        def slow_save(cache):
+            release.wait(5)
+            saved.set()
+
+        try:
+            cache = AnswerCache(path=os.path.join(tmp, "answers.json"))
+            with mock.patch.object(AnswerCache, "save", slow_save):
+                started = time.monotonic()
+                cache.put("hours?", None, "9 to 5")
+                cache.put("where?", None, "Nairobi")  # one save queued at a time
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertFalse(saved.is_set())
+                release.set()
+                self.assertTrue(saved.wait(5))
+        finally:
+            release.set()
+            shutil.rmtree(tmp)
+
+
+class StubExpress(BaseHTTPRequestHandler):
+    # Replies with the next status in `statuses`, records what it received
+    statuses = []
+    received = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubExpress.received.append((self.headers.get("Idempotency-Key"), body))
+        status = StubExpress.statuses.pop(0) if StubExpress.statuses else 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class OrderOutboxTests(TestCase):
+    def setUp(self):
+        StubExpress.statuses = []
+        StubExpress.received = []
+        self.server = HTTPServer(("127.0.0.1", 0), StubExpress)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/twilio-callback"
+        patcher = mock.patch.multiple(outbox, EXPRESS_ORDER_ENDPOINT=url, EXPRESS_ORDER_BATCH_ENDPOINT="",
+                                      OUTBOX_MAX_ATTEMPTS=3, backoff_seconds=lambda attempts: 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = outbox.make_session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_until_delivered_with_same_idempotency_key(self):
+        row = outbox.enqueue_order({"Name": "John", "product": "Maize Flour", "quantity": 50})
+        StubExpress.statuses = [503]
+
+        self.assertEqual(outbox.drain_once(self.session), (1, 0))
+        self.assertEqual(outbox.drain_once(self.session), (1, 1))
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, OrderOutbox.SENT)
+        self.assertEqual(row.attempts, 1)
+        self.assertEqual([key for key, _ in StubExpress.received], [row.idempotency_key] * 2)
+
+    def test_dead_letter_after_max_attempts(self):
+        row = outbox.enqueue_order({"Name": "Jane", "product": "Rice", "quantity": 2})
+        StubExpress.statuses = [500, 500, 500]
+
+        for _ in range(3):
+            outbox.drain_once(self.session)
+
+        row.refresh_from_db()
+        self.assertEqual(row.status, OrderOutbox.DEAD)
+        self.assertEqual(outbox.drain_once(self.session), (0, 0))
+
+    def test_batch_endpoint_sends_one_request(self):
+        for i in range(5):
+            outbox.enqueue_order({"Name": f"C{i}", "product": "Rice", "quantity": i + 1})
+
+        with mock.patch.object(outbox, "EXPRESS_ORDER_BATCH_ENDPOINT", outbox.EXPRESS_ORDER_ENDPOINT):
+            self.assertEqual(outbox.drain_once(self.session), (5, 5))
+
+        self.assertEqual(len(StubExpress.received), 1)
+        self.assertEqual(len(StubExpress.received[0][1]["orders"]), 5)
+        self.assertEqual(OrderOutbox.objects.filter(status=OrderOutbox.SENT).count(), 5)
+
+    def test_rejected_batch_falls_back_to_single_sends(self):
+        rows = [outbox.enqueue_order({"Name": f"C{i}", "product": "Rice", "quantity": i + 1}) for i in range(3)]
+        # The batch is refused over one bad order; sent alone, only that one fails
+        StubExpress.statuses = [422, 200, 422, 200]
+
+        with mock.patch.object(outbox, "EXPRESS_ORDER_BATCH_ENDPOINT", outbox.EXPRESS_ORDER_ENDPOINT):
+            self.assertEqual(outbox.drain_once(self.session), (3, 2))
+
+        statuses = [OrderOutbox.objects.get(pk=row.pk).status for row in rows]
+        self.assertEqual(statuses, [OrderOutbox.SENT, OrderOutbox.DEAD, OrderOutbox.SENT])
+        self.assertEqual([key for key, _ in StubExpress.received[1:]], [row.idempotency_key for row in rows])
+
+
+    def test_lease_covers_a_batch_sent_row_by_row(self):
+        self.assertGreater(outbox.lease_seconds(20), 21 * outbox.OUTBOX_TIMEOUT)
+
+    def test_failure_after_losing_the_claim_is_not_recorded(self):
+        row = outbox.enqueue_order({"Name": "John", "product": "Maize Flour", "quantity": 50})
+        [claimed] = outbox.claim_batch()
+        # Lease ran out: another worker reclaimed the row and delivered it
+        OrderOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+        [other] = outbox.claim_batch()
+        outbox.mark_sent([other])
+
+        outbox.mark_failed(claimed, "HTTP 503: busy")
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts, row.last_error), (OrderOutbox.SENT, 0, ""))
+
+class ServingTests(SimpleTestCase):
+    def test_background_work_is_opt_in(self):
+        from . import apps
+
+        for argv in (["manage.py", "migrate"], ["manage.py", "test"], ["celery", "worker"], ["script.py"]):
+            with mock.patch.object(apps.sys, "argv", argv):
+                self.assertFalse(apps.is_serving(), argv)
+        with mock.patch.object(apps.sys, "argv", ["manage.py", "runserver"]), \
+                mock.patch.dict(os.environ, {"RUN_MAIN": "true"}):
+            self.assertTrue(apps.is_serving())
+        # gunicorn/uvicorn import project.wsgi / project.asgi, which opt in
+        with mock.patch.object(apps.sys, "argv", ["gunicorn"]), mock.patch.object(apps, "_serving", False):
+            apps.mark_serving()
+            self.assertTrue(apps.is_serving())
+
+
+CATALOG = [
+    {"sku": "MF-001", "name": "Maize Flour", "aliases": ["unga", "corn flour"]},
+    {"sku": "WF-001", "name": "Wheat Flour", "aliases": ["atta"]},
+    {"sku": "RC-001", "name": "Rice", "aliases": ["basmati rice"]},
+    {"sku": "SG-001", "name": "Sugar", "aliases": []},
+]
+
+
+class ProductCatalogTests(TestCase):
+    def setUp(self):
+        self.catalog = ProductCatalog(CATALOG)
+
+    def test_fuzzy_match_resolves_to_sku(self):
+        result = self.catalog.resolve("maze flour")
+        self.assertEqual(result["sku"], "MF-001")
+        self.assertGreater(result["confidence"], 0.5)
+        self.assertEqual(self.catalog.resolve("UNGA")["sku"], "MF-001")
+        self.assertEqual(self.catalog.resolve("mf-001")["confidence"], 1.0)
+
+        unknown = self.catalog.resolve("chocolate")
+        self.assertIsNone(unknown["sku"])
+        self.assertTrue(unknown["alternatives"])
+
+    def test_close_runner_up_is_not_a_match(self):
+        flour = self.catalog.resolve("flour")
+        self.assertIsNone(flour["sku"])
+        self.assertTrue(flour["ambiguous"])
+        self.assertEqual({alt["sku"] for alt in flour["alternatives"][:2]}, {"MF-001", "WF-001"})
+        error = parse_order("John, flour, 5", "+1", self.catalog)[1]
+        self.assertIn("more than one product", error)
+        self.assertIn("Maize Flour", error)
+
+    def test_no_catalog_by_default(self):
+        # Orders for anything are forwarded as typed unless a catalog is configured
+        with mock.patch("chatapp.catalog.CATALOG_PATH", ""):
+            payloads, error = parse_order("John, Chocolate, 5", "+1")
+        self.assertIsNone(error)
+        self.assertEqual(payloads[0]["product"], "Chocolate")
+        self.assertNotIn("sku", payloads[0])
+
+    def test_batch_matches_single(self):
+        texts = ["maze flour", "wheat flower", "rice", "suger", "chocolate", "maze flour"]
+        self.assertEqual(self.catalog.resolve_many(texts), [self.catalog.resolve(t) for t in texts])
+
+    def test_multi_item_order(self):
+        payloads, error = parse_order("john, maze flour 50, 2 rice, sugar, 3", "whatsapp:+254700", self.catalog)
+        self.assertIsNone(error)
+        self.assertEqual([(p["sku"], p["quantity"]) for p in payloads], [("MF-001", 50), ("RC-001", 2), ("SG-001", 3)])
+        self.assertEqual({p["order_ref"] for p in payloads}, {payloads[0]["order_ref"]})
+        self.assertEqual(payloads[0]["Name"], "John")
+
+        payloads, error = parse_order("John, Maize Flour, 50", "whatsapp:+254700", self.catalog)
+        self.assertEqual(len(payloads), 1)
+        self.assertNotIn("order_ref", payloads[0])
+        self.assertIn("Did you mean", parse_order("John, chocolate, 5", "+1", self.catalog)[1])
+
+        rows = outbox.enqueue_orders(parse_order("John, rice 2, sugar 1", "+1", self.catalog)[0])
+        self.assertEqual(OrderOutbox.objects.filter(pk__in=[row.pk for row in rows]).count(), 2)
+
+    def test_batch_resolve_endpoint(self):
+        with mock.patch("chatapp.views.get_catalog", return_value=self.catalog):
+            response = self.client.post("/chat/catalog/resolve/", {"items": ["maze flour", "atta"]},
+                                        content_type="application/json")
+            text = self.client.post("/chat/catalog/resolve/", "maze flour\natta\n", content_type="text/plain")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["sku"] for r in response.json()["results"]], ["MF-001", "WF-001"])
+        self.assertEqual(text.json()["results"], response.json()["results"])
+
+
+class AdmissionTests(SimpleTestCase):
+    def test_deadline_aware_admission(self):
+        admission = Admission(limit=1, max_waiting=4, timeout=1)
+        admission.service_seconds = 0.5
+
+        async def ask(deadline):
+            async with admission.aslot(deadline=deadline):
+                pass
+
+        with admission.slot():
+            # A 0.5s answer behind a busy slot cannot make a 0.3s deadline: no waiting
+            started = time.monotonic()
+            with self.assertRaises(AnswerBusy):
+                asyncio.run(ask(time.monotonic() + 0.3))
+            self.assertLess(time.monotonic() - started, 0.1)
+            # Enough budget: queues, then gives up when the budget runs out
+            with self.assertRaises(AnswerBusy):
+                asyncio.run(ask(time.monotonic() + 0.7))
+        asyncio.run(ask(time.monotonic() + 0.3))  # free slot -> admitted
+
+        stats = admission.stats()
+        self.assertEqual((stats["shed"], stats["timeouts"], stats["in_flight"]), (1, 1, 0))
+        self.assertLess(stats["avg_answer_seconds"], 0.5)
+
+    def test_saturated_webhook_degrades(self):
+        admission = Admission(limit=1, max_waiting=0, timeout=1, max_follow_ups=1)
+        cache = AnswerCache(path=None, ttl=1)
+        cache.put("When is pickup?", None, "Mondays.")
+        cache._entries["when is pickup"]["created"] -= 60  # expired
+
+        async def ask(question):
+            response = await views.answer_question(question, "whatsapp:+254700", "whatsapp:+100")
+            return response.content.decode("utf-8")
+
+        async def answer(question, exact_checked=False):
+            return f"Answer to {question}"
+
+        send = mock.AsyncMock()
+        with mock.patch.multiple(views, answer_admission=admission, answer_cache=cache,
+                                 aquey_vectorstore=answer, send_whatsapp_message=send):
+            with admission.slot():
+                self.assertIn("Mondays.", asyncio.run(ask("When is pickup?")))
+                self.assertIn("shortly", asyncio.run(ask("Where do you operate?")))
+                # The one follow-up allowed is queued for a slot
+                self.assertIn("try again in a minute", asyncio.run(ask("Where do you operate?")))
+                self.assertEqual(send.await_count, 0)
+
+            # Slot freed -> the follow-up is answered and delivered
+            for _ in range(100):
+                if send.await_count:
+                    break
+                time.sleep(0.02)
+            send.assert_awaited_once_with("whatsapp:+254700", "whatsapp:+100",
+                                          views.format_answer("Answer to Where do you operate?"))
+
+        stats = admission.stats()
+        self.assertEqual(stats["degraded"], {"stale_cache": 1, "follow_up": 1, "busy": 1})
+        self.assertEqual((stats["rejected"], stats["follow_ups"], stats["in_flight"]), (3, 0, 0))
+
+    def test_follow_up_outlasts_the_queue_timeout(self):
+        # The slot stays busy longer than the 0.1s queue timeout; the follow-up
+        # keeps its place until its own deadline and is still delivered
+        admission = Admission(limit=1, max_waiting=0, timeout=0.1, max_follow_ups=1)
+
+        async def answer(question, exact_checked=False):
+            return f"Answer to {question}"
+
+        send = mock.AsyncMock()
+        with mock.patch.multiple(views, answer_admission=admission, answer_cache=AnswerCache(path=None),
+                                 aquey_vectorstore=answer, send_whatsapp_message=send):
+            with admission.slot():
+                response = asyncio.run(views.answer_question("Do you deliver?", "whatsapp:+254700", "whatsapp:+100"))
+                self.assertIn("shortly", response.content.decode("utf-8"))
+                time.sleep(0.3)
+                self.assertEqual(send.await_count, 0)
+
+            for _ in range(100):
+                if send.await_count:
+                    break
+                time.sleep(0.02)
+            send.assert_awaited_once_with("whatsapp:+254700", "whatsapp:+100",
+                                          views.format_answer("Answer to Do you deliver?"))
+        self.assertEqual(admission.stats()["timeouts"], 0)
+
+    def test_failed_follow_up_still_replies(self):
+        admission = Admission(limit=1, max_waiting=0, timeout=0.1, max_follow_ups=1)
+        send = mock.AsyncMock()
+        with mock.patch.multiple(views, answer_admission=admission, answer_cache=AnswerCache(path=None),
+                                 send_whatsapp_message=send, FOLLOW_UP_DEADLINE=0.2):
+            with admission.slot():
+                asyncio.run(views.answer_question("Do you deliver?", "whatsapp:+254700", "whatsapp:+100"))
+                for _ in range(100):
+                    if send.await_count:
+                        break
+                    time.sleep(0.02)
+        send.assert_awaited_once_with("whatsapp:+254700", "whatsapp:+100", views.LATE_FAILURE_REPLY)
+
+    def test_exact_miss_is_counted_once(self):
+        cache = AnswerCache(path=None)
+        loaded = mock.Mock(version="v1")
+        service = mock.Mock(get=lambda: loaded)
+        service.embeddings.aembed_query = mock.AsyncMock(return_value=[1.0, 0.0])
+        with mock.patch.multiple(retrieval, answer_cache=cache, retriever_service=service,
+                                 hybrid_search=lambda *args: [], acomplete=mock.AsyncMock(return_value="Nairobi")), \
+                mock.patch.multiple(views, answer_cache=cache, answer_admission=Admission(limit=1)):
+            answer = asyncio.run(views.admitted_answer("Where are you?", time.monotonic() + 5))
+        self.assertEqual(answer, "Nairobi")
+        self.assertEqual((cache.stats()["exact_misses"], cache.stats()["misses"]), (1, 1))
+
+    def test_slots_are_handed_over_in_arrival_order(self):
+        limiter = Admission(limit=1, max_waiting=10, timeout=2)
+        order = []
+
+        def take_sync(name):
+            with limiter.slot():
+                order.append(name)
+
+        async def take_async(name):
+            async with limiter.aslot():
+                order.append(name)
+
+        with limiter.slot():
+            threads = []
+            for name, target in [("a", take_sync), ("b", lambda n: asyncio.run(take_async(n))), ("c", take_sync)]:
+                threads.append(threading.Thread(target=target, args=(name,)))
+                threads[-1].start()
+                while limiter.stats()["waiting"] < len(threads):
+                    time.sleep(0.001)
+        take_sync("d")  # a newcomer queues behind them instead of grabbing the freed slot
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order[-1], "d")
+        self.assertEqual(order[:3], ["a", "b", "c"])
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_limiters_are_exported(self):
+        from project.metrics import registry
+
+        text = registry.render()
+        self.assertIn('bookkeeping_queue_depth{limiter="answer"} 0', text)
+        self.assertIn('bookkeeping_rejections_total{limiter="answer",reason="deadline"}', text)
+        self.assertIn("# TYPE bookkeeping_degraded_replies_total counter", text)
@@ -0,0 +1,14 @@
+# urls.py
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("whatsapp/", views.whatsapp_chatbot, name="whatsapp_chatbot"),
+    path("retriever/stats/", views.retriever_stats_view, name="retriever_stats"),
+    path("cache/stats/", views.answer_cache_stats_view, name="answer_cache_stats"),
+    path("stream/", views.chat_stream_view, name="chat_stream"),
+    path("llm/stats/", views.llm_stats_view, name="llm_stats"),
+    path("admission/stats/", views.admission_stats_view, name="admission_stats"),
+    path("catalog/resolve/", views.catalog_resolve_view, name="catalog_resolve"),
+    path("outbox/stats/", views.outbox_stats_view, name="outbox_stats"),
+]
@@ -1,115 +1,353 @@
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
-from twilio.twiml.messaging_response import MessagingResponse
-from .chatbot.retrieval import quey_vectorstore
-import requests
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .chatbot.retrieval import aquey_vectorstore, astream_answer
+from .chatbot.llm import LLMBusy, llm_stats
+from .outbound import run_in_background, send_whatsapp_message
+from .outbox import enqueue_orders, outbox_stats
+from .catalog import MAX_RESOLVE_BATCH, get_catalog
+from .admission import answer_admission
+from .sessions import get_session_store
+from asgiref.sync import sync_to_async
+from .chatbot.service import retriever_service
+from .chatbot.answer_cache import answer_cache
+from project.metrics import timed
+import asyncio
+import json
+import uuid
+import time
 import os
 import re
 
-# Track user sessions with state
-user_sessions = {}
+# Give up on an order after this many badly formatted replies (it used to end
+# at the first one; the customer now stays in the ordering flow to correct it)
+MAX_ORDER_ATTEMPTS = 3
+
+# Twilio gives up on a webhook after 15s; answer inline only if we can beat that
+REPLY_DEADLINE = float(os.getenv("TWILIO_REPLY_DEADLINE", "10"))
+# Upper bound for an answer that is delivered out-of-band
+FOLLOW_UP_DEADLINE = float(os.getenv("FOLLOW_UP_DEADLINE", "120"))
+
+BUSY_REPLY = "⏳ We're answering a lot of questions right now. Please try again in a minute."
+SHORTLY_REPLY = "⏳ Give me a moment, I'll send you the answer shortly."
+LATE_FAILURE_REPLY = "😔 Sorry, we couldn't answer your question in time. Please send it again in a few minutes."
+
+ORDER_HELP = "❗Please provide: Name, Product, Quantity\nExample: John, Maize Flour, 50"
+
+def twiml(text=None):
+    from twilio.twiml.messaging_response import MessagingResponse
+
+    response = MessagingResponse()
+    if text:
+        response.message(text)
+    return HttpResponse(str(response), content_type="application/xml")
+
+
+QUANTITY = r"(\d+)\s*(?:x|pcs|pieces|units?|bags?|kgs?|packets?)?"
+QUANTITY_ONLY = re.compile(rf"^{QUANTITY}$", re.I)
+QUANTITY_FIRST = re.compile(rf"^{QUANTITY}\s+(?:of\s+)?(.+)$", re.I)
+QUANTITY_LAST = re.compile(rf"^(.+?)\s+{QUANTITY}$", re.I)
+
+
+def split_order_lines(parts):
+    # "Maize Flour, 50" / "Maize Flour 50" / "50 Maize Flour" -> [[product, quantity]]
+    lines = []
+    for part in parts:
+        bare = QUANTITY_ONLY.match(part)
+        if bare:
+            if not lines:
+                return None
+            if lines[-1][1] is not None:
+                # "Sugar 2kg, 5": the number belonged to the product name
+                if lines[-1][2] is None:
+                    return None
+                lines[-1][0] = lines[-1][2]
+            lines[-1][1], lines[-1][2] = int(bare.group(1)), None
+            continue
+        first, last = QUANTITY_FIRST.match(part), QUANTITY_LAST.match(part)
+        if first:
+            lines.append([first.group(2), int(first.group(1)), part])
+        elif last:
+            lines.append([last.group(1), int(last.group(2)), part])
+        else:
+            lines.append([part, None, None])
+    return lines
+
+
+def parse_order(user_message, from_number, catalog=None):
+    # Returns ([payload per order line], None) or (None, error message for the customer)
+    clean_message = user_message.split('...')[0].split('..')[0].strip()
+    normalized_message = re.sub(r'[.,;]', ',', clean_message)
+    parts = [x.strip() for x in normalized_message.split(",") if x.strip()]
+
+    if len(parts) < 2:
+        return None, ORDER_HELP
+
+    name = parts[0]
+    lines = split_order_lines(parts[1:])
+    if lines is None or any(quantity is None for _, quantity, _ in lines):
+        if len(parts) < 3:
+            return None, ORDER_HELP
+        return None, "❗Quantity must be a number. Please send like: John, Maize Flour, 50"
+
+    # Canonical product + SKU from the catalog; without one the product goes out as typed
+    catalog = catalog or get_catalog()
+    matches = catalog.resolve_many([product for product, _, _ in lines]) if catalog else [None] * len(lines)
+    for match in matches:
+        if match and match["sku"] is None:
+            suggestions = ", ".join(alt["name"] for alt in match["alternatives"])
+            hint = f" Did you mean: {suggestions}?" if suggestions else ""
+            problem = "matches more than one product" if match["ambiguous"] else "isn't in our catalog"
+            return None, f"❓ \"{match['query']}\" {problem}.{hint}\nPlease send your order again, e.g. John, Maize Flour, 50"
+
+    order_ref = uuid.uuid4().hex[:12] if len(lines) > 1 else None
+    payloads = []
+    for number, ((product, quantity, _), match) in enumerate(zip(lines, matches), start=1):
+        # Prepare the CORRECT payload format for Express
+        payload = {
+            "Name": name.title(),
+            "product": match["name"] if match else product.title(),
+            "quantity": quantity,
+            "phone": from_number.replace('whatsapp:', ''),
+            "message": user_message
+        }
+        if match:
+            payload.update(sku=match["sku"], match_confidence=match["confidence"])
+        if order_ref:
+            payload.update(order_ref=order_ref, line=number, lines=len(lines))
+        payloads.append(payload)
+    return payloads, None
+
+
+def order_summary(payloads):
+    return ", ".join(f"{p['quantity']} x {p['product']}" for p in payloads)
+
+
+def format_answer(answer):
+    # Append Order Option to the chatbot response
+    return f"{answer}\n\nIf you'd like to place an order, type ORDER."
+
+
+async def deliver_later(future, to_number, from_number):
+    # future: concurrent.futures.Future of an answer being computed in the background.
+    # The customer was promised an answer, so a failure still gets a reply.
+    try:
+        answer = await asyncio.wait_for(asyncio.wrap_future(future), timeout=FOLLOW_UP_DEADLINE)
+        message = format_answer(answer)
+    except Exception as e:
+        print(f"❌ Follow-up answer for {to_number} failed: {e!r}")
+        message = LATE_FAILURE_REPLY
+    try:
+        await send_whatsapp_message(to_number, from_number, message)
+    except Exception as e:
+        print(f"❌ Follow-up for {to_number} could not be sent: {e!r}")
+
+
+async def admitted_answer(user_message, deadline, bounded=True, wait_until=None):
+    # Cached answers need no slot, so they keep flowing when saturated
+    cached = answer_cache.get_exact(user_message)
+    if cached is not None:
+        return cached
+    async with answer_admission.aslot(deadline=deadline, bounded=bounded, wait_until=wait_until):
+        return await aquey_vectorstore(user_message, exact_checked=True)
+
+
+async def follow_up_answer(user_message):
+    # Waits for a slot outside the bounded queue (follow-ups have their own
+    # cap), for as long as the follow-up deadline allows
+    deadline = time.monotonic() + FOLLOW_UP_DEADLINE
+    try:
+        return await admitted_answer(user_message, deadline, bounded=False, wait_until=deadline)
+    finally:
+        answer_admission.end_follow_up()
+
+
+def degraded_reply(user_message, from_number, to_number):
+    # 1. An expired cached answer beats no answer
+    cached = answer_cache.get_exact(user_message, allow_expired=True)
+    if cached is not None:
+        answer_admission.count_degraded("stale_cache")
+        return twiml(format_answer(cached))
+
+    # 2. Answer out-of-band once the spike has passed
+    if answer_admission.begin_follow_up():
+        answer_admission.count_degraded("follow_up")
+        future = run_in_background(follow_up_answer(user_message))
+        run_in_background(deliver_later(future, from_number, to_number))
+        return twiml(SHORTLY_REPLY)
+
+    answer_admission.count_degraded("busy")
+    return twiml(BUSY_REPLY)
+
+
+@timed("chat.answer")
+async def answer_question(user_message, from_number, to_number):
+    started = time.monotonic()
+    # Computed on the background loop, so an answer that misses the deadline
+    # survives this request and can still be sent out-of-band: once queued it
+    # may wait until the follow-up deadline, not just the queue timeout
+    future = run_in_background(admitted_answer(user_message, started + REPLY_DEADLINE,
+                                               wait_until=started + FOLLOW_UP_DEADLINE))
+    try:
+        # shield: a timeout here must not cancel the answer we still want to send
+        answer = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=REPLY_DEADLINE)
+    except LLMBusy as e:
+        print(f"🚦 Saturated, degraded reply to {from_number}: {e}")
+        return degraded_reply(user_message, from_number, to_number)
+    except asyncio.TimeoutError:
+        print(f"⏳ No answer within {REPLY_DEADLINE}s, replying out-of-band to {from_number}")
+        run_in_background(deliver_later(future, from_number, to_number))
+        return twiml(SHORTLY_REPLY)
+
+    return twiml(format_answer(answer))
 
-EXPRESS_ORDER_ENDPOINT = "https://6051c516b18b.ngrok-free.app/twilio-callback"
 
 @csrf_exempt
-def whatsapp_chatbot(request):
+async def whatsapp_chatbot(request):
     if request.method == "POST":
         try:
             user_message = request.POST.get("Body", "").strip()
             from_number = request.POST.get("From", "")
-            
-            print(f"📱 Received: '{user_message}' from {from_number}")
+            to_number = request.POST.get("To", "")
 
-            response = MessagingResponse()
+            print(f"📱 Received: '{user_message}' from {from_number}")
 
             if not user_message:
-                response.message("⚠️ I didn't receive any message. Please type something.")
-                return HttpResponse(str(response), content_type="application/xml")
+                return twiml("⚠️ I didn't receive any message. Please type something.")
+
+            # Conversation state lives in the shared session store
+            sessions = get_session_store()
+            with timed("session"):
+                session = await sessions.aget(from_number) or {}
 
             # Check if user is in ordering state
-            if from_number in user_sessions and user_sessions[from_number] == "ordering":
+            if session.get("state") == "ordering":
                 print("🛒 Processing order...")
-                
-                # Clear session immediately
-                user_sessions.pop(from_number, None)
-                
+
                 try:
-                    # Parse the order message properly
-                    clean_message = user_message.split('...')[0].split('..')[0].strip()
-                    normalized_message = re.sub(r'[.,;]', ',', clean_message)
-                    parts = [x.strip() for x in normalized_message.split(",") if x.strip()]
-                    
-                    if len(parts) >= 3:
-                        name, product, quantity = parts[0], parts[1], parts[2]
-                        
-                        # Clean quantity (remove non-digits)
-                        quantity_clean = re.sub(r'[^\d]', '', quantity)
-                        if not quantity_clean:
-                            response.message("❗Quantity must be a number. Please send like: John, Maize Flour, 50")
-                            return HttpResponse(str(response), content_type="application/xml")
-                        
-                        # Prepare the CORRECT payload format for Express
-                        payload = {
-                            "Name": name.title(),
-                            "product": product.title(), 
-                            "quantity": int(quantity_clean),
-                            "phone": from_number.replace('whatsapp:', ''),
-                            "message": user_message
-                        }
-                        
-                        print(f"📤 Sending to Express: {EXPRESS_ORDER_ENDPOINT}")
-                        print(f"📦 Corrected Payload: {payload}")
-                        
-                        # Send to Express endpoint
-                        try:
-                            express_response = requests.post(
-                                EXPRESS_ORDER_ENDPOINT,
-                                json=payload,
-                                headers={'Content-Type': 'application/json'},
-                                timeout=10
-                            )
-                            print(f"✅ Express response: {express_response.status_code}")
-                            
-                            if express_response.status_code == 200:
-                                response.message("✅ Order received successfully! We'll process it shortly.")
-                            else:
-                                response.message("✅ Order received! We're processing it.")
-                                
-                        except requests.exceptions.RequestException as e:
-                            print(f"❌ Express error: {e}")
-                            response.message("✅ Order received! We'll process it shortly.")
-                        
-                    else:
-                        response.message("❗Please provide: Name, Product, Quantity\nExample: John, Maize Flour, 50")
-                        return HttpResponse(str(response), content_type="application/xml")
-                        
+                    # Off the event loop: matching, and a catalog (re)load when
+                    # the file changed, are file IO and CPU work
+                    payloads, error = await sync_to_async(parse_order, thread_sensitive=False)(user_message, from_number)
                 except Exception as e:
                     print(f"❌ Order parsing error: {e}")
-                    response.message("❗Invalid format. Please send: Name, Product, Quantity\nExample: John, Maize Flour, 50")
-                
-                return HttpResponse(str(response), content_type="application/xml")
+                    payloads, error = None, "❗Invalid format. Please send: Name, Product, Quantity\nExample: John, Maize Flour, 50"
+
+                if error:
+                    # Let them correct the order a couple of times before dropping it
+                    session["attempts"] = session.get("attempts", 0) + 1
+                    if session["attempts"] >= MAX_ORDER_ATTEMPTS:
+                        await sessions.adelete(from_number)
+                    else:
+                        await sessions.aset(from_number, session)
+                    return twiml(error)
+
+                await sessions.adelete(from_number)
+                print(f"📦 Corrected Payload: {payloads}")
+
+                # Durable outbox: the background worker delivers it to Express
+                try:
+                    with timed("order.enqueue"):
+                        await sync_to_async(enqueue_orders)(payloads)
+                except Exception as e:
+                    print(f"❌ Could not queue order: {e!r}")
+                    return twiml("⚠️ We couldn't record your order. Please try again in a moment.")
+
+                return twiml(f"✅ Order received: {order_summary(payloads)}. We'll process it shortly.")
 
             # Start order process
             elif user_message.lower() == "order":
                 print("🛒 Starting order process")
-                user_sessions[from_number] = "ordering"
-                response.message("🛒 Please send your order as: Name, Product, Quantity\nExample: John, Maize Flour, 50")
-                return HttpResponse(str(response), content_type="application/xml")
+                await sessions.aset(from_number, {"state": "ordering", "attempts": 0})
+                return twiml("🛒 Please send your order as: Name, Product, Quantity\nExample: John, Maize Flour, 50")
 
             # === ORIGINAL CHATBOT LOGIC ===
             else:
-                answer = quey_vectorstore(user_message)
-                
-                # Append Order Option to the chatbot response
-                final_answer = f"{answer}\n\nIf you'd like to place an order, type ORDER."
-                
-                response.message(final_answer)
-                return HttpResponse(str(response), content_type="application/xml")
+                return await answer_question(user_message, from_number, to_number)
 
         except Exception as e:
             print(f"💥 ERROR: {str(e)}")
-            response = MessagingResponse()
-            response.message(f"⚠️ Internal Error: {str(e)}")
-            return HttpResponse(str(response), content_type="application/xml")
+            return twiml(f"⚠️ Internal Error: {str(e)}")
 
     return HttpResponse("Only POST requests allowed", status=405)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+async def chat_stream_view(request):
+    # Server-Sent Events: "token" events as Groq produces the answer, then "done".
+    # Only streams under ASGI (uvicorn/daphne project.asgi:application): under
+    # WSGI Django consumes the async iterator first and sends it all at once.
+    query = (request.GET.get("q") or request.POST.get("q") or "").strip()
+    if not query:
+        return JsonResponse({"error": "Missing q"}, status=400)
+
+    async def events():
+        try:
+            async for delta in astream_answer(query):
+                yield sse("token", {"text": delta})
+            yield sse("done", {})
+        except LLMBusy as e:
+            yield sse("error", {"error": str(e), "busy": True})
+        except Exception as e:
+            # Details stay in the log: the endpoint is public
+            print(f"❌ Stream for '{query}' failed: {e!r}")
+            yield sse("error", {"error": "Could not generate an answer, please try again"})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass events through unbuffered
+    return response
+
+
+def retriever_stats_view(request):
+    # Load time / index size of the resident FAISS index, for dashboards
+    return JsonResponse(retriever_service.stats())
+
+
+def answer_cache_stats_view(request):
+    # Hit/miss counters of the semantic answer cache
+    return JsonResponse(answer_cache.stats())
+
+
+def llm_stats_view(request):
+    # Groq concurrency limiter and request coalescing counters
+    return JsonResponse(llm_stats())
+
+
+@csrf_exempt
+def catalog_resolve_view(request):
+    # Bulk imports: POST {"items": ["maze flour", ...]} or one product per
+    # line of plain text -> canonical SKU + confidence for each
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests allowed"}, status=405)
+    catalog = get_catalog()
+    if catalog is None:
+        return JsonResponse({"error": "No product catalog configured"}, status=503)
+
+    if request.content_type == "application/json":
+        try:
+            items = json.loads(request.body or b"{}").get("items")
+        except (ValueError, AttributeError):
+            items = None
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            return JsonResponse({"error": "Expected {\"items\": [\"product\", ...]}"}, status=400)
+    else:
+        items = [line.strip() for line in request.body.decode("utf-8", "replace").splitlines() if line.strip()]
+
+    if len(items) > MAX_RESOLVE_BATCH:
+        return JsonResponse({"error": f"At most {MAX_RESOLVE_BATCH} items per request"}, status=413)
+    with timed("catalog.resolve"):
+        results = catalog.resolve_many(items)
+    return JsonResponse({"results": results, "resolved": sum(1 for r in results if r["sku"]), "count": len(results)})
+
+
+def admission_stats_view(request):
+    # Webhook load shedding: slots, queue depth, rejections, degraded replies
+    return JsonResponse(answer_admission.stats())
+
+
+def outbox_stats_view(request):
+    # Pending / sent / dead-letter order counts
+    return JsonResponse(outbox_stats())
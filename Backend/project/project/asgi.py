@@ -5,12 +5,26 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The WhatsApp webhook is an async view; serve it through this module
+(e.g. ``uvicorn project.asgi:application --workers 4``) so slow LLM and
+Express calls are awaited on the event loop instead of holding a worker
+thread, and so out-of-band follow-up replies keep running after the
+webhook has been acknowledged.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
+from .warmup import WARMUP_ON_START, warm_up
+from chatapp.apps import mark_serving
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# A server process: the apps start their background work (preload, outbox worker)
+mark_serving()
 
 application = get_asgi_application()
+
+if WARMUP_ON_START:
+    warm_up()
@@ -0,0 +1,262 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, HttpResponseForbidden
+from contextvars import ContextVar
+from bisect import bisect_left
+import functools
+import hmac
+import threading
+import time
+import os
+
+# METRICS_ENABLED=0 turns every timer into a no-op (one flag check per stage)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Add a Server-Timing header with the stages of each request
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+# /metrics needs "Authorization: Bearer <METRICS_TOKEN>"; with no token set it
+# is only served when METRICS_PUBLIC=1 (e.g. behind a private network)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+METRICS_PREFIX = "bookkeeping"
+
+# Seconds; the last bucket (+Inf) is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stages timed during the current request, for the Server-Timing header.
+# A plain list shared by reference, so stages recorded in sync_to_async
+# threads and spawned tasks of the same request end up in it too.
+_request_stages = ContextVar("request_stages", default=None)
+
+
+# === 1. Histograms ===
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # {(metric name, sorted label items): Histogram}, in-process only. Under
+    # several worker processes each /metrics scrape sees one process, which
+    # Prometheus aggregates like any other multi-instance target.
+    def __init__(self):
+        self._histograms = {}
+        self._help = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def collect(self, name, help_text, fn, kind="gauge"):
+        # Gauges / counters read at scrape time: fn() -> [(labels dict, value)]
+        self._help[name] = help_text
+        self._collectors[name] = (kind, fn)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        by_name = {}
+        for (name, labels), data in sorted(self.snapshot().items()):
+            by_name.setdefault(name, []).append((labels, data))
+
+        for name, series in by_name.items():
+            full = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} histogram")
+            for labels, (counts, total, count, buckets) in series:
+                base = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+                cumulative = 0
+                for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += n
+                    le = 'le="%s"' % (bound if bound == "+Inf" else repr(float(bound)))
+                    lines.append(f"{full}_bucket{{{join_labels(base, le)}}} {cumulative}")
+                lines.append(f"{full}_sum{{{base}}} {total}")
+                lines.append(f"{full}_count{{{base}}} {count}")
+
+        for name, (kind, fn) in sorted(self._collectors.items()):
+            full = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in fn():
+                base = ",".join(f'{k}="{escape(v)}"' for k, v in sorted(labels.items()))
+                lines.append(f"{full}{{{base}}} {value}" if base else f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def join_labels(*parts):
+    return ",".join(part for part in parts if part)
+
+
+registry = Registry()
+registry.describe("stage_seconds", "Time spent in each stage of request handling")
+registry.describe("http_request_seconds", "End-to-end request latency by view")
+
+
+# === 2. Timing API ===
+def record(stage, seconds):
+    registry.observe("stage_seconds", seconds, stage=stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+
+def replay(stages):
+    # Stages timed in another process (e.g. a render worker), recorded here
+    for stage, seconds in stages:
+        record(stage, seconds)
+
+
+class capture_stages:
+    # Collects the stages timed inside the block, so a worker process can
+    # send them back with its result instead of keeping them in its own
+    # registry, which nobody scrapes
+    def __enter__(self):
+        self.stages = []
+        self.token = _request_stages.set(self.stages)
+        return self.stages
+
+    def __exit__(self, *exc):
+        _request_stages.reset(self.token)
+        return False
+
+
+class timed:
+    # with timed("groq"): ...   or   @timed("analyze.fit")  (sync or async)
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            record(self.stage, time.perf_counter() - self.started)
+            self.started = None
+        return False
+
+    def __call__(self, func):
+        if not METRICS_ENABLED:
+            return func
+        stage = self.stage
+
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(stage, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - started)
+        return wrapper
+
+
+# === 3. Middleware + endpoint ===
+def server_timing(stages, total):
+    # Repeated stages (e.g. two embeddings) are summed into one entry
+    merged = {}
+    for stage, seconds in stages:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+        stages, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stages.reset(token)
+        return self.finish(request, response, stages, started)
+
+    async def __acall__(self, request):
+        if not METRICS_ENABLED:
+            return await self.get_response(request)
+        stages, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stages.reset(token)
+        return self.finish(request, response, stages, started)
+
+    def start(self):
+        stages = []
+        return stages, _request_stages.set(stages), time.perf_counter()
+
+    def finish(self, request, response, stages, started):
+        total = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        registry.observe("http_request_seconds", total, view=view, method=request.method,
+                         status=f"{response.status_code // 100}xx")
+        if SERVER_TIMING:
+            response["Server-Timing"] = server_timing(stages, total)
+        return response
+
+
+def metrics_allowed(request):
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        return hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode())
+    return METRICS_PUBLIC
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden("Metrics require a token")
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
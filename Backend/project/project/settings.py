@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "project.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -86,6 +88,40 @@ DATABASES = {
 }
 
 
+# WhatsApp chatbot conversation state
+# "cache": stored in CHAT_SESSION_CACHE, shared across worker processes
+# "memory": per-process LRU+TTL (single worker process only)
+
+CHAT_SESSION_BACKEND = os.getenv('CHAT_SESSION_BACKEND', 'cache')
+CHAT_SESSION_CACHE = os.getenv('CHAT_SESSION_CACHE', 'chat_sessions')
+CHAT_SESSION_TTL = int(os.getenv('CHAT_SESSION_TTL', '1800'))
+CHAT_SESSION_MAX_ENTRIES = int(os.getenv('CHAT_SESSION_MAX_ENTRIES', '10000'))
+CHAT_SESSION_SWEEP_SECONDS = 60
+
+
+# Caches
+# "shared" and "chat_sessions" are visible to every worker process; their
+# tables are created by `python manage.py migrate` (chatapp 0002/0003), or by
+# hand with createcachetable. Sessions get their own table so culling the
+# analysis/plot results never drops a conversation mid-order.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bookkeeping_cache',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    'chat_sessions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'chat_session_cache',
+        'OPTIONS': {'MAX_ENTRIES': CHAT_SESSION_MAX_ENTRIES},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,48 @@
+import time
+import os
+
+# WARMUP_ON_START=1: wsgi/asgi run warm_up() before the worker takes traffic,
+# so the first requests don't pay for imports, index loading and font caches.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "0") == "1"
+
+
+def warm_analytics():
+    import numpy as np
+    import pandas as pd
+    import scipy.stats  # prediction intervals
+    from app.utils import analyze_sales, render_predicted_week
+
+    df = pd.DataFrame({"date": pd.date_range("2024-01-01", periods=30), "units_sold": np.arange(30.0)})
+    analysis = analyze_sales(df)
+    render_predicted_week(analysis["future_dates"], analysis["predicted_future"], dpi=50)
+
+
+def warm_chatbot():
+    # Imported for their import cost only
+    import groq
+    import httpx
+    import twilio.twiml.messaging_response
+    from chatapp.chatbot.service import retriever_service
+
+    retriever_service.get()
+
+
+STEPS = {
+    "analytics": warm_analytics,
+    "chatbot": warm_chatbot,
+}
+
+
+def warm_up(steps=None):
+    # Returns {step: seconds}; a failing step is reported and skipped so a
+    # missing index never keeps a worker from starting
+    timings = {}
+    for name in steps or STEPS:
+        started = time.perf_counter()
+        try:
+            STEPS[name]()
+        except Exception as e:
+            print(f"⚠️ Warm-up step '{name}' failed: {e!r}")
+        timings[name] = time.perf_counter() - started
+    print(f"🔥 Warm-up done in {sum(timings.values()):.2f}s ({', '.join(f'{k} {v:.2f}s' for k, v in timings.items())})")
+    return timings
@@ -11,6 +11,14 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from .warmup import WARMUP_ON_START, warm_up
+from chatapp.apps import mark_serving
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# A server process: the apps start their background work (preload, outbox worker)
+mark_serving()
 
 application = get_wsgi_application()
+
+if WARMUP_ON_START:
+    warm_up()